@@ -7,9 +7,11 @@
 # rstring string - string - SPL rstring
 # rstring jsonString - json - JSON as SPL rstring
 # xml document - xml - XML document
-# blob binary - binary - Binary data
+# blob binary - binary - Binary data, passed to Python as a memoryview
+# uint64 __spl_pr - pyref - reference to a Python object in the same PE
 #
-# tuple<...> - dict - Any SPL tuple type apart from above
+# tuple<...> - dict - Any SPL tuple type apart from above,
+#                    passed to Python as a named tuple
 #
 # Not all are supported yet.
 # 
@@ -26,13 +28,14 @@ sub splpy_tuplestyle{
 
  if (($numattrs == 1) && SPL::CodeGen::Type::isBlob($attrtype) && ($attrname eq '__spl_po')) {
     $pystyle = 'pickle';
+ } elsif (($numattrs == 1) && SPL::CodeGen::Type::isUint64($attrtype) && ($attrname eq '__spl_pr')) {
+    $pystyle = 'pyref';
  } elsif (($numattrs == 1) && SPL::CodeGen::Type::isRString($attrtype) && ($attrname eq 'string')) {
     $pystyle = 'string';
  } elsif (($numattrs == 1) && SPL::CodeGen::Type::isRString($attrtype) && ($attrname eq 'jsonString')) {
     $pystyle = 'json';
  } elsif (($numattrs == 1) && SPL::CodeGen::Type::isBlob($attrtype) && ($attrname eq 'binary')) {
     $pystyle = 'binary';
-    SPL::CodeGen::errorln("Blob schema is not currently supported for Python."); 
  } elsif (($numattrs == 1) && SPL::CodeGen::Type::isXml($attrtype) && ($attrname eq 'document')) {
     $pystyle = 'xml';
     SPL::CodeGen::errorln("XML schema is not currently supported for Python."); 
@@ -57,6 +60,10 @@ sub splpy_inputtuple2value{
   return 'SPL::blob const & value = ip.get___spl_po();';
  }
 
+ if ($pystyle eq 'pyref') {
+  return 'SPL::uint64 const & value = ip.get___spl_pr();';
+ }
+
  if ($pystyle eq 'string') {
   return 'SPL::rstring const & value = ip.get_string();';
  }
@@ -65,6 +72,10 @@ sub splpy_inputtuple2value{
   return 'SPL::rstring const & value = ip.get_jsonString();';
  }
 
+ if ($pystyle eq 'binary') {
+  return 'SPL::blob const & value = ip.get_binary();';
+ }
+
  if ($pystyle eq 'dict') {
   # nothing done here for dict style 
  }
@@ -1,20 +1,74 @@
-sub convertAndAddToPythonDictionaryObject {
-  my $ituple = $_[0];
-  my $i = $_[1];
-  my $type = $_[2];
-  my $name = $_[3];
+#
+# Return C++ code that sets the attributes of the
+# output tuple $otuple from the Python object $pyvar
+# returned by a callable for a structured schema.
+# A tuple (including a named tuple) sets the attributes
+# by position and a dict by attribute name, attributes
+# not set by the Python object keep their default values.
+#
+sub splpy_pyobject2tuple {
+  my ($pyvar, $otuple, $port) = @_;
+  my $numattrs = $port->getNumberOfAttributes();
 
-  my $get = '{ PyObject * pyValue = ';
-  $get = $get . convertToPythonValue($ituple, $type, $name);
-
-  $getkey = '{ PyObject * pyDictKey = PyUnicode_DecodeUTF8((const char*)  "' . $name . '", ((int)(sizeof("' . $name . '")))-1 , NULL);'."\n";
+  my $code = "if (PyTuple_Check($pyvar)) {\n";
+  $code .= "  Py_ssize_t frs = PyTuple_GET_SIZE($pyvar);\n";
+  for (my $i = 0; $i < $numattrs; ++$i) {
+    my $attr = $port->getAttributeAt($i);
+    $code .= "  if ($i < frs) {\n";
+    $code .= "    PyObject * pyAttrValue = PyTuple_GET_ITEM($pyvar, $i);\n";
+    $code .= splpy_setattribute($otuple, $attr->getName(), $attr->getSPLType());
+    $code .= "  }\n";
+  }
+  $code .= "} else if (PyDict_Check($pyvar)) {\n";
+  for (my $i = 0; $i < $numattrs; ++$i) {
+    my $attr = $port->getAttributeAt($i);
+    my $name = $attr->getName();
+    $code .= "  {\n";
+    $code .= "    PyObject * pyAttrValue = PyDict_GetItemString($pyvar, \"$name\");\n";
+    $code .= "    if (pyAttrValue != NULL) {\n";
+    $code .= splpy_setattribute($otuple, $name, $attr->getSPLType());
+    $code .= "    }\n";
+    $code .= "  }\n";
+  }
+  $code .= "} else {\n";
+  $code .= "  PyErr_SetString(PyExc_TypeError, \"Callable must return a tuple or dict for a structured schema\");\n";
+  $code .= "}\n";
+  $code .= "if (PyErr_Occurred()) {\n";
+  $code .= "  streamsx::topology::Splpy::flush_PyErr_Print();\n";
+  $code .= "  throw;\n";
+  $code .= "}\n";
+  return $code;
+}
 
-# Note PyDict_SetItem does not steal the references to the key and value
-  my $setdict =  "  PyDict_SetItem(pyDict, pyDictKey, pyValue);\n";
-  $setdict =  $setdict . "  Py_DECREF(pyDictKey);\n";
-  $setdict =  $setdict . "  Py_DECREF(pyValue);}}\n";
+#
+# Return C++ code that sets attribute $name of
+# $otuple from the Python object pyAttrValue.
+#
+sub splpy_setattribute {
+  my ($otuple, $name, $type) = @_;
 
-  return $get . $getkey . $setdict ;
+  if (SPL::CodeGen::Type::isList($type)) {
+    my $element_type = SPL::CodeGen::Type::getElementType($type);
+    my $conv = pythonToCppPrimitiveConversion("PyList_GetItem(pyAttrValue, i)", $element_type);
+    return "    { SPL::list< $element_type > li(PyList_Size(pyAttrValue));\n" .
+           "      for (int i = 0; i < li.size(); i++)\n" .
+           "        li[i] = $conv;\n" .
+           "      $otuple.set_$name(li); }\n";
+  }
+  if (SPL::CodeGen::Type::isMap($type)) {
+    my $key_type = SPL::CodeGen::Type::getKeyType($type);
+    my $value_type = SPL::CodeGen::Type::getValueType($type);
+    my $kconv = pythonToCppPrimitiveConversion("k", $key_type);
+    my $vconv = pythonToCppPrimitiveConversion("v", $value_type);
+    return "    { SPL::map< $key_type, $value_type > ma;\n" .
+           "      PyObject *k,*v;\n" .
+           "      Py_ssize_t pos = 0;\n" .
+           "      while (PyDict_Next(pyAttrValue, &pos, &k, &v))\n" .
+           "        ma[$kconv] = $vconv;\n" .
+           "      $otuple.set_$name(ma); }\n";
+  }
+  my $conv = pythonToCppPrimitiveConversion("pyAttrValue", $type);
+  return "    $otuple.set_$name($conv);\n";
 }
 
 1;
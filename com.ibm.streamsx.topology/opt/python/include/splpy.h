@@ -19,6 +19,7 @@
 #include <stdio.h>
 #include <memory>
 #include <dlfcn.h>
+#include <time.h>
 
 #include <SPL/Runtime/Operator/Operator.h>
 #include <SPL/Runtime/Operator/OperatorContext.h>
@@ -32,17 +33,272 @@
 namespace streamsx {
   namespace topology {
 
+    /*
+    ** Return an operator's custom counter metric,
+    ** creating it if it does not exist.
+    */
+    inline SPL::Metric * counterMetric(SPL::OperatorMetrics & metrics,
+           const std::string & name, const std::string & description) {
+      if (metrics.hasCustomMetric(name))
+        return &metrics.getCustomMetricByName(name);
+      return &metrics.createCustomMetric(name, description, SPL::Metric::Counter);
+    }
+
+    /*
+    ** Optional instrumentation of the time operators
+    ** wait for and hold the GIL, enabled by the
+    ** gilMetrics operator parameter.
+    **
+    ** An operator creates an instance and installs it
+    ** as the current instance for its thread with a Scope
+    ** at the start of each of its process methods.
+    ** PyGILLock records the wait and hold time of the
+    ** outermost lock against the current instance.
+    **
+    ** The totals are the custom metrics nGILWaitNanos,
+    ** nGILHoldNanos and nGILAcquisitions, histograms of the
+    ** times are the custom metrics nGIL{Wait,Hold}Under{1us,
+    ** 10us,100us,1ms,10ms} and nGIL{Wait,Hold}Over10ms.
+    ** The values are also readable from Python using
+    ** streamsx.topology.runtime.gil_metrics().
+    */
+    class GILMetrics {
+      public:
+        static const int BUCKETS = 6;
+
+        // Must be called holding the GIL.
+        GILMetrics(SPL::OperatorContext & context) : name_(context.getName()) {
+          SPL::OperatorMetrics & metrics = context.getMetrics();
+          acquisitions_ = counterMetric(metrics, "nGILAcquisitions",
+              "Number of times the operator acquired the GIL.");
+          wait_ = counterMetric(metrics, "nGILWaitNanos",
+              "Total time in nanoseconds the operator waited to acquire the GIL.");
+          hold_ = counterMetric(metrics, "nGILHoldNanos",
+              "Total time in nanoseconds the operator held the GIL.");
+          const char * bucketNames[BUCKETS] = {
+              "Under1us", "Under10us", "Under100us", "Under1ms", "Under10ms", "Over10ms"};
+          for (int i = 0; i < BUCKETS; i++) {
+              std::string suffix(bucketNames[i]);
+              waitBuckets_[i] = counterMetric(metrics, "nGILWait" + suffix,
+                  "Number of GIL acquisitions with a wait time " + suffix + ".");
+              holdBuckets_[i] = counterMetric(metrics, "nGILHold" + suffix,
+                  "Number of GIL acquisitions with a hold time " + suffix + ".");
+          }
+          registerPython();
+        }
+
+        // Must be called holding the GIL.
+        ~GILMetrics() {
+          PyObject * registry = pyRegistry();
+          if (registry != NULL) {
+            if (PyDict_DelItemString(registry, name_.c_str()) != 0)
+              PyErr_Clear();
+            Py_DECREF(registry);
+          }
+        }
+
+        void record(int64_t waitNanos, int64_t holdNanos) {
+          acquisitions_->incrementValueNoLock();
+          wait_->incrementValueNoLock(waitNanos);
+          hold_->incrementValueNoLock(holdNanos);
+          waitBuckets_[bucket(waitNanos)]->incrementValueNoLock();
+          holdBuckets_[bucket(holdNanos)]->incrementValueNoLock();
+        }
+
+        // Metrics of the operator executing on this thread, NULL if none.
+        static GILMetrics *& current() {
+          static __thread GILMetrics * current_ = NULL;
+          return current_;
+        }
+
+        // Sets the current instance for the lifetime of the scope,
+        // restoring the previous instance on exit so that
+        // operators fused on the same thread are distinguished.
+        class Scope {
+          public:
+            Scope(GILMetrics * metrics) : previous_(current()) {
+              current() = metrics;
+            }
+            ~Scope() {
+              current() = previous_;
+            }
+          private:
+            GILMetrics * previous_;
+        };
+
+        static int64_t nanos() {
+          struct timespec ts;
+          clock_gettime(CLOCK_MONOTONIC, &ts);
+          return ((int64_t) ts.tv_sec) * 1000000000LL + ts.tv_nsec;
+        }
+
+      private:
+        static int bucket(int64_t nanos) {
+          int b = 0;
+          for (int64_t limit = 1000; b < BUCKETS - 1 && nanos >= limit; limit *= 10)
+            b++;
+          return b;
+        }
+
+        static PyObject * pyRegistry() {
+          PyObject * runtime = PyImport_ImportModule("streamsx.topology.runtime");
+          if (runtime == NULL) {
+            PyErr_Clear();
+            return NULL;
+          }
+          PyObject * registry = PyObject_GetAttrString(runtime, "_gil_metrics");
+          Py_DECREF(runtime);
+          if (registry == NULL)
+            PyErr_Clear();
+          return registry;
+        }
+
+        // Register a function returning the values in
+        // streamsx.topology.runtime._gil_metrics
+        void registerPython() {
+          static PyMethodDef valuesDef = {"gil_metrics",
+             (PyCFunction) pyValues, METH_NOARGS, "GIL metrics of an operator"};
+          PyObject * registry = pyRegistry();
+          if (registry == NULL)
+            return;
+          PyObject * self = PyCapsule_New(this, NULL, NULL);
+          PyObject * values = PyCFunction_NewEx(&valuesDef, self, NULL);
+          Py_DECREF(self);
+          if (values == NULL || PyDict_SetItemString(registry, name_.c_str(), values) != 0)
+            PyErr_Clear();
+          Py_XDECREF(values);
+          Py_DECREF(registry);
+        }
+
+        static PyObject * pyValues(PyObject * self, PyObject * unused) {
+          GILMetrics * m = static_cast<GILMetrics *>(PyCapsule_GetPointer(self, NULL));
+          PyObject * waitHist = PyList_New(BUCKETS);
+          PyObject * holdHist = PyList_New(BUCKETS);
+          for (int i = 0; i < BUCKETS; i++) {
+            PyList_SetItem(waitHist, i, PyLong_FromLongLong(m->waitBuckets_[i]->getValueNoLock()));
+            PyList_SetItem(holdHist, i, PyLong_FromLongLong(m->holdBuckets_[i]->getValueNoLock()));
+          }
+          return Py_BuildValue("{s:L,s:L,s:L,s:N,s:N}",
+             "acquisitions", (long long) m->acquisitions_->getValueNoLock(),
+             "waitNanos", (long long) m->wait_->getValueNoLock(),
+             "holdNanos", (long long) m->hold_->getValueNoLock(),
+             "waitHistogram", waitHist,
+             "holdHistogram", holdHist);
+        }
+
+        std::string name_;
+        SPL::Metric * acquisitions_;
+        SPL::Metric * wait_;
+        SPL::Metric * hold_;
+        SPL::Metric * waitBuckets_[BUCKETS];
+        SPL::Metric * holdBuckets_[BUCKETS];
+    };
+
+    /*
+    ** Optional Python execution metrics, enabled
+    ** by the pythonMetrics operator parameter.
+    **
+    ** The values are accumulated in a Python list by the
+    ** operator's metered wrapper function, see _metered_wrapper
+    ** in streamsx.topology.runtime. An operator installs its
+    ** instance as the current instance for its thread with
+    ** a Scope at the start of each of its process methods,
+    ** and PyGILLock copies the values to the operator's custom
+    ** metrics before it releases the outermost lock.
+    */
+    class PythonMetrics {
+      public:
+        static const int COUNT = 8;
+
+        // Must be called holding the GIL.
+        PythonMetrics(SPL::OperatorContext & context, PyObject * values) : values_(values) {
+          Py_INCREF(values_);
+          SPL::OperatorMetrics & metrics = context.getMetrics();
+          const char * names[COUNT][2] = {
+            {"nPyCalls", "Number of calls to the Python callable."},
+            {"nPyCallNanos", "Total time in nanoseconds spent in the Python callable."},
+            {"nPyDeserializeNanos", "Total time in nanoseconds spent deserializing Python objects."},
+            {"nPySerializeNanos", "Total time in nanoseconds spent serializing Python objects."},
+            {"nPyInputBytes", "Total size in bytes of the serialized Python objects deserialized."},
+            {"nPyOutputBytes", "Total size in bytes of the serialized Python objects produced."},
+            {"nPyDropped", "Number of tuples dropped as the callable returned None, or false for a filter."},
+            {"nPyCpuNanos", "Total thread CPU time in nanoseconds of the calls."}};
+          for (int i = 0; i < COUNT; i++)
+            metrics_[i] = counterMetric(metrics, names[i][0], names[i][1]);
+        }
+
+        // Must be called holding the GIL.
+        ~PythonMetrics() {
+          Py_DECREF(values_);
+        }
+
+        // Must be called holding the GIL.
+        void update() {
+          for (int i = 0; i < COUNT; i++)
+            metrics_[i]->setValueNoLock(PyLong_AsLongLong(PyList_GetItem(values_, i)));
+        }
+
+        // Metrics of the operator executing on this thread, NULL if none.
+        static PythonMetrics *& current() {
+          static __thread PythonMetrics * current_ = NULL;
+          return current_;
+        }
+
+        class Scope {
+          public:
+            Scope(PythonMetrics * metrics) : previous_(current()) {
+              current() = metrics;
+            }
+            ~Scope() {
+              current() = previous_;
+            }
+          private:
+            PythonMetrics * previous_;
+        };
+
+      private:
+        PyObject * values_;
+        SPL::Metric * metrics_[COUNT];
+    };
+
     class PyGILLock {
       public:
-        PyGILLock() {
-          gstate_ = PyGILState_Ensure();
+        PyGILLock() : outermost_(depth()++ == 0),
+                      metrics_(outermost_ ? GILMetrics::current() : NULL) {
+          if (metrics_ != NULL) {
+            int64_t start = GILMetrics::nanos();
+            gstate_ = PyGILState_Ensure();
+            acquired_ = GILMetrics::nanos();
+            wait_ = acquired_ - start;
+          } else {
+            gstate_ = PyGILState_Ensure();
+          }
         }
         ~PyGILLock() {
+          if (outermost_ && PythonMetrics::current() != NULL)
+            PythonMetrics::current()->update();
+          if (metrics_ != NULL) {
+            // Recorded while the GIL is held as the
+            // metrics are shared by the operator's threads.
+            metrics_->record(wait_, GILMetrics::nanos() - acquired_);
+          }
           PyGILState_Release(gstate_);
+          depth()--;
         }
         
       private:
+        // Number of locks held by this thread, only
+        // the outermost lock records GIL metrics.
+        static int & depth() {
+          static __thread int depth_ = 0;
+          return depth_;
+        }
+
+        bool outermost_;
+        GILMetrics * metrics_;
         PyGILState_STATE gstate_;
+        int64_t acquired_;
+        int64_t wait_;
     };
 
     /*
@@ -52,15 +308,64 @@ namespace streamsx {
     template <class T>
     inline void pyAttributeFromPyObject(T & attr, PyObject *);
     
+    /*
+    ** Convert to a SPL blob from a Python list of
+    ** bytes-like objects (frames) by copying each
+    ** frame directly into memory adopted by the blob.
+    ** Used by codecs that serialize large buffers
+    ** out-of-band to avoid copying them into a bytes object.
+    */
+    inline void pyAttributeFromPyFrames(SPL::blob & attr, PyObject * frames) {
+      Py_ssize_t count = PyList_Size(frames);
+      Py_buffer * views = new Py_buffer[count];
+      uint64_t size = 0;
+      Py_ssize_t i;
+      for (i = 0; i < count; i++) {
+         if (PyObject_GetBuffer(PyList_GET_ITEM(frames, i), &views[i], PyBUF_C_CONTIGUOUS) != 0) {
+            break;
+         }
+         size += views[i].len;
+      }
+      if (i == count) {
+         unsigned char * data = new unsigned char[size == 0 ? 1 : size];
+         unsigned char * pos = data;
+         for (Py_ssize_t j = 0; j < count; j++) {
+            memcpy(pos, views[j].buf, views[j].len);
+            pos += views[j].len;
+         }
+         attr.adoptData(data, size);
+      }
+      for (Py_ssize_t j = 0; j < i; j++)
+         PyBuffer_Release(&views[j]);
+      delete[] views;
+      if (i != count) {
+         SPLAPPTRC(L_ERROR, "Python frame does not support the buffer protocol!", "python");
+         throw;
+      }
+    }
+
     /*
     ** Convert to a SPL blob from a Python bytes object.
     */
     inline void pyAttributeFromPyObject(SPL::blob & attr, PyObject * value) {
+      if (PyList_Check(value)) {
+         pyAttributeFromPyFrames(attr, value);
+         return;
+      }
       long int size = PyBytes_Size(value);
       char * bytes = PyBytes_AsString(value);          
       attr.setData((const unsigned char *)bytes, size);
     }
 
+    /*
+    ** Convert to a SPL uint64 from a Python int object.
+    ** Used for references to Python objects passed between
+    ** operators in the same PE.
+    */
+    inline void pyAttributeFromPyObject(SPL::uint64 & attr, PyObject * value) {
+      attr = (SPL::uint64) PyLong_AsUnsignedLongLong(value);
+    }
+
     /*
     ** Convert to a SPL rstring from a Python string object.
     */
@@ -128,6 +433,21 @@ namespace streamsx {
     inline PyObject * pyAttributeToPyObject(const SPL::float64 & attr) {
        return PyFloat_FromDouble(attr);
     }
+    inline PyObject * pyAttributeToPyObject(const SPL::uint64 & attr) {
+       return PyLong_FromUnsignedLongLong(attr);
+    }
+
+    /**
+     * Return a new reference to a Python string for
+     * a C string, or to None if value is NULL.
+     */
+    inline PyObject * pyStringOrNone(const char * value) {
+      if (value == NULL) {
+         Py_INCREF(Py_None);
+         return Py_None;
+      }
+      return PyUnicode_DecodeUTF8(value, strlen(value), NULL);
+    }
 
     /**
      * Convert a PyObject to a PyObject by simply returning the value
@@ -348,6 +668,27 @@ namespace streamsx {
       return 1;
     }
 
+    /*
+    * Call a function passing the SPL attribute value of type T
+    * and return its result, NULL if the function returned None.
+    * The caller must hold the GIL and own the returned reference.
+    */
+    template <class T>
+    static PyObject * pyTupleCall(PyObject * function, T & splVal) {
+      PyObject * arg = pyAttributeToPyObject(splVal);
+
+      PyObject * pyReturnVar = pyTupleFunc(function, arg);
+
+      if (pyReturnVar == Py_None){
+        Py_DECREF(pyReturnVar);
+        return NULL;
+      } else if(pyReturnVar == 0){
+        flush_PyErr_Print();
+        throw;
+      }
+      return pyReturnVar;
+    }
+
     // Python hash of an SPL attribute
     template <class T>
     static SPL::int32 pyTupleHash(PyObject * function, T & splVal) {
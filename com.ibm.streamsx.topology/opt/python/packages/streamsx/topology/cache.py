@@ -0,0 +1,175 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+"""
+Cache of compiled application bundles, used by the BUNDLE and
+STANDALONE contexts when the topology.bundleCache setting is
+given, see streamsx.topology.context.submit.
+
+Bundles are keyed by a fingerprint of everything that determines
+the compiled bundle: the topology's JSON graph, the contents of the
+Python modules and packages it includes, the version of this toolkit,
+the Streams install and the submission's configuration. Submitting
+a topology whose fingerprint matches a cached bundle uses that bundle
+without generating SPL or compiling.
+
+The least recently used bundles are removed once the cache
+exceeds its maximum size.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Deployment configuration keys
+BUNDLE_CACHE = "topology.bundleCache"
+BUNDLE_CACHE_SIZE = "topology.bundleCacheSize"
+
+# Default maximum size in bytes of the cached bundles
+_CACHE_SIZE = 1024 * 1024 * 1024
+
+_SUFFIX = ".sab"
+
+def _toolkit_root():
+    # This is tk/opt/python/packages/streamsx/topology
+    tk_root = os.path.dirname(os.path.abspath(__file__))
+    for i in range(5):
+        tk_root = os.path.dirname(tk_root)
+    return tk_root
+
+def _hash_file(md, path):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            md.update(block)
+
+def _hash_include(md, source):
+    """
+    Adds the contents of an included file, or every file
+    within an included directory, to the fingerprint.
+    """
+    md.update(source.encode("utf-8"))
+    if os.path.isfile(source):
+        _hash_file(md, source)
+        return
+    for root, dirs, files in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            md.update(os.path.relpath(path, source).encode("utf-8"))
+            _hash_file(md, path)
+
+def _hash_toolkit(md):
+    """
+    Adds the version of this toolkit, and for development
+    builds the identity of its jar, to the fingerprint.
+    """
+    tk_root = _toolkit_root()
+    info = os.path.join(tk_root, "info.xml")
+    if os.path.isfile(info):
+        _hash_file(md, info)
+    jar = os.path.join(tk_root, "lib", "com.ibm.streamsx.topology.jar")
+    if os.path.isfile(jar):
+        st = os.stat(jar)
+        md.update("{0}:{1}".format(st.st_size, st.st_mtime_ns).encode("utf-8"))
+
+def fingerprint(ctxtype, fj):
+    """
+    Returns the fingerprint of a submission.
+
+    Args:
+        ctxtype(str): Context type, BUNDLE or STANDALONE.
+        fj(dict): Full JSON of the submission, containing its deploy configuration and graph.
+    Returns:
+        str: Hexadecimal digest identifying the compiled bundle.
+    """
+    md = hashlib.sha256()
+    md.update(ctxtype.encode("utf-8"))
+    deploy = {k: v for k, v in fj["deploy"].items()
+        if k not in (BUNDLE_CACHE, BUNDLE_CACHE_SIZE)}
+    md.update(json.dumps(deploy, sort_keys=True, default=str).encode("utf-8"))
+    graph = fj["graph"]
+    md.update(json.dumps(graph, sort_keys=True).encode("utf-8"))
+    for include in graph.get("config", {}).get("includes", []):
+        _hash_include(md, include["source"])
+    _hash_toolkit(md)
+    md.update(os.environ.get("STREAMS_INSTALL", "").encode("utf-8"))
+    return md.hexdigest()
+
+class BundleCache(object):
+    """
+    Directory of compiled bundles keyed by their fingerprint.
+
+    Args:
+        directory(str): Cache directory, created if it does not exist.
+        max_size(int): Maximum total size in bytes of the cached bundles.
+    """
+    def __init__(self, directory, max_size=_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key):
+        """
+        Returns the path of the cached bundle for key, or None
+        if it is not cached. The bundle becomes the most recently used.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, bundle):
+        """
+        Adds a copy of the bundle to the cache as key, then removes the least
+        recently used bundles while the cache exceeds its maximum size.
+        Returns the path of the cached bundle.
+        """
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            shutil.copyfile(bundle, tmp)
+            path = self._path(key)
+            os.replace(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+        self._evict()
+        return path
+
+    def _evict(self):
+        bundles = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            bundles.append((st.st_mtime, st.st_size, name))
+        bundles.sort()
+        total = sum(size for mtime, size, name in bundles)
+        # Always keep the most recently used bundle
+        for mtime, size, name in bundles[:-1]:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def from_config(config):
+    """
+    Returns the BundleCache configured by config,
+    or None if bundle caching is not enabled.
+    """
+    directory = config.get(BUNDLE_CACHE)
+    if not directory:
+        return None
+    return BundleCache(directory, int(config.get(BUNDLE_CACHE_SIZE, _CACHE_SIZE)))
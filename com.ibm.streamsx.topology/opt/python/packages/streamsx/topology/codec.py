@@ -0,0 +1,559 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+"""
+Codecs that serialize Python objects on streams
+with schema CommonSchema.Python.
+
+A codec is an object with two methods:
+
+* dumps(obj) - returns the serialized form of obj as bytes.
+* loads(buffer) - returns the object deserialized from buffer,
+  a bytes-like object. buffer is typically a memoryview over
+  the SPL tuple's blob, so loads must not retain a reference to it
+  unless the codec documents otherwise.
+
+dumps may instead return a list of bytes-like objects (frames), the
+serialized form is their concatenation. The frames are copied directly
+into the SPL tuple's blob, avoiding an intermediate bytes object.
+
+A codec may be specified for a stream either by the name of a
+built-in codec or by an instance of a class defined at the top
+level of a module that implements the two methods and is picklable.
+
+Built-in codecs:
+
+* pickle - pickle.dumps with the default protocol. This is the
+  default and the only codec that may be used to publish streams.
+* pickle_highest - pickle with the highest protocol supported by
+  the Python runtime, reusing a Pickler per thread.
+* marshal - marshal, limited to builtin types such as dict, list,
+  str, int and float, but faster than pickle.
+* msgpack - MessagePack, requires the msgpack package is installed.
+* pickle5 - pickle protocol 5 with out-of-band buffers, large
+  buffers such as NumPy arrays are not copied when serialized
+  or deserialized, see PickleOutOfBandCodec.
+* columnar - columnar batches, a dict of equal length NumPy
+  arrays, see ColumnarCodec. Requires NumPy.
+
+Any codec may be wrapped by CompressedCodec to compress serialized
+values above a size threshold. Compressed pickled values are
+themselves pickles that decompress the value when unpickled, so the
+pickle codec reads them transparently and compressed pickled streams
+may be published. Values of other codecs start with a flag byte
+identifying their compression.
+"""
+import base64
+import importlib
+import io
+import json
+import marshal
+import pickle
+import struct
+import threading
+import zlib
+
+__all__ = ['PickleCodec', 'PickleHighestCodec', 'MarshalCodec', 'MsgpackCodec', 'PickleOutOfBandCodec', 'CompressedCodec', 'ColumnarCodec']
+
+# Flag bytes starting a value serialized by CompressedCodec
+# with a codec other than pickle, identifying its compression.
+_RAW_MARKER = 0x00
+_ZLIB_MARKER = 0x01
+_LZ4_MARKER = 0x02
+
+def _lz4():
+    import lz4.frame
+    return lz4.frame
+
+def _decompress(marker, data):
+    """
+    Returns the decompressed form of data
+    compressed as identified by marker.
+    """
+    if marker == _ZLIB_MARKER:
+        return zlib.decompress(data)
+    if marker == _LZ4_MARKER:
+        return _lz4().decompress(data)
+    raise ValueError("Unknown compression marker: " + str(marker))
+
+def _decompress_loads(marker, data):
+    """
+    Returns the object from a compressed pickled value,
+    called when a value pickled by CompressedCodec is unpickled.
+    """
+    return pickle.loads(_decompress(marker, data))
+
+class _CompressedPickle(object):
+    """
+    Compressed pickled value, that is unpickled
+    as the object it was pickled from.
+    """
+    def __init__(self, marker, data):
+        self.marker = marker
+        self.data = data
+
+    def __reduce__(self):
+        return (_decompress_loads, (self.marker, self.data))
+
+class PickleCodec(object):
+    """
+    Codec using pickle with the default protocol.
+    """
+    def dumps(self, obj):
+        return pickle.dumps(obj)
+
+    def loads(self, buffer):
+        return pickle.loads(buffer)
+
+class PickleHighestCodec(object):
+    """
+    Codec using pickle with pickle.HIGHEST_PROTOCOL. A Pickler and
+    its buffer are reused for each call from the same thread.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def dumps(self, obj):
+        local = self._local
+        try:
+            buf = local.buf
+            pickler = local.pickler
+        except AttributeError:
+            buf = local.buf = io.BytesIO()
+            pickler = local.pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        buf.seek(0)
+        buf.truncate()
+        pickler.clear_memo()
+        pickler.dump(obj)
+        return buf.getvalue()
+
+    def loads(self, buffer):
+        return pickle.loads(buffer)
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self._local = threading.local()
+
+class MarshalCodec(object):
+    """
+    Codec using marshal, only supports builtin types.
+    """
+    def dumps(self, obj):
+        return marshal.dumps(obj)
+
+    def loads(self, buffer):
+        return marshal.loads(buffer)
+
+class MsgpackCodec(object):
+    """
+    Codec using MessagePack, requires the msgpack package.
+    """
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, buffer):
+        return self._msgpack.unpackb(buffer, raw=False)
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+def _pickle5():
+    """
+    Returns a pickle module supporting protocol 5, either
+    pickle itself (Python 3.8+) or the pickle5 backport.
+    """
+    if pickle.HIGHEST_PROTOCOL >= 5:
+        return pickle
+    import pickle5
+    return pickle5
+
+# Serialized form with out-of-band buffers:
+#   magic (4 bytes), buffer count n (uint32),
+#   length of the pickle data (uint64),
+#   length of each of the n buffers (n * uint64)
+# followed by the pickle data and then each buffer,
+# each starting at an offset that is a multiple of 8.
+# The first byte of pickle data is always 0x80 so the
+# magic distinguishes the two forms.
+_OOB_MAGIC = b'\x00PB5'
+_OOB_ALIGN = 8
+
+def _oob_padding(length):
+    return -length % _OOB_ALIGN
+
+class PickleOutOfBandCodec(object):
+    """
+    Codec using pickle protocol 5 with out-of-band buffers.
+
+    Objects supporting out-of-band pickling, such as contiguous NumPy
+    arrays, have their buffers written directly into the SPL blob
+    rather than being copied into the pickle data, and are
+    reconstructed over a memoryview of the blob without copying.
+
+    With zero-copy input the reconstructed objects refer to the
+    input tuple's memory, which is only valid during the call
+    to the callable processing the tuple. Such objects are read-only
+    and must not be retained by the callable, for example in a
+    stateful callable's instance; set `copy_input` to True if
+    input objects need to be retained.
+
+    Requires Python 3.8 or the pickle5 package.
+
+    Args:
+        copy_input: True to copy the serialized form before
+            deserializing it, so that input objects may be retained.
+    """
+    def __init__(self, copy_input=False):
+        self.copy_input = copy_input
+        self._pickle = _pickle5()
+
+    @property
+    def retains_input(self):
+        """True if objects returned by loads refer to its input."""
+        return not self.copy_input
+
+    def dumps(self, obj):
+        buffers = []
+        data = self._pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        if not buffers:
+            return data
+        raws = [b.raw() for b in buffers]
+        header = struct.pack('<4sIQ', _OOB_MAGIC, len(raws), len(data))
+        header += struct.pack('<%dQ' % len(raws), *[r.nbytes for r in raws])
+        frames = [header, bytes(_oob_padding(len(header))), data]
+        for raw in raws:
+            frames.append(bytes(_oob_padding(len(data))))
+            frames.append(raw)
+            data = raw
+        return frames
+
+    def loads(self, buffer):
+        view = memoryview(buffer)
+        if self.copy_input:
+            view = memoryview(view.tobytes())
+        if view.nbytes < 4 or view[:4] != _OOB_MAGIC:
+            return self._pickle.loads(view)
+        count, length = struct.unpack_from('<IQ', view, 4)
+        lengths = struct.unpack_from('<%dQ' % count, view, 16)
+        offset = 16 + 8 * count
+        offset += _oob_padding(offset)
+        data = view[offset:offset+length]
+        offset += length
+        buffers = []
+        for blen in lengths:
+            offset += _oob_padding(offset)
+            buffers.append(view[offset:offset+blen])
+            offset += blen
+        return self._pickle.loads(data, buffers=buffers)
+
+    def __getstate__(self):
+        return {'copy_input': self.copy_input}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+# Serialized form of a columnar batch:
+#   magic (4 bytes), length of the metadata (uint32),
+#   metadata as UTF-8 JSON, a list of [name, dtype, offset, shape]
+#   for each column with offset relative to the start of the data,
+# followed by padding to a multiple of 8 bytes and then the data
+# of each column, each starting at an offset that is a multiple of 8.
+_COLUMNAR_MAGIC = b'\x00COL'
+
+def _numpy():
+    import numpy
+    return numpy
+
+def _is_table(value):
+    """
+    Returns True if value can be converted to a columnar batch.
+    """
+    if isinstance(value, dict):
+        return True
+    if hasattr(value, 'dtype'):
+        return getattr(value.dtype, 'names', None) is not None
+    return hasattr(value, 'columns') and hasattr(value, 'to_numpy')
+
+def _columns(value):
+    """
+    Returns the columns of a columnar batch as an ordered list
+    of (name, array) tuples, from a dict of array-likes, a
+    NumPy structured (record) array or a pandas DataFrame.
+    """
+    np = _numpy()
+    if isinstance(value, dict):
+        columns = [(str(k), np.asarray(v)) for k, v in value.items()]
+    elif isinstance(value, np.ndarray) and value.dtype.names is not None:
+        columns = [(name, value[name]) for name in value.dtype.names]
+    elif hasattr(value, 'columns') and hasattr(value, 'to_numpy'):
+        columns = [(str(c), value[c].to_numpy()) for c in value.columns]
+    else:
+        raise TypeError("Columnar batch must be a dict of arrays, a record array or a DataFrame: " + str(type(value)))
+    rows = set(len(col) for _, col in columns)
+    if len(rows) > 1:
+        raise ValueError("Columns of a columnar batch must have equal lengths: " + str(sorted(rows)))
+    return columns
+
+class ColumnarCodec(object):
+    """
+    Codec for columnar batches, each value is a batch of rows
+    represented as a dict of equal length NumPy arrays keyed
+    by column name.
+
+    dumps accepts a dict of array-likes, a NumPy structured (record)
+    array or a pandas DataFrame. The column data is written directly
+    into the SPL blob after a small header describing the
+    name, dtype and offset of each column.
+
+    loads returns a dict of read-only arrays over the input buffer
+    without copying, so the arrays are only valid during the call to
+    the callable processing the tuple, see PickleOutOfBandCodec.
+    Columns of Python objects (dtype object) are not supported.
+
+    Requires NumPy.
+    """
+    def __init__(self):
+        self._np = _numpy()
+
+    # Objects returned by loads refer to its input.
+    retains_input = True
+
+    def dumps(self, obj):
+        columns = [(name, self._np.ascontiguousarray(col)) for name, col in _columns(obj)]
+        meta = []
+        offset = 0
+        for name, col in columns:
+            if col.dtype.hasobject:
+                raise TypeError("Column of Python objects is not supported: " + name)
+            offset += _oob_padding(offset)
+            meta.append([name, col.dtype.str, offset, col.shape])
+            offset += col.nbytes
+        mjson = json.dumps(meta).encode('utf-8')
+        frames = [struct.pack('<4sI', _COLUMNAR_MAGIC, len(mjson)), mjson,
+            bytes(_oob_padding(8 + len(mjson)))]
+        length = 0
+        for (name, col), m in zip(columns, meta):
+            if m[2] > length:
+                frames.append(bytes(m[2] - length))
+            if col.nbytes:
+                frames.append(memoryview(col.reshape(-1)).cast('B'))
+            length = m[2] + col.nbytes
+        return frames
+
+    def loads(self, buffer):
+        view = memoryview(buffer)
+        if view[:4] != _COLUMNAR_MAGIC:
+            raise ValueError("Value is not a columnar batch")
+        mlen, = struct.unpack_from('<I', view, 4)
+        meta = json.loads(view[8:8+mlen].tobytes().decode('utf-8'))
+        base = 8 + mlen + _oob_padding(8 + mlen)
+        batch = {}
+        for name, dtype, offset, shape in meta:
+            dtype = self._np.dtype(dtype)
+            count = 1
+            for d in shape:
+                count *= d
+            col = self._np.frombuffer(view, dtype=dtype, count=count, offset=base+offset)
+            batch[name] = col.reshape(shape)
+        return batch
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+def _is_columnar_param(param):
+    """
+    Returns True if the codec represented by param
+    serializes columnar batches.
+    """
+    if param is None:
+        return False
+    if param == 'columnar':
+        return True
+    compression = param.split(':', 2)
+    return len(compression) == 3 and _is_columnar_param(compression[2])
+
+def _join_frames(value):
+    """
+    Returns the serialized form from the return of a
+    codec's dumps as a single bytes-like object.
+    """
+    if isinstance(value, list):
+        return b''.join(value)
+    return value
+
+def _retained_loads(codec):
+    """
+    Returns a loads function for objects that are
+    retained beyond the processing of the input tuple.
+    The input is copied for codecs that deserialize
+    without copying, so objects do not refer to the tuple's memory.
+    """
+    if not getattr(codec, 'retains_input', False):
+        return codec.loads
+    def _loads(buffer):
+        return codec.loads(bytes(buffer))
+    return _loads
+
+class CompressedCodec(object):
+    """
+    Codec that compresses the values serialized by another codec.
+
+    Values whose serialized form is at least `threshold` bytes are
+    compressed, smaller values are left uncompressed as compressing
+    them costs more than is saved. A compressed pickled value is
+    pickled as a call that decompresses it, so the pickle codec
+    can read it. Values of other codecs are prefixed with a flag
+    byte identifying their compression.
+
+    Args:
+        compression: 'zlib' or 'lz4', lz4 requires the lz4 package.
+        threshold: Minimum size in bytes of a serialized value that
+            is compressed, defaults to 1024.
+        codec: Codec whose values are compressed, defaults to None,
+            meaning pickle.
+    Raises:
+        ValueError: if `compression` is not supported or
+            `threshold` is negative.
+    """
+    def __init__(self, compression='zlib', threshold=1024, codec=None):
+        self._setup(compression, threshold, _codec_param(codec))
+
+    def _setup(self, compression, threshold, param):
+        if compression == 'zlib':
+            self._marker = _ZLIB_MARKER
+            self._compress = zlib.compress
+        elif compression == 'lz4':
+            self._marker = _LZ4_MARKER
+            self._compress = _lz4().compress
+        else:
+            raise ValueError("Unknown compression: " + str(compression))
+        if threshold < 0:
+            raise ValueError("Compression threshold must not be negative: " + str(threshold))
+        self.compression = compression
+        self.threshold = int(threshold)
+        self._param = param
+        self._codec = _get_codec(param)
+        # Compressed pickled values are pickles, values
+        # of other codecs are prefixed with a flag byte.
+        self._pickled = isinstance(self._codec, (PickleCodec, PickleHighestCodec))
+
+    def dumps(self, obj):
+        value = self._codec.dumps(obj)
+        frames = value if isinstance(value, list) else [value]
+        if sum(memoryview(f).nbytes for f in frames) < self.threshold:
+            if self._pickled:
+                return value
+            return [bytes([_RAW_MARKER])] + frames
+        data = self._compress(_join_frames(value))
+        if self._pickled:
+            return pickle.dumps(_CompressedPickle(self._marker, data))
+        return [bytes([self._marker]), data]
+
+    def loads(self, buffer):
+        if self._pickled:
+            return pickle.loads(buffer)
+        buffer = memoryview(buffer)
+        marker = buffer[0]
+        if marker == _RAW_MARKER:
+            return self._codec.loads(buffer[1:])
+        return self._codec.loads(_decompress(marker, buffer[1:]))
+
+    def _codec_param(self):
+        return _compressed_param(self.compression, self.threshold, self._param)
+
+    def __getstate__(self):
+        return {'param': self._codec_param()}
+
+    def __setstate__(self, state):
+        compression, threshold, param = state['param'].split(':', 2)
+        self._setup(compression, int(threshold), param or None)
+
+def _compressed_param(compression, threshold, param):
+    """
+    Returns the parameter value of a CompressedCodec
+    compressing values serialized by the codec represented by param.
+    """
+    return ':'.join([compression, str(threshold), param or ''])
+
+def _is_pickle_param(param):
+    """
+    Returns True if values serialized using the codec represented
+    by param may be deserialized by the default pickle codec.
+    """
+    if param is None:
+        return True
+    compression = param.split(':', 2)
+    return len(compression) == 3 and not compression[2]
+
+_BUILTIN_CODECS = {
+    'pickle': PickleCodec,
+    'pickle_highest': PickleHighestCodec,
+    'marshal': MarshalCodec,
+    'msgpack': MsgpackCodec,
+    'pickle5': PickleOutOfBandCodec,
+    'columnar': ColumnarCodec,
+}
+
+def _codec_param(codec):
+    """
+    Returns the operator parameter value representing codec,
+    None for the default pickle codec. Built-in codecs are
+    represented by their name, compressed codecs by
+    compression:threshold:codec and other codecs by their
+    base64 encoded pickled form.
+
+    Raises:
+        ValueError: codec is an unknown name or is not a codec.
+    """
+    if codec is None or codec == 'pickle':
+        return None
+    if isinstance(codec, str):
+        if ':' in codec:
+            # compression:threshold:codec form
+            _get_codec(codec)
+            return codec
+        if codec not in _BUILTIN_CODECS:
+            raise ValueError("Unknown codec: " + codec)
+        if codec == 'msgpack':
+            importlib.import_module('msgpack')
+        if codec == 'pickle5':
+            _pickle5()
+        if codec == 'columnar':
+            _numpy()
+        return codec
+    if isinstance(codec, CompressedCodec):
+        return codec._codec_param()
+    if not (hasattr(codec, 'dumps') and hasattr(codec, 'loads')):
+        raise ValueError("Codec must implement dumps and loads: " + repr(codec))
+    return base64.b64encode(pickle.dumps(codec)).decode("ascii")
+
+def _get_codec(param):
+    """
+    Returns a codec instance from its operator parameter value,
+    a codec instance is returned as is.
+    """
+    if hasattr(param, 'dumps') and hasattr(param, 'loads'):
+        return param
+    if param is None:
+        return _DEFAULT_CODEC
+    if param in _BUILTIN_CODECS:
+        return _BUILTIN_CODECS[param]()
+    if ':' in param:
+        compression, threshold, param = param.split(':', 2)
+        codec = CompressedCodec.__new__(CompressedCodec)
+        codec._setup(compression, int(threshold), param or None)
+        return codec
+    return pickle.loads(base64.b64decode(param))
+
+_DEFAULT_CODEC = PickleCodec()
@@ -3,11 +3,16 @@
 
 import tempfile
 import os
+import shutil
+import time
 import os.path
 import json
 import subprocess
 import threading
+import socket
+import atexit
 import sys, traceback
+import queue
 
 #
 # Utilities
@@ -43,17 +48,51 @@ def submit(ctxtype, graph, config = None, username = None, password = None):
           The standalone execution is spawned as a separate process
         * BUNDLE - execution of the topology produces an SPL application bundle
           (.sab file) that can be submitted to an IBM Streams instance as a distributed application.
+        * TOOLKIT - an SPL toolkit containing the topology's SPL application is created,
+          with the SPL generated in Python, see streamsx.topology.toolkit.
         * JUPYTER - the topology is run in standalone mode, and context.submit returns a stdout streams of bytes which 
           can be read from to visualize the output of the application.
+        * LOCAL - the topology is run within this Python interpreter without requiring a
+          Streams install, using a thread per operator, see streamsx.topology.local.
+          Topics are published and subscribed between topologies running locally.
+          Returns once all the topology's sources are exhausted and their tuples processed.
+          Only topologies containing Python functions, union, isolate, low latency,
+          parallel regions, publish and subscribe are supported.
         graph: a Topology.graph object
+        config: Optional dict of configuration settings.
+          Once start_submit_server() has been called, topologies are submitted through
+          the long-lived submission server instead of starting a JVM for each submission,
+          except for JUPYTER.
+          For LOCAL, `local.timeout` cancels the job after that many seconds and
+          `local.queue_size` sets the maximum number of tuples queued for an operator.
+          With `local.processes` set to True each isolated region and each channel of a parallel
+          region runs in its own process, connected by shared memory buffers of `local.buffer_size` bytes.
+          For TOOLKIT, `topology.toolkitDir` sets the directory the toolkit is created in.
+          For BUNDLE and STANDALONE, `topology.bundleCache` is a directory caching the compiled bundles,
+          a topology whose graph, included Python code, toolkit version and configuration are unchanged
+          is submitted using its cached bundle without being compiled. Once the cache exceeds
+          `topology.bundleCacheSize` bytes (default 1GB) the least recently used bundles are removed.
         
     Returns:
-        An output stream of bytes if submitting with JUPYTER, otherwise returns None.
+        An output stream of bytes if submitting with JUPYTER,
+        a streamsx.topology.local.LocalJob providing the metrics of each operator if submitting with LOCAL,
+        the toolkit's directory if submitting with TOOLKIT,
+        otherwise returns None.
+    Raises:
+        ValueError: if submitting with LOCAL and the topology contains an unsupported operator.
+        RuntimeError: if submitted through the submission server (see start_submit_server)
+            and the submission completed with a non-zero return code.
+        Exception: the first exception raised by a Python function if submitting with LOCAL.
     """    
     if config is None:
         config = {}
+    if ctxtype == "LOCAL":
+        import streamsx.topology.local
+        return streamsx.topology.local.submit(graph, config)
+    if ctxtype == "TOOLKIT":
+        import streamsx.topology.toolkit
+        return streamsx.topology.toolkit.submit(graph, config)
     fj = _createFullJSON(graph, config)
-    fn = _createJSONFile(fj)
 
     # Create connection to SWS
     if username is not None and password is not None:
@@ -67,12 +106,88 @@ def submit(ctxtype, graph, config = None, username = None, password = None):
 
         for view in graph.get_views():
             view.set_streams_context_config({'username': username, 'password': password, 'resource_url': resource_url})
+
+    cache, key = _bundleCache(ctxtype, config, fj)
+    if cache is not None:
+        bundle = cache.get(key)
+        if bundle is not None:
+            return _submitCachedBundle(ctxtype, fj, bundle)
+        started = time.time()
+
+    result = _submitJSON(ctxtype, fj)
+
+    if cache is not None:
+        _cacheLocalBundle(cache, key, fj, started)
+    return result
+
+def _submitJSON(ctxtype, fj):
+    server = _submit_server
+    if server is not None and ctxtype != "JUPYTER":
+        try:
+            rc = server.submit(ctxtype, fj)
+        except _SubmitServerUnavailable:
+            print_exception("Submission server unavailable, submitting with java")
+            stop_submit_server()
+        except:
+            print_exception("Error submitting with submission server")
+            return None
+        else:
+            if rc:
+                raise RuntimeError("Submission failed with return code " + str(rc))
+            return None
+
+    fn = _createJSONFile(fj)
     try:
         return _submitUsingJava(ctxtype, fn)
     except:
         print_exception("Error submitting with java")
         delete_json(fn)
 
+def _bundleCache(ctxtype, config, fj):
+    """
+    Returns the bundle cache and the submission's key
+    if bundle caching is enabled, otherwise (None, None).
+    """
+    if ctxtype not in ("BUNDLE", "STANDALONE"):
+        return None, None
+    import streamsx.topology.cache
+    cache = streamsx.topology.cache.from_config(config)
+    if cache is None:
+        return None, None
+    return cache, streamsx.topology.cache.fingerprint(ctxtype, fj)
+
+def _cacheLocalBundle(cache, key, fj, started):
+    bundle = _localBundle(fj)
+    # Only cache a bundle produced by this submission
+    if os.path.isfile(bundle) and os.path.getmtime(bundle) >= started - 1:
+        cache.put(key, bundle)
+
+def _localBundle(fj):
+    """
+    Returns the path of the bundle for the graph
+    created in the current directory by BUNDLE and STANDALONE.
+    """
+    graph = fj["graph"]
+    return os.path.abspath(graph["namespace"] + "." + graph["name"] + ".sab")
+
+def _submitCachedBundle(ctxtype, fj, bundle):
+    """
+    Submits using a bundle from the bundle cache, for BUNDLE the
+    bundle is copied to the current directory and for STANDALONE
+    it is executed, as when submitting with Java.
+    """
+    if ctxtype == "BUNDLE":
+        shutil.copyfile(bundle, _localBundle(fj))
+        return None
+    subprocess.call(_standaloneCommand(bundle))
+    return None
+
+def _standaloneCommand(bundle):
+    streams_install = os.environ.get('STREAMS_INSTALL')
+    if streams_install is None:
+        raise ValueError("Please set the STREAMS_INSTALL system variable")
+    jvm = os.path.join(streams_install, "java", "jre", "bin", "java")
+    return [jvm, "-jar", bundle]
 
 def _createFullJSON(graph, config):
     fj = {}
@@ -109,13 +224,14 @@ def print_process_stderr(process, fn):
     except:
         print_exception("Error reading from process stderr")
 
-def _submitUsingJava(ctxtype, fn):
-    ctxtype_was = ctxtype
-    if ctxtype == "JUPYTER":
-        ctxtype = "STANDALONE"
+def _javaCommand(main, *args):
+    """
+    Returns the command running the Java class main with
+    the topology and Streams operator jars in its classpath.
+    """
     streams_install = os.environ.get('STREAMS_INSTALL')
     if streams_install is None:
-       raise "Please set the STREAMS_INSTALL system variable"
+       raise ValueError("Please set the STREAMS_INSTALL system variable")
 
     # This is tk/opt/python/packages/streamsx/topology
     dir = os.path.dirname(os.path.abspath(__file__))
@@ -128,8 +244,13 @@ def _submitUsingJava(ctxtype, fn):
     jaa_lib = os.path.join(tk_root, "lib", "com.ibm.streamsx.topology.jar")
     joa_lib = os.path.join(streams_install, "lib", "com.ibm.streams.operator.samples.jar")
     cp = jaa_lib + ":" + joa_lib
-    args = [ jvm, "-classpath", cp,
-    "com.ibm.streamsx.topology.context.StreamsContextSubmit", ctxtype, fn]
+    return [ jvm, "-classpath", cp, main ] + list(args)
+
+def _submitUsingJava(ctxtype, fn):
+    ctxtype_was = ctxtype
+    if ctxtype == "JUPYTER":
+        ctxtype = "STANDALONE"
+    args = _javaCommand("com.ibm.streamsx.topology.context.StreamsContextSubmit", ctxtype, fn)
     process = subprocess.Popen(args, stdin=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
     try:
         stderr_thread = threading.Thread(target=print_process_stderr, args=([process, fn]))
@@ -148,3 +269,288 @@ def _submitUsingJava(ctxtype, fn):
     except:
         print_exception("Error starting java subprocess for submission")
         
+
+#
+# Asynchronous submission.
+# Each submission's process is monitored by its own daemon
+# thread that passes the process's output to the submission's
+# handle a line at a time. A thread is used rather than an
+# asyncio subprocess, which before Python 3.8 requires the
+# event loop to run in the main thread.
+#
+def submit_async(ctxtype, graph, config = None):
+    """
+    Submits a topology with the specified context type without waiting
+    for the submission to complete.
+
+    Each submission starts its own JVM, the submission server
+    started by start_submit_server() is not used.
+
+    Args:
+        ctxtype (string): context type, DISTRIBUTED, STANDALONE or BUNDLE, see submit().
+        graph: a Topology.graph object
+        config: Optional dict of configuration settings, see submit().
+    Returns:
+        Submission: handle for the submission.
+    Raises:
+        ValueError: if ctxtype is not supported asynchronously.
+    """
+    if ctxtype not in ("DISTRIBUTED", "STANDALONE", "BUNDLE"):
+        raise ValueError("Context type is not supported by submit_async: " + str(ctxtype))
+    if config is None:
+        config = {}
+    fj = _createFullJSON(graph, config)
+    cache, key = _bundleCache(ctxtype, config, fj)
+    if cache is not None:
+        bundle = cache.get(key)
+        if bundle is not None:
+            if ctxtype == "BUNDLE":
+                shutil.copyfile(bundle, _localBundle(fj))
+                return Submission(None)
+            return Submission(_standaloneCommand(bundle))
+
+    fn = _createJSONFile(fj)
+    started = time.time()
+    def finished(rc):
+        delete_json(fn)
+        if cache is not None and rc == 0:
+            _cacheLocalBundle(cache, key, fj, started)
+    args = _javaCommand("com.ibm.streamsx.topology.context.StreamsContextSubmit", ctxtype, fn)
+    return Submission(args, finished)
+
+# States of a Submission
+_RUNNING = 'running'
+# The process has completed and finished is being called
+_FINISHING = 'finishing'
+_COMPLETED = 'completed'
+_CANCELLED = 'cancelled'
+
+class Submission(object):
+    """
+    Handle for a submission started by submit_async().
+
+    Iterating over the submission returns each line of the output
+    of the submission's process, stdout and stderr combined, until it
+    completes. Lines are retained until read.
+
+    Args:
+        args(list): Command run by the submission, None for a submission that has completed.
+        finished: Optional function called with the process's return code once it
+            completes, or None if it was cancelled or failed to start.
+    """
+    def __init__(self, args, finished=None):
+        self._lines = queue.Queue()
+        self._cond = threading.Condition()
+        self._state = _RUNNING
+        self._rc = None
+        self._error = None
+        self._process = None
+        if args is None:
+            self._lines.put(None)
+            self._state = _COMPLETED
+            self._rc = 0
+            return
+        thread = threading.Thread(target=self._run, args=(args, finished))
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, args, finished):
+        rc = None
+        error = None
+        try:
+            with self._cond:
+                if self._state != _RUNNING:
+                    return
+                self._process = subprocess.Popen(args,
+                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            with self._process.stdout:
+                for line in self._process.stdout:
+                    self._lines.put(line.decode("utf-8", "replace").rstrip("\n"))
+            rc = self._process.wait()
+        except Exception as e:
+            error = e
+        finally:
+            self._lines.put(None)
+            with self._cond:
+                if self._state == _RUNNING:
+                    self._state = _FINISHING
+                else:
+                    rc = None
+            if finished is not None:
+                finished(rc)
+            with self._cond:
+                if self._state == _FINISHING:
+                    self._state = _COMPLETED
+                    self._rc = rc
+                    self._error = error
+                    self._cond.notify_all()
+
+    def done(self):
+        """
+        Returns True if the submission has completed or was cancelled.
+        """
+        with self._cond:
+            return self._state in (_COMPLETED, _CANCELLED)
+
+    def result(self, timeout=None):
+        """
+        Waits for the submission to complete.
+
+        Args:
+            timeout: Maximum time in seconds to wait, None to wait until the submission completes.
+        Returns:
+            int: Return code of the submission's process.
+        Raises:
+            concurrent.futures.TimeoutError: if the submission did not complete within timeout.
+            concurrent.futures.CancelledError: if the submission was cancelled.
+        """
+        import concurrent.futures
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._state in (_COMPLETED, _CANCELLED), timeout):
+                raise concurrent.futures.TimeoutError()
+            if self._state == _CANCELLED:
+                raise concurrent.futures.CancelledError()
+            if self._error is not None:
+                raise self._error
+            return self._rc
+
+    def cancel(self):
+        """
+        Cancels the submission, killing its process.
+
+        Returns:
+            bool: True if the submission was cancelled, False if it had already completed.
+        """
+        with self._cond:
+            if self._state != _RUNNING:
+                return False
+            self._state = _CANCELLED
+            self._cond.notify_all()
+            process = self._process
+        if process is not None:
+            process.kill()
+        return True
+
+    def __iter__(self):
+        while True:
+            line = self._lines.get()
+            if line is None:
+                self._lines.put(None)
+                return
+            yield line
+
+#
+# Long-lived submission server.
+# Starting a JVM dominates the time taken to submit a
+# topology, so optionally a single JVM running
+# com.ibm.streamsx.topology.context.StreamsContextServer
+# is reused across submissions. The graph's JSON is sent
+# over a loopback socket authenticated by a random token
+# and the server streams back the submission's output,
+# prefixed with 'out ' or 'err ', followed by 'rc <n>'.
+# If the server cannot be reached before the graph is
+# sent, submit falls back to starting a JVM.
+#
+_submit_server = None
+_submit_server_lock = threading.Lock()
+
+class _SubmitServerUnavailable(Exception):
+    pass
+
+def _print_lines(stream):
+    try:
+        for line in iter(stream.readline, b''):
+            print(line.strip().decode("utf-8"))
+    except:
+        print_exception("Error reading from submission server")
+
+class _SubmitServer(object):
+    def __init__(self, port, token, process=None):
+        self.port = port
+        self.token = token
+        self.process = process
+
+    @classmethod
+    def start(cls):
+        args = _javaCommand("com.ibm.streamsx.topology.context.StreamsContextServer")
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        stderr_thread = threading.Thread(target=_print_lines, args=([process.stderr]))
+        stderr_thread.daemon = True
+        stderr_thread.start()
+        first = process.stdout.readline().decode("utf-8").split()
+        if len(first) != 2:
+            process.stdin.close()
+            process.wait()
+            raise RuntimeError("Submission server failed to start: " + str(process.returncode))
+        stdout_thread = threading.Thread(target=_print_lines, args=([process.stdout]))
+        stdout_thread.daemon = True
+        stdout_thread.start()
+        return cls(int(first[0]), first[1], process)
+
+    def submit(self, ctxtype, fj):
+        """
+        Submits the full JSON fj using this server, printing
+        the submission's output. Returns the submission's return code.
+
+        Raises:
+            _SubmitServerUnavailable: the server could not be reached, the graph was not submitted.
+        """
+        if self.process is not None and self.process.poll() is not None:
+            raise _SubmitServerUnavailable()
+        request = json.dumps(fj).encode("utf-8")
+        try:
+            conn = socket.create_connection(("127.0.0.1", self.port))
+        except OSError:
+            raise _SubmitServerUnavailable()
+        with conn:
+            header = "{0}\n{1}\n{2}\n".format(self.token, ctxtype, len(request))
+            try:
+                conn.sendall(header.encode("utf-8"))
+            except OSError:
+                raise _SubmitServerUnavailable()
+            conn.sendall(request)
+            conn.shutdown(socket.SHUT_WR)
+            with conn.makefile("rb") as response:
+                for line in response:
+                    line = line.decode("utf-8").rstrip("\n")
+                    kind, _, text = line.partition(" ")
+                    if kind == "rc":
+                        return int(text)
+                    print(text, file=sys.stderr if kind == "err" else sys.stdout)
+        raise RuntimeError("Submission server closed the connection before completing the submission")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+
+def start_submit_server():
+    """
+    Starts a long-lived submission server that submit() uses for
+    subsequent submissions, instead of starting a JVM for each one.
+    Has no effect if the server is already running.
+
+    The server is stopped by stop_submit_server() or when
+    the Python interpreter exits.
+
+    Raises:
+        ValueError: if the STREAMS_INSTALL environment variable is not set.
+    """
+    global _submit_server
+    with _submit_server_lock:
+        if _submit_server is None:
+            _submit_server = _SubmitServer.start()
+
+def stop_submit_server():
+    """
+    Stops the submission server started by start_submit_server().
+    Subsequent submissions start a JVM for each submission.
+    """
+    global _submit_server
+    with _submit_server_lock:
+        server = _submit_server
+        _submit_server = None
+    if server is not None:
+        server.stop()
+
+atexit.register(stop_submit_server)
@@ -17,6 +17,9 @@ class _DependencyResolver(object):
         self._modules = set()
         self._packages = collections.OrderedDict() # need an ordered set when merging namespace directories
         self._processed_modules = set()
+        # Modules whose dependencies have not been resolved yet,
+        # resolved when modules or packages is accessed.
+        self._pending = collections.OrderedDict()
         # Determine path of opt/python/packages/streamsx
         my_module = sys.modules[self.__module__]
         dir = os.path.dirname(os.path.abspath(my_module.__file__))
@@ -25,23 +28,28 @@ class _DependencyResolver(object):
         
     def add_dependencies(self, module):
         """
-        Adds a module and its dependencies to the list of dependencies
+        Adds a module and its dependencies to the list of dependencies.
+        The dependencies are resolved when the modules or
+        packages properties are next accessed.
         """
-        # add the module as a dependency
-        self._add_dependency(module)
-        # recursively get the module's imports and add those as dependencies
-        imported_modules = _get_imported_modules(module)
-        #print ("_get_imported_modules for {0}: {1}".format(module.__name__, imported_modules))
-        for imported_module_name,imported_module in imported_modules.items():
-            if imported_module not in self._processed_modules:
-                #print ("add_dependencies for {0} {1}".format(imported_module.__name__, imported_module))
-                self.add_dependencies(imported_module)
-    
+        self._pending[id(module)] = module
+
+    def _resolve(self):
+        """
+        Adds the dependencies of the pending modules
+        """
+        while self._pending:
+            _, module = self._pending.popitem(last=False)
+            for dependency in _dependency_closure(module):
+                if dependency is module or dependency not in self._processed_modules:
+                    self._add_dependency(dependency)
+
     @property
     def modules(self):
         """
         Property to get the list of module dependencies
         """
+        self._resolve()
         return frozenset(self._modules)
     
     @property
@@ -49,6 +57,7 @@ class _DependencyResolver(object):
         """
         Property to get the list of package dependencies
         """
+        self._resolve()
         return tuple(self._packages.keys())   
     
     def _add_dependency(self, module):
@@ -95,6 +104,55 @@ class _DependencyResolver(object):
 #####################
 # Utility functions #
 #####################
+
+# Process-wide memo of each module's dependency closure, shared
+# by all topologies. Maps a module's name to the module and a
+# tuple of (module, mtime) for the module and each module it
+# depends on. An entry is used while the module is the same
+# object and none of the files of the closure has been modified.
+# The closures of modules without a file (such as an interactive
+# __main__) are not memoized as their contents change freely.
+_closures = {}
+
+def _mtime(module):
+    """
+    Returns the modification time of a module's file,
+    None if the module has no file.
+    """
+    path = getattr(module, '__file__', None)
+    if path:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return None
+
+def _dependency_closure(module):
+    """
+    Gets the modules a module depends on
+
+    Returns:
+        list: the module followed by the modules it imports,
+              directly or indirectly, in depth first order.
+    """
+    cached = _closures.get(module.__name__)
+    if cached is not None and cached[0] is module:
+        if all(_mtime(m) == mtime for m, mtime in cached[1]):
+            return [m for m, mtime in cached[1]]
+
+    closure = []
+    seen = set()
+    def visit(m):
+        seen.add(m)
+        closure.append(m)
+        for imported_module in _get_imported_modules(m).values():
+            if imported_module not in seen:
+                visit(imported_module)
+    visit(module)
+
+    if _mtime(module) is not None:
+        _closures[module.__name__] = (module, tuple((m, _mtime(m)) for m in closure))
+    return closure
     
 def _get_package_name(module):
     """
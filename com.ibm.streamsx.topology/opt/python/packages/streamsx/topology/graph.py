@@ -8,7 +8,8 @@ import pickle
 import base64
 import streamsx.topology.dependency
 import streamsx.topology.param
-from streamsx.topology.schema import CommonSchema
+import streamsx.topology.runtime
+from streamsx.topology.schema import CommonSchema, _PyObjectReference
 
 class SPLGraph(object):
 
@@ -19,6 +20,12 @@ class SPLGraph(object):
         self.operators = []
         self.resolver = streamsx.topology.dependency._DependencyResolver()
         self._views = []
+        # Optional metric sets enabled for Python operators,
+        # see Topology(metrics=)
+        self.metrics = frozenset()
+        # On-demand profiling of Python operators,
+        # see Topology(profiling=)
+        self.profiling = False
 
     def get_views(self):
         return self._views
@@ -45,9 +52,17 @@ class SPLGraph(object):
             op = SPLInvocation(len(self.operators), kind, function, name, params, self)
         self.operators.append(op)
         if not function is None:
-            if not inspect.isbuiltin(function):
-                self.resolver.add_dependencies(inspect.getmodule(function))
+            self.addDependencies(function)
         return op
+
+    def addDependencies(self, function):
+        """
+        Adds the module defining function and its dependencies
+        to the modules included in the application bundle.
+        The dependencies are resolved when the graph is generated.
+        """
+        if not inspect.isbuiltin(function):
+            self.resolver.add_dependencies(inspect.getmodule(function))
     
     def addPassThruOperator(self):
         name = self.name + "_OP"+str(len(self.operators))
@@ -65,10 +80,15 @@ class SPLGraph(object):
         _ops = []
         self.addModules(_graph["config"]["includes"])
         self.addPackages(_graph["config"]["includes"])
-        for op in self.operators:
+        ops = self._fusePipelines()
+        for op in ops:
             _ops.append(op.generateSPLOperator())
+        _setReferenceTypes(_ops, self._referencePorts(ops))
 
         _graph["operators"] = _ops
+        if self.profiling:
+            _graph["parameters"] = {
+                _PROFILE_OP_PARAMETER: _profileParameter()}
         return _graph
    
     def addPackages(self, includes):
@@ -85,6 +105,94 @@ class SPLGraph(object):
            mf["target"] = "opt/python/modules"
            includes.append(mf)
            
+    def _fusePipelines(self):
+        """
+        Returns the operators to generate with each run of chained
+        Python map, filter and flat_map operators replaced by a
+        single PyFunctionPipeline operator.
+
+        A run is broken by any other operator (including the
+        isolate, parallel and low latency markers), by a stream
+        with more than one connection, a non-Python schema
+        or a view. The operators of the graph are not modified.
+        """
+        successors = {}
+        for op in self.operators:
+            if not _isFusable(op):
+                continue
+            iports = op.outputPorts[0].inputPorts
+            if len(iports) != 1:
+                continue
+            nop = iports[0].operator
+            if _isFusable(nop) and len(nop.inputPorts) == 1 \
+               and len(nop.inputPorts[0].outputPorts) == 1:
+                successors[op] = nop
+
+        fused = set(successors.values())
+        ops = []
+        for op in self.operators:
+            if op in fused:
+                continue
+            if op not in successors:
+                ops.append(op)
+                continue
+            chain = [op]
+            while chain[-1] in successors:
+                chain.append(successors[chain[-1]])
+            ops.append(PipelineInvocation(chain, self))
+        return ops
+
+    def _referencePorts(self, ops):
+        """
+        Returns the names of the output ports that pass Python
+        objects by reference, see Stream.low_latency().
+
+        Within a low latency region that passes by reference, a
+        Python operator's output port passes by reference when
+        all its consumers are Python operators in the region
+        that call a function with each object. The low latency
+        marker is transparent and its ports are included.
+        """
+        fused = {}
+        for op in ops:
+            if isinstance(op, PipelineInvocation):
+                for cop in op.chain:
+                    fused[cop] = op
+        def _operator(port):
+            return fused.get(port.operator, port.operator)
+
+        names = set()
+        for marker in ops:
+            if marker.kind != "$LowLatency$" or not marker.params.get('byReference'):
+                continue
+            region = set(_operator(oport) for oport in marker.inputPorts[0].outputPorts)
+            todo = [marker]
+            while todo:
+                op = todo.pop()
+                for oport in op.outputPorts:
+                    for iport in oport.inputPorts:
+                        nop = _operator(iport)
+                        if nop not in region and not isinstance(nop, Marker):
+                            region.add(nop)
+                            todo.append(nop)
+
+            for op in region:
+                if op.kind not in _REFERENCE_PRODUCERS:
+                    continue
+                for oport in op.outputPorts:
+                    if oport.schema.schema() != CommonSchema.Python.schema():
+                        continue
+                    ports = [oport]
+                    iports = list(oport.inputPorts)
+                    if len(iports) == 1 and _operator(iports[0]) is marker:
+                        ports.append(marker.outputPorts[0])
+                        iports = list(marker.outputPorts[0].inputPorts)
+                    if iports and all(_operator(ip) in region
+                           and _operator(ip).kind in _REFERENCE_CONSUMERS
+                           and len(ip.outputPorts) == 1 for ip in iports):
+                        names.update(port.name for port in ports)
+        return names
+
     def getLastOperator(self):
         return self.operators[len(self.operators) -1]      
         
@@ -111,10 +219,10 @@ class SPLInvocation(object):
         self.inputPorts = []
         self.outputPorts = []
 
-    def addOutputPort(self, oWidth=None, name=None, inputPort=None, schema= CommonSchema.Python,partitioned=None):
+    def addOutputPort(self, oWidth=None, name=None, inputPort=None, schema= CommonSchema.Python,partitioned=None,codec=None):
         if name is None:
             name = self.name + "_OUT"+str(len(self.outputPorts))
-        oport = OPort(name, self, len(self.outputPorts), schema, oWidth, partitioned)
+        oport = OPort(name, self, len(self.outputPorts), schema, oWidth, partitioned, codec)
         self.outputPorts.append(oport)
 
         if not inputPort is None:
@@ -185,9 +293,42 @@ class SPLInvocation(object):
                 _value = {}
                 _value["value"] = param
                 _params[name] = _value
+        self._addCodecParameters(_params)
+        self._addMetricsParameters(_params)
+        if self.graph.profiling and self.kind in _PER_TUPLE_KINDS:
+            _params["pyProfile"] = _profileParameter()
         _op["parameters"] = _params
         return _op
 
+    def _addCodecParameters(self, _params):
+        """
+        Adds the codecs for Python object input and output
+        streams to a Python functional operator's parameters,
+        nothing is added for the default pickle codec.
+        """
+        if not self.kind.startswith("com.ibm.streamsx.topology.functional.python::"):
+            return
+        if self.inputPorts:
+            in_codec = _inputCodec(self.inputPorts)
+            if in_codec is not None:
+                _params["pyInCodec"] = {"value": in_codec}
+        if self.outputPorts:
+            out_codec = _streamCodec(self.outputPorts[0])
+            if out_codec is not None:
+                _params["pyOutCodec"] = {"value": out_codec}
+
+    def _addMetricsParameters(self, _params):
+        """
+        Adds the parameters enabling the topology's optional
+        metrics to a Python functional operator's parameters.
+        """
+        if not self.kind.startswith("com.ibm.streamsx.topology.functional.python::"):
+            return
+        if 'gil' in self.graph.metrics:
+            _params["gilMetrics"] = {"value": True}
+        if 'python' in self.graph.metrics and self.kind in _PER_TUPLE_KINDS:
+            _params["pythonMetrics"] = {"value": True}
+
     def _addOperatorFunction(self, function):
         if (function == None):
             return None
@@ -216,6 +357,172 @@ class SPLInvocation(object):
         for port in self.outputPorts:
             print(port.name)
 
+# Python functional operators that can be fused into a
+# PyFunctionPipeline, mapped to their pipeline stage kind.
+_FUSABLE_KINDS = {
+    "com.ibm.streamsx.topology.functional.python::PyFunctionTransform": 'map',
+    "com.ibm.streamsx.topology.functional.python::PyFunctionFilter": 'filter',
+    "com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform": 'flat_map',
+}
+
+def _isFusable(op):
+    if op.kind not in _FUSABLE_KINDS:
+        return False
+    if op.function is None or op.view_configs:
+        return False
+    if len(op.inputPorts) != 1 or len(op.outputPorts) != 1:
+        return False
+    return op.outputPorts[0].schema.schema() == CommonSchema.Python.schema()
+
+# Python functional operators that can submit
+# or receive references to Python objects.
+_REFERENCE_PRODUCERS = {
+    "com.ibm.streamsx.topology.functional.python::PyFunctionSource",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionTransform",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionPipeline",
+}
+_REFERENCE_CONSUMERS = {
+    "com.ibm.streamsx.topology.functional.python::PyFunctionTransform",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionPipeline",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionSink",
+}
+
+# Python functional operators that call the application's
+# callable for each tuple and support Python execution
+# metrics and profiling.
+_PER_TUPLE_KINDS = {
+    "com.ibm.streamsx.topology.functional.python::PyFunctionSource",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionTransform",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionFilter",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionPipeline",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionHashAdder",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionSink",
+}
+
+# Submission parameter listing the Python operators to profile
+# from their first tuple, see streamsx.topology.runtime._Profiler.
+_PROFILE_PARAMETER = "streamsx.topology.profile"
+_PROFILE_OP_PARAMETER = "__jaa_stv_streamsx_topology_profile"
+
+def _profileParameter():
+    """
+    Returns the operator parameter whose value is
+    the profile submission parameter, defaulting
+    to no operators.
+    """
+    return {"type": "submissionParameter",
+            "value": {"name": _PROFILE_PARAMETER, "metaType": "RSTRING", "defaultValue": ""}}
+
+def _setReferenceTypes(ops, names):
+    """
+    Sets the type of the named output ports and the input
+    ports connected to them in the generated operators to
+    the Python object reference schema.
+
+    Ports connected to a threaded input port, or to an operator
+    using dynamic threading, are not set and remain pickled, as
+    their consumers are not called on the submitting thread.
+    """
+    names = set(names) - _threadedPorts(ops)
+    if not names:
+        return
+    rtype = _PyObjectReference.schema()
+    for op in ops:
+        for oport in op["outputs"]:
+            if oport["name"] in names:
+                oport["type"] = rtype
+        for iport in op["inputs"]:
+            if iport["connections"] and all(c in names for c in iport["connections"]):
+                iport["type"] = rtype
+
+def _isThreaded(op, iport):
+    """
+    Returns True if tuples arriving at the input port of
+    a generated operator are processed on another thread.
+    """
+    config = op.get("config", {})
+    if iport.get("queue") or config.get("queue"):
+        return True
+    return config.get("threading") == "dynamic"
+
+def _threadedPorts(ops):
+    """
+    Returns the names of the output ports in the generated
+    operators connected to a threaded input port, including
+    through low latency markers.
+    """
+    threaded = set()
+    for op in ops:
+        for iport in op["inputs"]:
+            if _isThreaded(op, iport):
+                threaded.update(iport["connections"])
+    markers = [op for op in ops if op.get("marker")]
+    while True:
+        added = set(name for op in markers
+            if any(oport["name"] in threaded for oport in op["outputs"])
+            for iport in op["inputs"] for name in iport["connections"]) - threaded
+        if not added:
+            return threaded
+        threaded.update(added)
+
+# Operators that submit their input Python objects
+# unchanged, so their output uses the input's codec.
+_CODEC_PASS_THROUGH_KINDS = {
+    "com.ibm.streamsx.topology.functional.python::PyFunctionFilter",
+    "com.ibm.streamsx.topology.functional.python::PyFunctionHashAdder",
+    "spl.relational::Functor",
+}
+
+def _streamCodec(oport):
+    """
+    Returns the codec parameter of the Python objects
+    on the stream from an output port.
+    """
+    op = oport.operator
+    if isinstance(op, Marker) or op.kind in _CODEC_PASS_THROUGH_KINDS:
+        return _inputCodec(op.inputPorts)
+    return oport.codec
+
+def _inputCodec(iports):
+    """
+    Returns the codec parameter of the Python objects
+    arriving at input ports.
+
+    Raises:
+        ValueError: The connected streams use different codecs.
+    """
+    codecs = set(_streamCodec(oport) for iport in iports for oport in iport.outputPorts)
+    if len(codecs) > 1:
+        raise ValueError("Streams using different codecs cannot be combined: " +
+            ", ".join(str(c) for c in codecs))
+    return codecs.pop() if codecs else None
+
+class PipelineInvocation(SPLInvocation):
+    """
+    Invocation of PyFunctionPipeline that replaces a chain of
+    fused Python operators. The input ports are those of the first
+    operator in the chain and the output ports those of the last,
+    so connections to the rest of the graph are unchanged.
+    """
+    def __init__(self, chain, graph):
+        head = chain[0]
+        tail = chain[-1]
+        stages = [(_FUSABLE_KINDS[op.kind], op.function) for op in chain]
+        pipeline = streamsx.topology.runtime._Pipeline(stages)
+        params = {'toolkitDir': head.params['toolkitDir']}
+        chunks = [op.params['chunkSize'] for op in chain if 'chunkSize' in op.params]
+        if chunks:
+            params['chunkSize'] = min(chunks)
+        super(PipelineInvocation, self).__init__(head.index,
+            "com.ibm.streamsx.topology.functional.python::PyFunctionPipeline",
+            pipeline, head.name, params, graph)
+        self.chain = chain
+        self.inputPorts = head.inputPorts
+        self.outputPorts = tail.outputPorts
+
 class IPort(object):
     def __init__(self, name, operator, index, schema):
         self.name = name
@@ -239,13 +546,16 @@ class IPort(object):
         return _iport
 
 class OPort(object):
-    def __init__(self, name, operator, index, schema, width=None, partitioned=None):
+    def __init__(self, name, operator, index, schema, width=None, partitioned=None, codec=None):
         self.name = name
         self.operator = operator
         self.schema = schema
         self.index = index
         self.width = width
         self.partitioned =  partitioned
+        # Codec parameter for Python objects submitted
+        # by the operator, None for the default pickle codec.
+        self.codec = codec
 
         self.inputPorts = []
 
@@ -0,0 +1,1043 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+"""
+Execution of a topology within the Python interpreter,
+used by the LOCAL context, see streamsx.topology.context.submit.
+
+The operators of the topology's graph are interpreted directly,
+without SPL being generated, compiled or run by a Streams instance.
+Each Python operator (and each channel of a parallel region) is
+run by its own thread, connected by bounded queues. Tuples are
+passed between operators in the serialized form used by Streams,
+using the same wrapper functions as the SPL operators (see
+streamsx.topology.runtime), so the costs of the stream codecs are
+included. Markers such as union, isolate and the parallel region
+markers are executed inline by the upstream operator's thread.
+
+Streams published by a topology are delivered to subscribers of
+topologies running locally within the same interpreter.
+
+With the local.processes setting the topology is instead partitioned
+into processing elements (PEs) at its isolate and parallel region
+boundaries, each run by its own forked process, so a parallel region's
+channels run concurrently on multiple cores. Tuples are passed between
+PEs through ring buffers in shared memory. Published streams are then
+only delivered to subscribers within the same topology.
+
+Each operator records throughput metrics, returned by LocalJob.metrics().
+"""
+
+import collections
+import ctypes
+import inspect
+import mmap
+import multiprocessing
+import os
+import pickle
+import queue
+import struct
+import threading
+import time
+
+import streamsx.topology.runtime as runtime
+from streamsx.topology import graph as _graph
+from streamsx.topology.codec import _join_frames
+from streamsx.topology.schema import CommonSchema
+
+_PY = "com.ibm.streamsx.topology.functional.python::"
+
+# Default maximum number of tuples queued for an operator
+_QUEUE_SIZE = 1024
+
+# Seconds between checks for the job being cancelled
+# while an operator waits to receive or send a tuple.
+_POLL_SECONDS = 0.1
+
+# Marker kinds whose output is their input
+_PASS_THROUGH_MARKERS = frozenset(['$Union$', '$Isolate$', '$LowLatency$',
+    '$EndLowLatency$', '$Autonomous$', '$EndParallel$'])
+
+# Final punctuation
+_FINAL = object()
+
+# Value on a stream whose schema has the __spl_hash attribute
+# added by PyFunctionHashAdder for hash partitioned parallel regions.
+_Hashed = collections.namedtuple('_Hashed', ['value', 'hash'])
+
+def _style(schema):
+    """
+    Returns the style of values on a stream with `schema`,
+    see splpy_tuplestyle in pyfunction.pm.
+    """
+    s = schema.schema()
+    if s == CommonSchema.Python.schema():
+        return 'pickle'
+    if s == CommonSchema.Json.schema():
+        return 'json'
+    if s == CommonSchema.String.schema():
+        return 'string'
+    if s == CommonSchema.Binary.schema():
+        return 'binary'
+    return 'dict'
+
+def _wrapper(name, *args):
+    return getattr(runtime, name)(*args)
+
+def _spl_tuple(names):
+    """
+    Returns a function converting the return of a callable to the
+    value on a structured schema stream with attributes `names`,
+    as the operators convert it to the output tuple: by position
+    from a tuple or by attribute name from a dict. Values are of the
+    class the operators pass to callables, unset attributes are None.
+    """
+    cls = runtime._spl_tuple_class(names)
+    names = tuple(names)
+    def _convert(rv):
+        if isinstance(rv, tuple):
+            values = rv[:len(names)] + (None,) * (len(names) - len(rv))
+        elif isinstance(rv, dict):
+            values = tuple(rv.get(name) for name in names)
+        else:
+            raise TypeError("Callable must return a tuple or dict for a structured schema")
+        return tuple.__new__(cls, values)
+    return _convert
+
+
+class _Broker(object):
+    """
+    In-memory broker delivering published tuples to the subscribers
+    of locally running jobs, matched by topic and schema.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, key, node):
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(node)
+
+    def unsubscribe(self, key, node):
+        with self._lock:
+            nodes = self._subscribers.get(key, [])
+            if node in nodes:
+                nodes.remove(node)
+
+    def publish(self, key, job, value):
+        with self._lock:
+            nodes = list(self._subscribers.get(key, []))
+        for node in nodes:
+            # Subscribers in the same job are connected directly.
+            if node.job is not job:
+                try:
+                    node.put(0, value)
+                except _Cancelled:
+                    pass
+
+_broker = _Broker()
+
+
+class _Metrics(object):
+    def __init__(self):
+        self.processed = 0
+        self.submitted = 0
+        self.busy = 0.0
+        self.start = None
+        self.end = None
+
+    def values(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        elapsed = end - self.start if self.start is not None else 0.0
+        count = self.processed if self.processed else self.submitted
+        return {
+            'pid': os.getpid(),
+            'nTuplesProcessed': self.processed,
+            'nTuplesSubmitted': self.submitted,
+            'busySeconds': self.busy,
+            'elapsedSeconds': elapsed,
+            'tuplesPerSecond': count / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class _Node(object):
+    """
+    Instance of an operator, or of a channel of an operator
+    within a parallel region. Outputs are lists, per output port,
+    of the (node, input port) connections tuples are submitted to.
+    """
+    threaded = False
+
+    def __init__(self, job, op, name):
+        self.job = job
+        self.op = op
+        self.name = name
+        self.outputs = [[] for _ in op.outputPorts]
+        self.finals = 0
+        self.metrics = _Metrics()
+
+    def submit(self, port, value):
+        self.metrics.submitted += 1
+        for node, iport in self.outputs[port]:
+            node.put(iport, value)
+
+    def final(self):
+        for connections in self.outputs:
+            for node, iport in connections:
+                node.put(iport, _FINAL)
+
+    def start(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class _InlineNode(_Node):
+    """
+    Node executed by the thread of the upstream node
+    submitting the tuple, used for markers.
+    """
+    def __init__(self, job, op, name):
+        super(_InlineNode, self).__init__(job, op, name)
+        self._lock = threading.Lock()
+
+    def put(self, iport, value):
+        if value is _FINAL:
+            with self._lock:
+                self.finals -= 1
+                done = self.finals == 0
+            if done:
+                self.final()
+            return
+        self.process(value)
+
+    def process(self, value):
+        self.submit(0, value)
+
+class _StripHash(_InlineNode):
+    # Functor removing the __spl_hash attribute after a partitioned parallel marker
+    def process(self, value):
+        self.submit(0, value.value if isinstance(value, _Hashed) else value)
+
+class _Router(_InlineNode):
+    """
+    Parallel marker, routes each tuple to one channel of the region.
+    """
+    def __init__(self, job, op, name):
+        super(_Router, self).__init__(job, op, name)
+        self.partitioned = bool(op.outputPorts[0].partitioned)
+        # Connections of each channel
+        self.channels = [[] for _ in range(int(op.outputPorts[0].width))]
+        self._next = 0
+
+    def process(self, value):
+        channels = self.channels
+        if self.partitioned:
+            channel = value.hash % len(channels)
+        else:
+            with self._lock:
+                channel = self._next
+                self._next = (channel + 1) % len(channels)
+        for node, iport in channels[channel]:
+            node.put(iport, value)
+
+class _Publish(_InlineNode):
+    def __init__(self, job, op, name):
+        super(_Publish, self).__init__(job, op, name)
+        schema = op.inputPorts[0].schema
+        self.key = (op.params['topic'][0], schema.schema())
+        # Connections to the subscribers in the same job
+        self.outputs = [[]]
+
+    def process(self, value):
+        self.submit(0, value)
+        _broker.publish(self.key, self.job, value)
+
+
+class _ThreadedNode(_Node):
+    """
+    Node with its own thread, processing the
+    tuples from its queue in order.
+    """
+    threaded = True
+
+    def __init__(self, job, op, name, channel):
+        super(_ThreadedNode, self).__init__(job, op, name)
+        self.channel = channel
+        self.queue = queue.Queue(job.queue_size)
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def put(self, iport, value):
+        while True:
+            try:
+                self.queue.put(value, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                if self.job._cancelled.is_set():
+                    raise _Cancelled()
+
+    # Creates the operator's Python wrapper function, called in
+    # the process running the operator before its thread starts.
+    def setup(self):
+        pass
+
+    def start(self):
+        self.thread.start()
+
+    def join(self):
+        self.thread.join()
+
+    def _run(self):
+        try:
+            self.run()
+            self.final()
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            self.job._failed(self, e)
+        finally:
+            self.metrics.end = time.perf_counter()
+            self.job._done(self)
+
+    def get(self, timeout=None):
+        """
+        Returns the next value from the queue, _FINAL once
+        all upstream connections are final or None if timeout
+        seconds pass without a value.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = _POLL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                value = self.queue.get(timeout=wait)
+            except queue.Empty:
+                if self.job._cancelled.is_set():
+                    raise _Cancelled()
+                continue
+            if value is not _FINAL:
+                return value
+            self.finals -= 1
+            if self.finals <= 0:
+                return _FINAL
+
+    def run(self):
+        self.metrics.start = time.perf_counter()
+        while True:
+            value = self.get()
+            if value is _FINAL:
+                return
+            self.metrics.processed += 1
+            start = time.perf_counter()
+            rv = self.process(value)
+            self.metrics.busy += time.perf_counter() - start
+            if rv is not None:
+                self.emit(rv)
+
+    def emit(self, rv):
+        self.submit(0, rv)
+
+class _Cancelled(Exception):
+    pass
+
+def _codecs(op):
+    in_codec = _graph._inputCodec(op.inputPorts) if op.inputPorts else None
+    out_codec = _graph._streamCodec(op.outputPorts[0]) if op.outputPorts else None
+    return in_codec, out_codec
+
+def _function(op, channel):
+    # Each channel of a parallel region has its own instance
+    # of a callable class, as each has its own SPL operator.
+    fn = op.function
+    if channel is not None and not inspect.isroutine(fn):
+        fn = pickle.loads(pickle.dumps(fn))
+    return fn
+
+class _Source(_ThreadedNode):
+    def setup(self):
+        self.wf = _wrapper('iterableSource', _function(self.op, self.channel), None, _codecs(self.op)[1])
+
+    def run(self):
+        self.metrics.start = time.perf_counter()
+        wf = self.wf
+        while not self.job._cancelled.is_set():
+            start = time.perf_counter()
+            v = wf()
+            self.metrics.busy += time.perf_counter() - start
+            if v is None:
+                return
+            self.submit(0, _join_frames(v))
+
+class _Subscribe(_ThreadedNode):
+    def __init__(self, job, op, name, channel):
+        super(_Subscribe, self).__init__(job, op, name, channel)
+        self.key = (op.params['topic'][0], op.outputPorts[0].schema.schema())
+
+    def process(self, value):
+        return value
+
+class _Transform(_ThreadedNode):
+    def setup(self):
+        op = self.op
+        in_codec, out_codec = _codecs(op)
+        style = _style(op.inputPorts[0].schema) + '_in__' + _style(op.outputPorts[0].schema) + '_out'
+        self.wf = _wrapper(style, _function(op, self.channel), in_codec, out_codec)
+        self.spl_tuple = None
+        if style.endswith('dict_out'):
+            self.spl_tuple = _spl_tuple(op.outputPorts[0].schema.names())
+
+    def process(self, value):
+        rv = self.wf(value)
+        if rv is not None and self.spl_tuple is not None:
+            return self.spl_tuple(rv)
+        return rv
+
+    def emit(self, rv):
+        self.submit(0, _join_frames(rv))
+
+class _Filter(_ThreadedNode):
+    def setup(self):
+        op = self.op
+        self.wf = _wrapper(_style(op.inputPorts[0].schema) + '_in', _function(op, self.channel), _codecs(op)[0])
+
+    def process(self, value):
+        return value if self.wf(value) else None
+
+class _HashAdder(_Filter):
+    def process(self, value):
+        return _Hashed(value, self.wf(value))
+
+class _Sink(_Filter):
+    def process(self, value):
+        self.wf(value)
+
+class _MultiTransform(_ThreadedNode):
+    def setup(self):
+        op = self.op
+        in_codec, out_codec = _codecs(op)
+        style = _style(op.inputPorts[0].schema) + '_in__' + _style(op.outputPorts[0].schema) + '_iter'
+        self.wf = _wrapper(style, _function(op, self.channel), in_codec, out_codec)
+
+    # The returned iterator is consumed as tuples are
+    # submitted, so is included in the busy time.
+    def process(self, value):
+        rv = self.wf(value)
+        if rv is not None:
+            for v in rv:
+                self.submit(0, _join_frames(v))
+
+class _Batch(_ThreadedNode):
+    def setup(self):
+        op = self.op
+        in_codec, out_codec = _codecs(op)
+        self.batch = _wrapper(_style(op.inputPorts[0].schema) + '_in__pickle_batch',
+            op.params['size'], in_codec, out_codec)
+        self.max_delay = op.params.get('maxDelay')
+
+    def run(self):
+        self.metrics.start = time.perf_counter()
+        last = time.monotonic()
+        while True:
+            timeout = None
+            if self.max_delay is not None:
+                timeout = max(0.0, last + self.max_delay - time.monotonic())
+            value = self.get(timeout)
+            if value is _FINAL:
+                break
+            if value is None:
+                rv = self.batch.flush()
+            else:
+                self.metrics.processed += 1
+                rv = self.batch.add(value)
+            if rv is not None or value is None:
+                last = time.monotonic()
+            if rv is not None:
+                self.submit(0, _join_frames(rv))
+        rv = self.batch.flush()
+        if rv is not None:
+            self.submit(0, _join_frames(rv))
+
+class _Async(_ThreadedNode):
+    def setup(self):
+        op = self.op
+        in_codec, out_codec = _codecs(op)
+        style = _style(op.inputPorts[0].schema) + ('_in__pickle_async' if op.outputPorts else '_in__async')
+        self.am = _wrapper(style, _function(op, self.channel), in_codec, out_codec)
+
+    def _take(self, timeout):
+        for rv in self.am.take(timeout):
+            self.submit(0, _join_frames(rv))
+
+    def run(self):
+        self.metrics.start = time.perf_counter()
+        while True:
+            value = self.get(_POLL_SECONDS)
+            if value is _FINAL:
+                break
+            if value is not None:
+                self.metrics.processed += 1
+                # Results must be taken to free a slot for the value
+                while self.am.pending >= self.am.max_in_flight:
+                    if self.job._cancelled.is_set():
+                        raise _Cancelled()
+                    self._take(_POLL_SECONDS)
+                self.am.add(value)
+            self._take(0)
+        while self.am.pending:
+            if self.job._cancelled.is_set():
+                raise _Cancelled()
+            self._take(_POLL_SECONDS)
+        self.am.join()
+
+_NODES = {
+    _PY + 'PyFunctionSource': _Source,
+    _PY + 'PyFunctionTransform': _Transform,
+    _PY + 'PyFunctionFilter': _Filter,
+    _PY + 'PyFunctionMultiTransform': _MultiTransform,
+    _PY + 'PyFunctionPipeline': _MultiTransform,
+    _PY + 'PyFunctionSink': _Sink,
+    _PY + 'PyFunctionHashAdder': _HashAdder,
+    _PY + 'PyFunctionBatch': _Batch,
+    _PY + 'PyFunctionAsync': _Async,
+    'com.ibm.streamsx.topology.topic::Subscribe': _Subscribe,
+}
+
+
+class LocalJob(object):
+    """
+    Topology running within this Python interpreter,
+    returned by submitting to the LOCAL context.
+
+    The job completes once all its sources are exhausted and their
+    tuples have been processed. Subscribers to topics not published
+    by the job itself then stop, unless the job has no sources, in
+    which case it runs until cancelled.
+    """
+    def __init__(self, graph, config=None):
+        if config is None:
+            config = {}
+        self.name = graph.name
+        self.queue_size = int(config.get('local.queue_size', _QUEUE_SIZE))
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._nodes = []
+        self._build(graph._fusePipelines())
+        self._running = set(n for n in self._nodes if n.threaded)
+        self._all_done = threading.Event()
+        self._sources_done = threading.Event()
+
+    def _build(self, ops):
+        # Ports refer to the operators of the graph, which
+        # are replaced by their pipeline when fused.
+        fused = {}
+        for op in ops:
+            for cop in getattr(op, 'chain', []):
+                fused[cop] = op
+        self._operator = lambda port: fused.get(port.operator, port.operator)
+
+        widths = self._regions(ops)
+        nodes = {}
+        for op in ops:
+            width = widths.get(op)
+            for channel in (range(width) if width else [None]):
+                name = op.name if channel is None else '%s[%d]' % (op.name, channel)
+                node = self._node(op, name, channel)
+                nodes[(op, channel)] = node
+                self._nodes.append(node)
+
+        for (op, channel), node in nodes.items():
+            for oport in op.outputPorts:
+                for iport in oport.inputPorts:
+                    dest = self._operator(iport)
+                    for dchannel in self._channels(op, channel, dest, widths):
+                        dnode = nodes[(dest, dchannel)]
+                        node.outputs[oport.index].append((dnode, iport.index))
+                        dnode.finals += 1
+                        if isinstance(node, _Router):
+                            node.channels[dchannel].append((dnode, iport.index))
+
+        # Subscribers are connected to publishers of the same job
+        self._orphans = []
+        publishers = [n for n in self._nodes if isinstance(n, _Publish)]
+        for node in self._nodes:
+            if isinstance(node, _Subscribe):
+                for pub in publishers:
+                    if pub.key == node.key:
+                        pub.outputs[0].append((node, 0))
+                        node.finals += 1
+                if node.finals == 0:
+                    self._orphans.append(node)
+
+    def _regions(self, ops):
+        """
+        Returns the width of each operator within a parallel region.
+        """
+        widths = {}
+        for op in ops:
+            if op.kind != '$Parallel$':
+                continue
+            width = op.outputPorts[0].width
+            todo = [self._operator(iport) for iport in op.outputPorts[0].inputPorts]
+            while todo:
+                rop = todo.pop()
+                if rop.kind == '$EndParallel$' or rop in widths:
+                    continue
+                if rop.kind == '$Parallel$':
+                    raise ValueError("Nested parallel regions are not supported")
+                widths[rop] = int(width)
+                todo.extend(self._operator(iport) for oport in rop.outputPorts for iport in oport.inputPorts)
+        return widths
+
+    def _channels(self, op, channel, dest, widths):
+        if dest not in widths:
+            return [None]
+        if op.kind == '$Parallel$':
+            return list(range(widths[dest]))
+        return [channel]
+
+    def _node(self, op, name, channel):
+        if op.kind == '$Parallel$':
+            return _Router(self, op, name)
+        if op.kind in _PASS_THROUGH_MARKERS:
+            return _InlineNode(self, op, name)
+        if op.kind == 'spl.relational::Functor':
+            return _StripHash(self, op, name)
+        if op.kind == 'com.ibm.streamsx.topology.topic::Publish':
+            return _Publish(self, op, name)
+        cls = _NODES.get(op.kind)
+        if cls is None:
+            raise ValueError("Operator kind is not supported by the LOCAL context: " + op.kind)
+        return cls(self, op, name, channel)
+
+    def start(self):
+        for node in self._nodes:
+            if node.threaded:
+                node.setup()
+        for node in self._nodes:
+            if isinstance(node, _Subscribe):
+                _broker.subscribe(node.key, node)
+        for node in self._nodes:
+            node.start()
+        if not self._running:
+            self._all_done.set()
+        self._check_sources()
+        return self
+
+    def _sources(self):
+        return [n for n in self._nodes if n.threaded and n.finals == 0 and n not in self._orphans]
+
+    def _check_sources(self):
+        # Once the job's sources are complete the
+        # subscribers without publishers in the job stop.
+        sources = self._sources()
+        with self._lock:
+            if self._sources_done.is_set() or not sources:
+                return
+            if any(n in self._running for n in sources):
+                return
+            self._sources_done.set()
+        for node in self._orphans:
+            node.put(0, _FINAL)
+
+    def _done(self, node):
+        with self._lock:
+            self._running.discard(node)
+            if not self._running:
+                self._all_done.set()
+        if isinstance(node, _Subscribe):
+            _broker.unsubscribe(node.key, node)
+        self._check_sources()
+
+    def _failed(self, node, e):
+        with self._lock:
+            if self._error is None:
+                self._error = e
+        self._cancelled.set()
+
+    def cancel(self):
+        """
+        Cancels the job, stopping all its operators.
+        """
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the job to complete.
+
+        Args:
+            timeout: Maximum time in seconds to wait, defaults to None meaning no limit.
+        Returns:
+            bool: True if the job completed, False if the timeout expired.
+        Raises:
+            Exception: The first exception raised by an operator of the job.
+        """
+        done = self._all_done.wait(timeout)
+        if done:
+            for node in self._nodes:
+                node.join()
+        if self._error is not None:
+            raise self._error
+        return done
+
+    def metrics(self):
+        """
+        Returns the throughput metrics of the job's operators.
+
+        Returns:
+            dict: Keyed by operator name, with the channel index appended
+            in brackets for operators in a parallel region. Each value is a dict
+            with the number of tuples processed `nTuplesProcessed` and submitted
+            `nTuplesSubmitted`, the time in seconds spent processing tuples
+            `busySeconds` and since the operator started `elapsedSeconds`, and
+            `tuplesPerSecond`, the number of tuples processed (or submitted by a
+            source) per elapsed second.
+        """
+        return {n.name: n.metrics.values() for n in self._nodes if n.threaded}
+
+
+##
+## Multi-process execution, enabled by the local.processes setting.
+##
+## The job's operators are partitioned into processing elements (PEs)
+## as Streams would: a stream leaving an isolate marker, a parallel
+## marker's connections to its channels and the channels' connections
+## to the end parallel marker cross PE boundaries, so each channel
+## of a parallel region is its own PE. A PE containing only markers
+## is combined with the PEs it submits to.
+##
+## Each PE is a process forked from the submitting process, the
+## tuples of a stream crossing a PE boundary are written to a ring
+## buffer in shared memory read by a thread in the receiving PE.
+## A ring has a single writer and a single reader, the copies to and
+## from the ring are made outside its lock, which only protects the
+## head and tail offsets.
+##
+
+# Default size in bytes of the ring buffer of each connection between PEs
+_BUFFER_SIZE = 4 * 1024 * 1024
+
+_HEADER = struct.Struct('<I')
+
+# Encoding of a value in a ring, a type byte followed by the
+# serialized form for bytes-like values (such as pickled Python
+# objects) or a pickled value.
+_RING_BYTES = b'\x00'
+_RING_PICKLED = b'\x01'
+_RING_FINAL = b'\x02'
+
+class _Ring(object):
+    def __init__(self, ctx, capacity):
+        self.capacity = capacity
+        self.buffer = mmap.mmap(-1, capacity)
+        self.head = ctx.RawValue(ctypes.c_uint64, 0)
+        self.tail = ctx.RawValue(ctypes.c_uint64, 0)
+        self.cond = ctx.Condition()
+        # Serializes writers within the sending PE
+        self._wlock = threading.Lock()
+
+    def _copy_in(self, pos, data):
+        offset = pos % self.capacity
+        n = min(len(data), self.capacity - offset)
+        self.buffer[offset:offset + n] = data[:n]
+        if n < len(data):
+            self.buffer[0:len(data) - n] = data[n:]
+
+    def _copy_out(self, pos, length):
+        offset = pos % self.capacity
+        n = min(length, self.capacity - offset)
+        data = self.buffer[offset:offset + n]
+        if n < length:
+            data += self.buffer[0:length - n]
+        return data
+
+    def write(self, value, cancelled):
+        if value is _FINAL:
+            parts = (_RING_FINAL,)
+        elif isinstance(value, (bytes, bytearray)):
+            parts = (_RING_BYTES, value)
+        elif isinstance(value, memoryview):
+            parts = (_RING_BYTES, value.cast('B'))
+        else:
+            parts = (_RING_PICKLED, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        length = sum(len(p) for p in parts)
+        size = _HEADER.size + length
+        if size > self.capacity:
+            raise ValueError("Tuple of %d bytes exceeds the local.buffer_size of %d bytes" % (length, self.capacity))
+        with self._wlock:
+            with self.cond:
+                while self.capacity - (self.head.value - self.tail.value) < size:
+                    if cancelled.is_set():
+                        raise _Cancelled()
+                    self.cond.wait(_POLL_SECONDS)
+                pos = self.head.value
+            self._copy_in(pos, _HEADER.pack(length))
+            pos += _HEADER.size
+            for p in parts:
+                self._copy_in(pos, p)
+                pos += len(p)
+            with self.cond:
+                self.head.value = pos
+                self.cond.notify_all()
+
+    def read(self, cancelled):
+        """
+        Returns the list of values written since the last read.
+        """
+        with self.cond:
+            while self.head.value == self.tail.value:
+                if cancelled.is_set():
+                    raise _Cancelled()
+                self.cond.wait(_POLL_SECONDS)
+            pos = self.tail.value
+            end = self.head.value
+        values = []
+        while pos < end:
+            length = _HEADER.unpack(self._copy_out(pos, _HEADER.size))[0]
+            data = self._copy_out(pos + _HEADER.size, length)
+            pos += _HEADER.size + length
+            kind = data[:1]
+            if kind == _RING_FINAL:
+                values.append(_FINAL)
+            elif kind == _RING_BYTES:
+                values.append(data[1:])
+            else:
+                values.append(pickle.loads(data[1:]))
+        with self.cond:
+            self.tail.value = end
+            self.cond.notify_all()
+        return values
+
+class _RingWriter(object):
+    """
+    Connection to a node in another PE.
+    """
+    def __init__(self, job, ring):
+        self.job = job
+        self.ring = ring
+
+    def put(self, iport, value):
+        self.ring.write(value, self.job._cancelled)
+
+
+class _ProcessJob(LocalJob):
+    """
+    LocalJob running each of its PEs in a separate process.
+    """
+    def __init__(self, graph, config):
+        super(_ProcessJob, self).__init__(graph, config)
+        self._ctx = multiprocessing.get_context('fork')
+        self._cancelled = self._ctx.Event()
+        self._results = self._ctx.Queue()
+        self._processes = []
+        self._metrics = {}
+        self._pes = self._partition()
+        pe_of = {}
+        for index, nodes in enumerate(self._pes):
+            for node in nodes:
+                pe_of[node] = index
+        size = int(config.get('local.buffer_size', _BUFFER_SIZE))
+        # Ring of each connection between PEs keyed by
+        # (sending node, receiving node, input port).
+        self._rings = {}
+        for node in self._nodes:
+            for dnode, iport in self._connections(node):
+                if pe_of[node] != pe_of[dnode]:
+                    self._rings[(node, dnode, iport)] = _Ring(self._ctx, size)
+        self._pe_of = pe_of
+
+    def _connections(self, node):
+        return [c for connections in node.outputs for c in connections]
+
+    @staticmethod
+    def _crosses(node, dnode):
+        if isinstance(node, _Router):
+            return True
+        if node.op.kind == '$Isolate$' and not isinstance(dnode, _Router):
+            return True
+        if dnode.op.kind == '$EndParallel$':
+            return True
+        return isinstance(node, _Publish)
+
+    def _partition(self):
+        """
+        Returns the list of PEs, each a list of nodes.
+        """
+        parent = {n: n for n in self._nodes}
+        def find(n):
+            while parent[n] is not n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+        def union(a, b):
+            ra, rb = find(a), find(b)
+            if ra is rb:
+                return False
+            parent[rb] = ra
+            return True
+
+        for node in self._nodes:
+            for dnode, _ in self._connections(node):
+                if not self._crosses(node, dnode):
+                    union(node, dnode)
+
+        changed = True
+        while changed:
+            changed = False
+            groups = {}
+            for node in self._nodes:
+                groups.setdefault(find(node), []).append(node)
+            for nodes in groups.values():
+                if any(n.threaded for n in nodes):
+                    continue
+                for node in nodes:
+                    if isinstance(node, _Router):
+                        continue
+                    for dnode, _ in self._connections(node):
+                        changed = union(node, dnode) or changed
+
+        pes = {}
+        for node in self._nodes:
+            pes.setdefault(find(node), []).append(node)
+        return list(pes.values())
+
+    def start(self):
+        for index in range(len(self._pes)):
+            p = self._ctx.Process(target=self._run_pe, args=(index,),
+                name='%s-pe%d' % (self.name, index), daemon=True)
+            p.start()
+            self._processes.append(p)
+        return self
+
+    def _run_pe(self, index):
+        # Runs in the PE's process, any event loop used
+        # by the submitting process was not forked.
+        runtime._loop = None
+        runtime._loop_lock = threading.Lock()
+        # Topics are only delivered between PEs of this job.
+        _broker._subscribers = {}
+
+        nodes = self._pes[index]
+        self._nodes = nodes
+        self._running = set(n for n in nodes if n.threaded)
+        receivers = []
+        error = None
+        try:
+            writers = {}
+            for (node, dnode, iport), ring in self._rings.items():
+                if self._pe_of[node] == index:
+                    writers[(node, dnode, iport)] = _RingWriter(self, ring)
+                elif self._pe_of[dnode] == index:
+                    receivers.append(threading.Thread(target=self._receive, args=(ring, dnode, iport), daemon=True))
+            for node in nodes:
+                for connections in node.outputs + getattr(node, 'channels', []):
+                    for i, (dnode, iport) in enumerate(connections):
+                        writer = writers.get((node, dnode, iport))
+                        if writer is not None:
+                            connections[i] = (writer, iport)
+            for node in nodes:
+                if node.threaded:
+                    node.setup()
+            for node in nodes:
+                node.start()
+            for receiver in receivers:
+                receiver.start()
+            # Only subscribers connected to publishers
+            # in the job receive tuples.
+            for node in self._orphans:
+                if node in self._running:
+                    node.put(0, _FINAL)
+            if not self._running:
+                self._all_done.set()
+            self._all_done.wait()
+            for node in nodes:
+                node.join()
+            error = self._error
+        except BaseException as e:
+            error = e
+            self._cancelled.set()
+        if error is not None:
+            try:
+                pickle.dumps(error)
+            except Exception:
+                error = RuntimeError(repr(error))
+        metrics = {n.name: n.metrics.values() for n in nodes if n.threaded}
+        self._results.put((index, metrics, error))
+
+    def _receive(self, ring, node, iport):
+        try:
+            while True:
+                for value in ring.read(self._cancelled):
+                    node.put(iport, value)
+                    if value is _FINAL:
+                        return
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            self._failed(node, e)
+
+    def _check_sources(self):
+        pass
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._metrics) < len(self._processes):
+            wait = _POLL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+            try:
+                index, metrics, error = self._results.get(timeout=wait)
+            except queue.Empty:
+                # A PE process that fails does not report its results.
+                for index, p in enumerate(self._processes):
+                    if index not in self._metrics and p.exitcode not in (0, None):
+                        self._metrics[index] = {}
+                        self._failed(None, RuntimeError("PE process %s exited with code %d" % (p.name, p.exitcode)))
+                continue
+            self._metrics[index] = metrics
+            if error is not None:
+                self._failed(None, error)
+        for p in self._processes:
+            p.join()
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def metrics(self):
+        values = {}
+        for metrics in self._metrics.values():
+            values.update(metrics)
+        return values
+
+
+def submit(graph, config=None):
+    """
+    Runs a topology's graph locally, waiting for it to complete.
+
+    Args:
+        graph: Topology.graph object.
+        config: Optional dict of settings:
+            * local.timeout - seconds after which the job is cancelled.
+            * local.queue_size - maximum number of tuples queued for an operator, defaults to 1024.
+            * local.processes - True to run each PE in its own process, see _ProcessJob.
+            * local.buffer_size - size in bytes of the shared memory buffer of each stream
+              between PEs run as processes, defaults to 4MB. A tuple must fit in the buffer.
+    Returns:
+        LocalJob: The completed job.
+    """
+    if config is None:
+        config = {}
+    if config.get('local.processes'):
+        job = _ProcessJob(graph, config).start()
+    else:
+        job = LocalJob(graph, config).start()
+    timeout = config.get('local.timeout')
+    if not job.wait(timeout):
+        job.cancel()
+        job.wait()
+    return job
@@ -5,6 +5,14 @@ import pickle
 import base64
 import sys
 import json
+import threading
+import itertools
+import collections
+import asyncio
+import inspect
+import functools
+import time
+from streamsx.topology.codec import _get_codec, _retained_loads, _is_table, _columns, _join_frames
 
 def __splpy_addDirToPath(dir):
     if os.path.isdir(dir):
@@ -18,6 +26,27 @@ def setupOperator(dir):
     __splpy_addDirToPath(os.path.join(pydir, 'packages'))
     #print("sys.path", sys.path)
 
+# Functions returning the GIL metrics of operators
+# in this PE, keyed by operator name. An operator
+# registers its function when its gilMetrics parameter
+# is set, see GILMetrics in splpy.h.
+_gil_metrics = {}
+
+def gil_metrics():
+    """
+    Returns the GIL metrics of the Python operators in this
+    processing element that were submitted with GIL metrics
+    enabled, see Topology(metrics=['gil']).
+
+    Returns:
+        dict: Keyed by operator name, each value is a dict with the
+        number of GIL acquisitions `acquisitions`, the total wait and hold
+        times in nanoseconds `waitNanos` and `holdNanos`, and the lists
+        `waitHistogram` and `holdHistogram` counting the acquisitions
+        with times under 1us, 10us, 100us, 1ms, 10ms and over 10ms.
+    """
+    return {name: values() for name, values in list(_gil_metrics.items())}
+
 def pickleReturn(function) :
     def _pickleReturn(v):
         return pickle.dumps(function(v))
@@ -29,22 +58,29 @@ def pickleReturn(function) :
 # The returned function must not maintain a reference
 # to the passed in value as it will be a memory view
 # object with memory that will become invalid after the call.
-def pickle_in(callable) :
+#
+# Functions with a pickle style input or output
+# accept the codecs for the input and output
+# (see streamsx.topology.codec), passed as the
+# operator parameters pyInCodec and pyOutCodec.
+# None is the default pickle codec.
+def pickle_in(callable, in_codec=None, out_codec=None) :
     ac = _getCallable(callable)
+    loads = _get_codec(in_codec).loads
     def _wf(v):
-        return ac(pickle.loads(v))
+        return ac(loads(v))
     return _wf
 
 # Given a callable 'callable', return a function
 # that loads an object from the serialized JSON input
 # and then calls 'callable' returning the callable's return
-def json_in(callable) :
+def json_in(callable, in_codec=None, out_codec=None) :
     ac = _getCallable(callable)
     def _wf(v):
         return ac(json.loads(v))
     return _wf
 
-def string_in(callable) :
+def string_in(callable, in_codec=None, out_codec=None) :
     ac = _getCallable(callable)
     def _wf(v):
         return ac(v)
@@ -52,14 +88,56 @@ def string_in(callable) :
 
 
 # Given a callable 'callable', return a function
-# that calls 'callable' with a python dictionary object 
+# that calls 'callable' with a named tuple object
 # form of an spltuple returning the callable's return
-def spltupleDict_in(callable) :
+def spltupleDict_in(callable, in_codec=None, out_codec=None) :
     ac = _getCallable(callable)
     def _wf(v):
         return ac(v)
     return _wf
 
+dict_in = spltupleDict_in
+
+# Named tuple classes representing SPL tuples
+# keyed by their attribute names.
+_splTupleClasses = {}
+
+# Return the class for SPL tuples with attributes
+# names, created once per set of names. Called by
+# the operators to create the class instances are
+# passed to callables for structured schemas.
+#
+# The class is a named tuple so that attributes
+# are accessed by name or position, item access
+# by attribute name is also supported for
+# compatibility with tuples passed as dictionaries.
+def _spl_tuple_class(names):
+    names = tuple(names)
+    cls = _splTupleClasses.get(names)
+    if cls is None:
+        base = collections.namedtuple('SPLTuple', names, rename=True)
+        index = {name:i for i, name in enumerate(names)}
+        def __getitem__(self, key, _getitem=tuple.__getitem__):
+            if isinstance(key, str):
+                return _getitem(self, index[key])
+            return _getitem(self, key)
+        def get(self, key, default=None):
+            return self[key] if key in index else default
+        def __reduce__(self):
+            return (_spl_tuple_new, (names, tuple(self)))
+        cls = type('SPLTuple', (base,), {'__slots__': (),
+            '__getitem__': __getitem__, 'get': get,
+            'keys': lambda self: list(names),
+            '__reduce__': __reduce__})
+        _splTupleClasses[names] = cls
+    return cls
+
+# Recreate an SPL tuple from its attribute names and
+# values when unpickled, the class is created at runtime
+# so cannot be pickled by reference.
+def _spl_tuple_new(names, values):
+    return _spl_tuple_class(names)._make(values)
+
 # Get the callable from the value
 # passed into the SPL PyFunction operator.
 #
@@ -127,40 +205,44 @@ def _getCallable(f):
 # The returned function must not maintain a reference
 # to the passed in value as it will be a memory view
 # object with memory that will become invalid after the call.
-def pickle_in__pickle_out(callable):
+def pickle_in__pickle_out(callable, in_codec=None, out_codec=None):
     ac = _getCallable(callable)
+    loads = _get_codec(in_codec).loads
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
-        rv = ac(pickle.loads(v))
+        rv = ac(loads(v))
         if rv is None:
             return None
-        return pickle.dumps(rv)
+        return dumps(rv)
     return _wf
 
-def json_in__pickle_out(callable):
+def json_in__pickle_out(callable, in_codec=None, out_codec=None):
     ac = _getCallable(callable)
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
         rv = ac(json.loads(v))
         if rv is None:
             return None
-        return pickle.dumps(rv)
+        return dumps(rv)
     return _wf
 
-def string_in__pickle_out(callable):
-    return object_in__pickle_out(callable)
+def string_in__pickle_out(callable, in_codec=None, out_codec=None):
+    return object_in__pickle_out(callable, in_codec, out_codec)
 
-def spltupleDict_in__pickle_out(callable):
-    return object_in__pickle_out(callable)
+def spltupleDict_in__pickle_out(callable, in_codec=None, out_codec=None):
+    return object_in__pickle_out(callable, in_codec, out_codec)
 
-def dict_in__pickle_out(callable):
-    return object_in__pickle_out(callable)
+def dict_in__pickle_out(callable, in_codec=None, out_codec=None):
+    return object_in__pickle_out(callable, in_codec, out_codec)
 
-def object_in__pickle_out(callable):
+def object_in__pickle_out(callable, in_codec=None, out_codec=None):
     ac = _getCallable(callable)
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
         rv = ac(v)
         if rv is None:
             return None
-        return pickle.dumps(rv)
+        return dumps(rv)
     return _wf
 
 ##################################################
@@ -172,55 +254,405 @@ def object_in__pickle_out(callable):
 # The returned function must not maintain a reference
 # to the passed in value as it will be a memory view
 # object with memory that will become invalid after the call.
-def pickle_in__json_out(callable):
+def pickle_in__json_out(callable, in_codec=None, out_codec=None):
     ac = _getCallable(callable)
+    loads = _get_codec(in_codec).loads
     def _wf(v):
-        rv = ac(pickle.loads(v))
+        rv = ac(loads(v))
         if rv is None:
             return None
         jrv = json.dumps(rv, ensure_ascii=False)
         return jrv
     return _wf
 
-def pickle_in__string_out(callable):
+def pickle_in__string_out(callable, in_codec=None, out_codec=None):
     ac = _getCallable(callable)
+    loads = _get_codec(in_codec).loads
     def _wf(v):
-        rv = ac(pickle.loads(v))
+        rv = ac(loads(v))
         if rv is None:
             return None
         return str(rv)
     return _wf
 
+##################################################
+
+##
+##  {pickle,json,string,dict} ->  {dict}
+##
+
+# The callable's return is converted to the structured
+# output tuple by the operator, by position from a tuple
+# (including a named tuple) or by attribute name from a dict.
+
+# The returned function must not maintain a reference
+# to the passed in value as it will be a memory view
+# object with memory that will become invalid after the call.
+def pickle_in__dict_out(callable, in_codec=None, out_codec=None):
+    ac = _getCallable(callable)
+    loads = _get_codec(in_codec).loads
+    def _wf(v):
+        return ac(loads(v))
+    return _wf
+
+def json_in__dict_out(callable, in_codec=None, out_codec=None):
+    return json_in(callable)
+
+def string_in__dict_out(callable, in_codec=None, out_codec=None):
+    return string_in(callable)
+
+def dict_in__dict_out(callable, in_codec=None, out_codec=None):
+    return spltupleDict_in(callable)
+
 # Given a function that returns an iterable
 # return a function that can be called
 # repeatably by a source operator returning
 # the next tuple in its pickled form
-def iterableSource(callable) :
+def iterableSource(callable, in_codec=None, out_codec=None) :
+  return _iterableSource(callable, _get_codec(out_codec).dumps)
+
+def _iterableSource(callable, dumps) :
   ac = _getCallable(callable)
-  iterator = iter(ac())
+  iterator = _syncIterator(ac())
   def _wf():
      try:
         while True:
             tuple = next(iterator)
             if not tuple is None:
-                return pickle.dumps(tuple)
+                return dumps(tuple)
      except StopIteration:
        return None
   return _wf
 
+##
+## asyncio support
+##
+## Coroutines and async generators are run on a single
+## event loop per PE, hosted by a daemon thread that is
+## started the first time it is needed. Operator threads
+## exchange values with the loop through thread safe futures,
+## waiting on a future releases the GIL.
+##
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# Return the PE's event loop, starting its thread if required.
+def _event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.run_forever()
+            t = threading.Thread(target=_run, name='streamsx.asyncio', daemon=True)
+            t.start()
+            _loop = loop
+        return _loop
+
+# Maximum number of values an async source produces
+# ahead of the operator submitting them.
+_ASYNC_QUEUE_SIZE = 1024
+
+_END = object()
+
+# Iterator over the values of an async iterable or of
+# the iterable returned by awaiting a coroutine, that are
+# produced on the PE's event loop. The producing task is
+# suspended while its bounded queue is full, so a slow
+# downstream applies back pressure without blocking the
+# loop for other sources. An exception raised by the
+# producer is raised by __next__.
+class _AsyncIterator:
+    def __init__(self, aw, maxsize=_ASYNC_QUEUE_SIZE):
+        self.loop = _event_loop()
+        self.queue = asyncio.run_coroutine_threadsafe(
+            self._start(aw, maxsize), self.loop).result()
+
+    async def _start(self, aw, maxsize):
+        queue = asyncio.Queue(maxsize)
+        self.task = asyncio.ensure_future(self._produce(aw, queue))
+        return queue
+
+    async def _produce(self, aw, queue):
+        try:
+            if inspect.isawaitable(aw):
+                aw = await aw
+            if aw is not None:
+                if hasattr(aw, '__aiter__'):
+                    async for v in aw:
+                        await queue.put(v)
+                else:
+                    for v in aw:
+                        await queue.put(v)
+            await queue.put((_END, None))
+        except BaseException as e:
+            # Includes CancelledError, not an Exception from Python 3.8,
+            # so the consumer always sees the end of the values.
+            await queue.put((_END, e))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.queue is None:
+            raise StopIteration()
+        v = asyncio.run_coroutine_threadsafe(self.queue.get(), self.loop).result()
+        if type(v) is tuple and len(v) == 2 and v[0] is _END:
+            self.queue = None
+            if v[1] is not None:
+                raise v[1]
+            raise StopIteration()
+        return v
+
+# Return an iterator for the return of a source callable,
+# which is an iterable, an async iterable or an awaitable
+# whose result is either.
+def _syncIterator(it):
+    if hasattr(it, '__aiter__') or inspect.isawaitable(it):
+        return _AsyncIterator(it)
+    return iter(it)
+
+# Callable that calls a coroutine function (or any function
+# returning an awaitable) with the settings of an asynchronous
+# map or for_each. Used by Stream.map_async and for_each_async.
+# With threads the callable is a regular function that is
+# called by a pool of that many threads rather than on the
+# event loop, used by Stream.map with threads.
+# With processes it is called by a pool of that many
+# forked processes, used by Stream.map with processes.
+class _AsyncFunction:
+   def __init__(self, callable, max_in_flight, ordered, threads=None, processes=None):
+       self.callable = callable
+       self.max_in_flight = max_in_flight
+       self.ordered = ordered
+       self.threads = threads
+       self.processes = processes
+   def __call__(self, v):
+       return self.callable(v)
+
+# Runs calls to an _AsyncFunction concurrently on the PE's
+# event loop, used by PyFunctionAsync.
+#
+# add() is called by the operator for each input value, it
+# blocks while max_in_flight calls are outstanding, a call is
+# outstanding until its result has been taken.
+# take() is called repeatedly by the operator's thread and
+# returns a tuple of the serialized results that are ready,
+# in input order when ordered is true. None results are dropped.
+# join() waits until all results have been taken, it is
+# called on final punctuation.
+# For for_each_async dumps is None and no results are kept.
+# An exception raised by a call is raised by the next call
+# to any of the methods.
+class _AsyncMap:
+   def __init__(self, callable, loads, dumps):
+       af = _getCallable(callable)
+       self.callable = af.callable
+       self.ordered = af.ordered
+       self.loads = loads
+       self.dumps = dumps
+       if getattr(af, 'threads', None):
+           import concurrent.futures
+           self.executor = concurrent.futures.ThreadPoolExecutor(af.threads)
+       elif getattr(af, 'processes', None):
+           self.executor, self.callable = _process_pool(af.processes, self.callable, loads, dumps)
+           self.loads = _payload
+           if dumps is not None:
+               self.dumps = _identity
+       else:
+           self.executor = None
+           self.loop = _event_loop()
+       self.max_in_flight = af.max_in_flight
+       self.slots = threading.BoundedSemaphore(af.max_in_flight)
+       self.cond = threading.Condition()
+       self.results = collections.deque()
+       self.reorder = {}
+       self.seq = 0
+       self.next = 0
+       self.pending = 0
+       self.error = None
+
+   def add(self, v):
+       v = self.loads(v)
+       self.slots.acquire()
+       with self.cond:
+           self._check()
+           seq = self.seq
+           self.seq += 1
+           self.pending += 1
+       if self.executor is not None:
+           future = self.executor.submit(self.callable, v)
+       else:
+           future = asyncio.run_coroutine_threadsafe(self._call(v), self.loop)
+       future.add_done_callback(functools.partial(self._done, seq))
+
+   async def _call(self, v):
+       rv = self.callable(v)
+       if inspect.isawaitable(rv):
+           rv = await rv
+       return rv
+
+   # Called on the event loop or pool thread as each call completes.
+   # The call's slot is released when its result is taken, so
+   # completed results waiting to be taken are also bounded.
+   def _done(self, seq, future):
+       if self.dumps is None:
+           self.slots.release()
+       with self.cond:
+           try:
+               rv = future.result()
+           except Exception as e:
+               if self.error is None:
+                   self.error = e
+               rv = None
+           if self.dumps is None:
+               self.pending -= 1
+           elif self.ordered:
+               self.reorder[seq] = rv
+               while self.next in self.reorder:
+                   self.results.append(self.reorder.pop(self.next))
+                   self.next += 1
+           else:
+               self.results.append(rv)
+           self.cond.notify_all()
+
+   def take(self, timeout):
+       with self.cond:
+           if not self.results and self.error is None:
+               self.cond.wait(timeout)
+           values = self.results
+           self.results = collections.deque()
+           self.pending -= len(values)
+           self.cond.notify_all()
+       for _ in values:
+           self.slots.release()
+       self._check()
+       return tuple(self.dumps(v) for v in values if v is not None)
+
+   def join(self):
+       with self.cond:
+           while self.pending and self.error is None:
+               self.cond.wait()
+           self._check()
+
+   def _check(self):
+       if self.error is not None:
+           raise self.error
+
+##
+## Process pool for _AsyncMap
+##
+## Worker processes are forked from the PE so inherit the
+## callable and codecs without them being pickled, each pool's
+## are registered under a key before its workers are forked and
+## the key is sent with each call. The serialized input value is
+## sent to a worker as is, the worker deserializes it, calls the
+## callable and returns the serialized result, so values are not
+## pickled again to cross the process boundary.
+##
+_process_states = {}
+_process_keys = itertools.count(1)
+
+def _process_call(key, v):
+    callable, loads, dumps = _process_states[key]
+    rv = callable(loads(v))
+    if rv is None or dumps is None:
+        return None
+    return _join_frames(dumps(rv))
+
+# Returns the pool and the function it calls with each value.
+def _process_pool(processes, callable, loads, dumps):
+    import concurrent.futures
+    import multiprocessing
+    key = next(_process_keys)
+    _process_states[key] = (callable, loads, dumps)
+    kwargs = {}
+    # Before Python 3.7 the pool uses the default start
+    # method, which is fork on the platforms supported by Streams.
+    if sys.version_info >= (3, 7):
+        kwargs['mp_context'] = multiprocessing.get_context('fork')
+    executor = concurrent.futures.ProcessPoolExecutor(processes, **kwargs)
+    return executor, functools.partial(_process_call, key)
+
+# Input values are copied from the tuple's memory
+# as they are sent to a worker after the call.
+def _payload(v):
+    if isinstance(v, memoryview):
+        return bytes(v)
+    return v
+
+##
+## {pickle,json,string,dict,binary} -> {pickle} asynchronously
+##
+## Input values are retained until the call runs
+## so must not refer to the memory view.
+##
+def pickle_in__pickle_async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, _retained_loads(_get_codec(in_codec)), _get_codec(out_codec).dumps)
+
+def json_in__pickle_async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, json.loads, _get_codec(out_codec).dumps)
+
+def string_in__pickle_async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, _identity, _get_codec(out_codec).dumps)
+
+def dict_in__pickle_async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, _identity, _get_codec(out_codec).dumps)
+
+def binary_in__pickle_async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, bytes, _get_codec(out_codec).dumps)
+
+def pickle_in__async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, _retained_loads(_get_codec(in_codec)), None)
+
+def json_in__async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, json.loads, None)
+
+def string_in__async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, _identity, None)
+
+def dict_in__async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, _identity, None)
+
+def binary_in__async(callable, in_codec=None, out_codec=None):
+    return _AsyncMap(callable, bytes, None)
+
+# Wrap a source function returning a single serialized
+# value per call (None once exhausted) to return a tuple
+# of up to size serialized values per call, reducing
+# the number of times the operator acquires the GIL.
+# A tuple is returned as a serialized value may itself
+# be a list of frames.
+# Used by PyFunctionSource with the batch parameter.
+def _batchSource(wf, size):
+    def _bwf():
+        values = []
+        for _ in range(size):
+            v = wf()
+            if v is None:
+                break
+            values.append(v)
+        return tuple(values) if values else None
+    return _bwf
+
 # Iterator that wraps another iterator
 # to discard any values that are None
 # and pickle any returned value.
+# dumps replaces pickling, e.g. to
+# return object references.
 class _PickleIterator:
-   def __init__(self, it):
+   def __init__(self, it, dumps=pickle.dumps):
        self.it = iter(it)
+       self.dumps = dumps
    def __iter__(self):
        return self
    def __next__(self):
        nv = next(self.it)
        while nv is None:
           nv = next(self.it)
-       return pickle.dumps(nv)
+       return self.dumps(nv)
 
 # Return a function that depickles
 # the input tuple calls callable
@@ -235,38 +667,688 @@ class _PickleIterator:
 # The returned function must not maintain a reference
 # to the passed in value as it will be a memory view
 # object with memory that will become invalid after the call.
-def pickle_in__pickle_iter(callable):
+def pickle_in__pickle_iter(callable, in_codec=None, out_codec=None):
     ac =_getCallable(callable)
+    loads = _get_codec(in_codec).loads
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
-        irv = ac(pickle.loads(v))
+        irv = ac(loads(v))
         if irv is None:
             return None
-        return _PickleIterator(irv)
+        return _PickleIterator(irv, dumps)
     return _wf
 
-def json_in__pickle_iter(callable):
+def json_in__pickle_iter(callable, in_codec=None, out_codec=None):
     ac =_getCallable(callable)
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
         irv = ac(json.loads(v))
         if irv is None:
             return None
-        return _PickleIterator(irv)
+        return _PickleIterator(irv, dumps)
     return _wf
 
-def string_in__pickle_iter(callable):
+def string_in__pickle_iter(callable, in_codec=None, out_codec=None):
     ac =_getCallable(callable)
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
         irv = ac(v)
         if irv is None:
             return None
-        return _PickleIterator(irv)
+        return _PickleIterator(irv, dumps)
     return _wf
 
-def spltupleDict_in__pickle_iter(callable):
+def dict_in__pickle_iter(callable, in_codec=None, out_codec=None):
+    return spltupleDict_in__pickle_iter(callable, in_codec, out_codec)
+
+def spltupleDict_in__pickle_iter(callable, in_codec=None, out_codec=None):
     ac =_getCallable(callable)
+    dumps = _get_codec(out_codec).dumps
     def _wf(v):
         irv = ac(v)
         if irv is None:
             return None
-        return _PickleIterator(irv)
+        return _PickleIterator(irv, dumps)
     return _wf
+
+# Collects input values into a list that is returned
+# in its pickled form once it contains size values.
+# dumps pickles the list.
+# flush() returns the pickled list of any values
+# collected so far, or None if there are none.
+# loads converts the input value to an object,
+# None when the value is passed through as-is.
+# Used by PyFunctionBatch.
+class _Batch:
+   def __init__(self, size, loads, dumps):
+       self.size = size
+       self.loads = loads
+       self.dumps = dumps
+       self.values = []
+   def add(self, v):
+       self.values.append(v if self.loads is None else self.loads(v))
+       if len(self.values) >= self.size:
+           return self.flush()
+       return None
+   def flush(self):
+       if not self.values:
+           return None
+       values = self.values
+       self.values = []
+       return self.dumps(values)
+
+# The returned object must not maintain a reference
+# to the passed in value as it will be a memory view
+# object with memory that will become invalid after the call.
+# Batched values are retained across calls so must not
+# refer to the memory view.
+def pickle_in__pickle_batch(size, in_codec=None, out_codec=None):
+    return _Batch(size, _retained_loads(_get_codec(in_codec)), _get_codec(out_codec).dumps)
+
+def json_in__pickle_batch(size, in_codec=None, out_codec=None):
+    return _Batch(size, json.loads, _get_codec(out_codec).dumps)
+
+def string_in__pickle_batch(size, in_codec=None, out_codec=None):
+    return _Batch(size, None, _get_codec(out_codec).dumps)
+
+def dict_in__pickle_batch(size, in_codec=None, out_codec=None):
+    return _Batch(size, None, _get_codec(out_codec).dumps)
+
+# Callable that executes a chain of fused map, filter
+# and flat_map stages against a single input value.
+# Calling it returns an iterator of the values that
+# are produced by the final stage, so that it can be
+# wrapped by the *_in__pickle_iter functions.
+# Used by PyFunctionPipeline.
+#
+# Each stage is a tuple of (kind, callable) where kind is
+# one of 'map', 'filter' or 'flat_map' and the semantics
+# match PyFunctionTransform, PyFunctionFilter and
+# PyFunctionMultiTransform respectively.
+class _Pipeline:
+   def __init__(self, stages):
+       self.stages = stages
+   def __call__(self, v):
+       return self._apply(0, v)
+   def _apply(self, idx, v):
+       stages = self.stages
+       while idx < len(stages):
+           kind, fn = stages[idx]
+           idx += 1
+           if kind == 'map':
+               v = fn(v)
+               if v is None:
+                   return
+           elif kind == 'filter':
+               if not fn(v):
+                   return
+           else:
+               irv = fn(v)
+               if irv is None:
+                   return
+               for item in irv:
+                   if item is not None:
+                       yield from self._apply(idx, item)
+               return
+       yield v
+
+# Callable that applies a filter to a columnar batch, a dict
+# of equal length arrays. The filter returns a boolean mask
+# selecting the rows to keep, the returned batch contains
+# only those rows, or is None when no rows are selected.
+# Used by Stream.filter for columnar streams.
+class _ColumnarFilter:
+   def __init__(self, callable):
+       self.callable = callable
+   def __call__(self, batch):
+       import numpy
+       mask = numpy.asarray(self.callable(batch), dtype=bool)
+       if mask.all():
+           return batch
+       if not mask.any():
+           return None
+       return {name: col[mask] for name, col in batch.items()}
+
+# Callable returning an iterator of columnar batches of at
+# most size rows from the tables returned by callable,
+# either a single table or an iterable of tables. A table
+# is a dict of arrays, a record array or a DataFrame.
+# A size of None submits each table as a single batch.
+# Used by Topology.columnar_source.
+class _ColumnarSource:
+   def __init__(self, callable, size=None):
+       self.callable = callable
+       self.size = size
+   def __call__(self):
+       tables = self.callable()
+       if tables is None:
+           return
+       if _is_table(tables):
+           tables = [tables]
+       for table in tables:
+           if table is None:
+               continue
+           columns = _columns(table)
+           rows = len(columns[0][1]) if columns else 0
+           size = self.size or rows
+           for start in range(0, rows, size):
+               yield {name: col[start:start+size] for name, col in columns}
+
+##
+## Python objects passed by reference between Python
+## operators in the same PE, the pyref style.
+## See Stream.low_latency(by_reference=True)
+##
+## A producing wrapper stores the objects it returns in a
+## thread local table and returns a key for each, which is
+## submitted as the SPL uint64 attribute __spl_pr.
+## The key is the producer's id in the upper 32 bits and
+## the index of the object in the producer's current
+## generation in the lower 32 bits.
+##
+## Consumers fused into the same PE are called synchronously
+## on the submitting thread, so they look up the object before
+## the producer's next call starts a new generation, releasing
+## the previous objects. Thus no serialization occurs and
+## each producer keeps the objects for at most one call alive.
+## Within a generation the objects are read in the order they
+## were produced, so reading an object releases the objects
+## before it, which all consumers have read.
+##
+## The functions accept the codec arguments, which
+## only apply to a pickle style input or output.
+##
+class _ObjectRefs(threading.local):
+    def __init__(self):
+        self.objects = {}
+
+_objectRefs = _ObjectRefs()
+_objectRefIds = itertools.count(1)
+
+# Objects produced by a single call of a producer,
+# released once objects after them are read.
+class _RefGeneration:
+    def __init__(self):
+        self.objs = collections.deque()
+        # Index of the first object not yet released
+        self.first = 0
+    def add(self, v):
+        self.objs.append(v)
+        return self.first + len(self.objs) - 1
+    def get(self, index):
+        while self.first < index and self.objs:
+            self.objs.popleft()
+            self.first += 1
+        if index < self.first:
+            raise IndexError(index)
+        return self.objs[index - self.first]
+
+# Replaces pickle.dumps for a producer of
+# pyref style values. Calling an instance starts
+# a new generation containing just the object.
+class _RefDumps:
+    def __init__(self):
+        self.pid = next(_objectRefIds)
+    def __call__(self, v):
+        gen = _RefGeneration()
+        _objectRefs.objects[self.pid] = gen
+        return (self.pid << 32) | gen.add(v)
+    # Start a new generation returning a function
+    # that adds objects to it, used when a single
+    # call produces multiple values.
+    def generation(self):
+        gen = _RefGeneration()
+        _objectRefs.objects[self.pid] = gen
+        key = self.pid << 32
+        def _dumps(v):
+            return key | gen.add(v)
+        return _dumps
+
+def _pyref_loads(key):
+    try:
+        return _objectRefs.objects[key >> 32].get(key & 0xffffffff)
+    except (KeyError, IndexError):
+        raise RuntimeError("Python object reference " + str(key) +
+            " is not valid in this thread, objects can only be passed"
+            " by reference between operators fused in the same PE"
+            " without threaded ports")
+
+def _identity(v):
+    return v
+
+def _json_dumps(v):
+    return json.dumps(v, ensure_ascii=False)
+
+# Generic wrappers used for the pyref style,
+# loads converts the input value to an object
+# passed to callable, dumps converts the
+# return (or returned values) from callable.
+def _object_wrapper(callable, loads, dumps):
+    ac = _getCallable(callable)
+    def _wf(v):
+        rv = ac(loads(v))
+        if rv is None:
+            return None
+        return dumps(rv)
+    return _wf
+
+def _object_iter_wrapper(callable, loads, dumps):
+    ac = _getCallable(callable)
+    def _wf(v):
+        irv = ac(loads(v))
+        if irv is None:
+            return None
+        if isinstance(dumps, _RefDumps):
+            return _PickleIterator(irv, dumps.generation())
+        return _PickleIterator(irv, dumps)
+    return _wf
+
+def pyref_in(callable, in_codec=None, out_codec=None):
+    ac = _getCallable(callable)
+    def _wf(v):
+        return ac(_pyref_loads(v))
+    return _wf
+
+##
+##  {pickle,json,string,dict,pyref} -> {pyref}
+##
+def pickle_in__pyref_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _get_codec(in_codec).loads, _RefDumps())
+
+def json_in__pyref_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, json.loads, _RefDumps())
+
+def string_in__pyref_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _RefDumps())
+
+def dict_in__pyref_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _RefDumps())
+
+def pyref_in__pyref_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _pyref_loads, _RefDumps())
+
+##
+##  {pyref} -> {pickle,json,string}
+##
+def pyref_in__pickle_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _pyref_loads, _get_codec(out_codec).dumps)
+
+def pyref_in__json_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _pyref_loads, _json_dumps)
+
+def pyref_in__dict_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _pyref_loads, _identity)
+
+def pyref_in__string_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _pyref_loads, str)
+
+def pickle_in__pyref_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _get_codec(in_codec).loads, _RefDumps())
+
+def json_in__pyref_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, json.loads, _RefDumps())
+
+def string_in__pyref_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _identity, _RefDumps())
+
+def dict_in__pyref_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _identity, _RefDumps())
+
+def pyref_in__pyref_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _pyref_loads, _RefDumps())
+
+def pyref_in__pickle_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _pyref_loads, _get_codec(out_codec).dumps)
+
+def iterableSource__pyref_out(callable, in_codec=None, out_codec=None):
+    return _iterableSource(callable, _RefDumps())
+
+##
+## Binary data, the binary style (CommonSchema.Binary).
+##
+## Input values are read-only memory view objects over the
+## SPL blob, passed to the callable without copying, so the
+## memory is only valid during the call.
+## Output values are bytes-like objects, any object other than
+## bytes is returned as a single frame which the operator
+## copies into the SPL blob using the buffer protocol.
+##
+def _binary_dumps(v):
+    if isinstance(v, bytes):
+        return v
+    return [v]
+
+def binary_in(callable, in_codec=None, out_codec=None):
+    return string_in(callable)
+
+##
+##  {binary} -> {pickle,json,string,dict,binary,pyref}
+##
+def binary_in__pickle_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _get_codec(out_codec).dumps)
+
+def binary_in__json_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _json_dumps)
+
+def binary_in__string_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, str)
+
+def binary_in__dict_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _identity)
+
+def binary_in__binary_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _binary_dumps)
+
+def binary_in__pyref_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _RefDumps())
+
+def binary_in__pickle_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _identity, _get_codec(out_codec).dumps)
+
+def binary_in__pyref_iter(callable, in_codec=None, out_codec=None):
+    return _object_iter_wrapper(callable, _identity, _RefDumps())
+
+# Batched values are retained across calls
+# so are copied from the memory view.
+def binary_in__pickle_batch(size, in_codec=None, out_codec=None):
+    return _Batch(size, bytes, _get_codec(out_codec).dumps)
+
+##
+##  {pickle,json,string,dict,pyref} -> {binary}
+##
+def pickle_in__binary_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _get_codec(in_codec).loads, _binary_dumps)
+
+def json_in__binary_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, json.loads, _binary_dumps)
+
+def string_in__binary_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _binary_dumps)
+
+def dict_in__binary_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _identity, _binary_dumps)
+
+def pyref_in__binary_out(callable, in_codec=None, out_codec=None):
+    return _object_wrapper(callable, _pyref_loads, _binary_dumps)
+
+##
+## Python execution metrics, enabled for an operator
+## by the pythonMetrics parameter, see Topology(metrics=).
+##
+## The operator creates its wrapper function using
+## _metered_wrapper, which times the wrapper returned
+## by the named factory and wraps the codecs to time
+## (de)serialization and count the serialized bytes.
+## The cumulative values are kept in a list, the
+## _metrics attribute of the returned function, which
+## the operator copies to its custom metrics, see
+## PythonMetrics in splpy.h.
+##
+## Without the parameter the wrappers are used
+## directly so there is no overhead.
+##
+
+# Indexes of the values in the metrics list
+_M_CALLS = 0
+_M_CALL_NANOS = 1
+_M_LOADS_NANOS = 2
+_M_DUMPS_NANOS = 3
+_M_IN_BYTES = 4
+_M_OUT_BYTES = 5
+_M_DROPPED = 6
+_M_CPU_NANOS = 7
+
+def _nanos():
+    return int(time.perf_counter() * 1e9)
+
+def _cpu_nanos():
+    return int(time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID) * 1e9)
+
+class _CallMetrics:
+    def __init__(self):
+        self.values = [0] * 8
+
+    # Call fn, adding its elapsed time excluding any
+    # (de)serialization to the call time and its thread
+    # CPU time to the CPU time.
+    def timed(self, fn, *args):
+        v = self.values
+        codec_nanos = v[_M_LOADS_NANOS] + v[_M_DUMPS_NANOS]
+        cpu = _cpu_nanos()
+        start = _nanos()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = _nanos() - start
+            v[_M_CPU_NANOS] += _cpu_nanos() - cpu
+            v[_M_CALL_NANOS] += elapsed - (v[_M_LOADS_NANOS] + v[_M_DUMPS_NANOS] - codec_nanos)
+
+def _frames_size(value):
+    if isinstance(value, list):
+        return sum(memoryview(f).nbytes for f in value)
+    return memoryview(value).nbytes
+
+# Codec that times another codec and counts
+# the serialized bytes it reads or writes.
+class _MeteredCodec:
+    def __init__(self, codec, metrics):
+        self.codec = codec
+        self.values = metrics.values
+    def __getattr__(self, name):
+        return getattr(self.codec, name)
+    def loads(self, buffer):
+        start = _nanos()
+        value = self.codec.loads(buffer)
+        self.values[_M_LOADS_NANOS] += _nanos() - start
+        self.values[_M_IN_BYTES] += memoryview(buffer).nbytes
+        return value
+    def dumps(self, value):
+        start = _nanos()
+        frames = self.codec.dumps(value)
+        self.values[_M_DUMPS_NANOS] += _nanos() - start
+        self.values[_M_OUT_BYTES] += _frames_size(frames)
+        return frames
+
+# Iterator returned by a metered flat_map, the time
+# to produce each value is part of the call time.
+class _MeteredIterator:
+    def __init__(self, it, metrics):
+        self.it = it
+        self.metrics = metrics
+    def __iter__(self):
+        return self
+    def __next__(self):
+        return self.metrics.timed(next, self.it)
+
+# Operator kinds whose wrapper returns an iterator
+_ITER_KINDS = frozenset(['PyFunctionMultiTransform', 'PyFunctionPipeline'])
+
+# Tests of a wrapper's return for the tuple being dropped
+_DROPPED = {
+    'PyFunctionFilter': lambda rv: not rv,
+    'PyFunctionTransform': lambda rv: rv is None,
+}
+
+def _metered_wrapper(wrapper, kind, callable, in_codec=None, out_codec=None):
+    kind = kind.split('::')[-1]
+    metrics = _CallMetrics()
+    wf = globals()[wrapper](callable,
+        _MeteredCodec(_get_codec(in_codec), metrics),
+        _MeteredCodec(_get_codec(out_codec), metrics))
+    values = metrics.values
+    dropped = _DROPPED.get(kind)
+    if kind in _ITER_KINDS:
+        def _mwf(*args):
+            values[_M_CALLS] += 1
+            rv = metrics.timed(wf, *args)
+            if rv is None:
+                return None
+            return _MeteredIterator(rv, metrics)
+    else:
+        def _mwf(*args):
+            values[_M_CALLS] += 1
+            rv = metrics.timed(wf, *args)
+            if dropped is not None and dropped(rv):
+                values[_M_DROPPED] += 1
+            return rv
+    _mwf._metrics = values
+    return _mwf
+
+##
+## On-demand profiling, enabled for an operator by the
+## pyProfile parameter, see Topology(profiling=True).
+##
+## The operator wraps its wrapper function using _Profiler,
+## which runs calls under cProfile for a number of tuples
+## or seconds once profiling is requested, and then writes
+## the statistics to a .pstats file in the profile directory
+## of the PE's data directory.
+##
+## Profiling is requested either:
+##   * At submission time by the submission parameter
+##     streamsx.topology.profile listing operators
+##     to profile from their first tuple.
+##   * At runtime by creating a control file named after
+##     the operator in the profile directory, which is
+##     removed when profiling starts.
+##
+## A request is the operator name (or * for all operators)
+## optionally followed by :tuples=N or :seconds=N, a
+## control file contains just the optional tuples=N or
+## seconds=N. Multiple operators are separated by commas
+## in the submission parameter.
+##
+
+# Default number of seconds profiled for a request
+_PROFILE_SECONDS = 60.0
+
+# Minimum seconds between checks for a control file
+_PROFILE_CHECK_SECONDS = 5.0
+
+def _profile_limit(spec):
+    """
+    Returns the (tuples, seconds) limit for a request,
+    one of which is None.
+    """
+    spec = spec.strip()
+    if not spec:
+        return None, _PROFILE_SECONDS
+    key, _, value = spec.partition('=')
+    key = key.strip()
+    if key == 'tuples':
+        return int(value), None
+    if key == 'seconds':
+        return None, float(value)
+    raise ValueError("Invalid profile request: " + spec)
+
+def _profile_request(requests, name):
+    """
+    Returns the limit for the operator `name` from the
+    submission parameter value, None if it is not requested.
+    """
+    for request in requests.split(','):
+        op, _, spec = request.strip().partition(':')
+        if op and (op == name or op == '*'):
+            return _profile_limit(spec)
+    return None
+
+class _Profiler:
+    def __init__(self, function, kind, name, data_dir, requests=None):
+        self.function = function
+        self.iterates = kind.split('::')[-1] in _ITER_KINDS
+        self.name = name
+        self.dir = os.path.join(data_dir or os.getcwd(), 'profile')
+        self.control = os.path.join(self.dir, name)
+        self._lock = threading.Lock()
+        self._profile = None
+        self._next_check = 0.0
+        if requests:
+            limit = _profile_request(requests, name)
+            if limit is not None:
+                self._start(*limit)
+
+    def _start(self, tuples, seconds):
+        import cProfile
+        self._profile = cProfile.Profile()
+        self._tuples = tuples
+        self._end = None if seconds is None else time.monotonic() + seconds
+
+    # Check for a control file, at most every
+    # _PROFILE_CHECK_SECONDS to limit file system access.
+    def _check(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + _PROFILE_CHECK_SECONDS
+        try:
+            with open(self.control) as f:
+                spec = f.read()
+            os.remove(self.control)
+        except OSError:
+            return
+        self._start(*_profile_limit(spec))
+
+    def _done(self):
+        if self._tuples is not None:
+            self._tuples -= 1
+            return self._tuples <= 0
+        return time.monotonic() >= self._end
+
+    def _completed(self):
+        if self._profile is not None and self._done():
+            self._dump()
+
+    def _dump(self):
+        with self._lock:
+            profile = self._profile
+            self._profile = None
+        if profile is None:
+            return None
+        os.makedirs(self.dir, exist_ok=True)
+        path = os.path.join(self.dir, '%s.%d.%d.pstats' % (self.name, os.getpid(), int(time.time())))
+        profile.dump_stats(path)
+        return path
+
+    def _profiled(self, fn, *args):
+        # Only one thread is profiled at a time, calls
+        # from other threads while profiling are not profiled.
+        if not self._lock.acquire(False):
+            return fn(*args)
+        try:
+            profile = self._profile
+            if profile is None:
+                return fn(*args)
+            profile.enable()
+            try:
+                return fn(*args)
+            finally:
+                profile.disable()
+        finally:
+            self._lock.release()
+
+    def __call__(self, *args):
+        if self._profile is None:
+            self._check()
+            if self._profile is None:
+                return self.function(*args)
+        rv = self._profiled(self.function, *args)
+        if self.iterates and rv is not None:
+            return _ProfiledIterator(rv, self)
+        self._completed()
+        return rv
+
+# Iterator returned by a profiled flat_map, producing
+# each value is profiled while the profile is active
+# and the call is complete once the iterator is exhausted.
+class _ProfiledIterator:
+    def __init__(self, it, profiler):
+        self.it = it
+        self.profiler = profiler
+    def __iter__(self):
+        return self
+    def __next__(self):
+        try:
+            return self.profiler._profiled(next, self.it)
+        except StopIteration:
+            self.profiler._completed()
+            raise
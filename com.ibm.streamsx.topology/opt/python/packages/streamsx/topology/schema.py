@@ -3,14 +3,42 @@
 import enum
 
 class StreamSchema(object) :
-    """SPL stream schema."""
+    """SPL stream schema.
+
+    A schema is defined by its SPL tuple type, for example
+    ``StreamSchema('tuple<int64 id, float64 value>')``.
+
+    Python callables receive tuples of a structured schema
+    as named tuples, whose attributes are the schema's attributes.
+    """
 
     def __init__(self, schema):
         self.__schema=schema.strip()
+        self.__attributes=None
 
     def schema(self):
         return self.__schema;
 
+    def attributes(self):
+        """
+        Returns the attributes of the schema.
+
+        Returns:
+            list of (name, type) tuples in declaration order,
+            where type is the SPL type of the attribute.
+        Raises:
+            ValueError: if the schema is not a SPL tuple type.
+        """
+        if self.__attributes is None:
+            self.__attributes = _parse_attributes(self.__schema)
+        return list(self.__attributes)
+
+    def names(self):
+        """
+        Returns the attribute names of the schema.
+        """
+        return [name for name, _ in self.attributes()]
+
     def spl_json(self):
         _splj = {}
         _splj["type"] = 'spltype'
@@ -26,8 +54,49 @@ class StreamSchema(object) :
         new_schema = base[:-1] + ',' + extends[6:]
         return StreamSchema(new_schema)
 
+def _split_top_level(text, sep):
+    """
+    Splits text on sep ignoring any separators
+    nested in <>, for example in map<rstring,int32>.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c == '<':
+            depth += 1
+        elif c == '>':
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+def _parse_attributes(schema):
+    """
+    Parses the attributes of a SPL tuple type
+    returning a list of (name, type) tuples.
+    """
+    if not (schema.startswith('tuple<') and schema.endswith('>')):
+        raise ValueError("Schema is not a SPL tuple type: " + schema)
+    attributes = []
+    for attr in _split_top_level(schema[6:-1], ','):
+        attr = attr.strip()
+        # the name follows the last space, types such as
+        # map<rstring, int32> may contain spaces.
+        idx = attr.rfind(' ')
+        if idx <= 0 or attr.rfind('>') > idx:
+            raise ValueError("Invalid attribute '" + attr + "' in schema: " + schema)
+        attributes.append((attr[idx+1:], attr[:idx].strip()))
+    return attributes
+
 # XML = StreamSchema("tuple<xml document>")
 
+# Reference to a Python object passed between Python
+# operators in the same PE, only used in the generated graph.
+_PyObjectReference = StreamSchema("tuple<uint64 __spl_pr>")
+
 @enum.unique
 class CommonSchema(enum.Enum):
     """
@@ -36,7 +105,7 @@ class CommonSchema(enum.Enum):
     Python - Stream constains Python objects
     Json - Stream contains JSON objects. Streams with schema Json can be published and subscribed between Streams applications implemented in different languages.
     String - Stream contains strings. Streams with schema String can be published and subscribed between Streams applications implemented in different languages.
-    Binary - Stream contains binary tuples. NOT YET SUPPORTED IN Python.
+    Binary - Stream contains binary tuples. Each tuple is passed to Python callables as a read-only memoryview, which is only valid during the call. Callables return a bytes-like object for a stream with schema Binary. Streams with schema Binary can be published and subscribed between Streams applications implemented in different languages.
     """
     Python = StreamSchema("tuple<blob __spl_po>")
     Json = StreamSchema("tuple<rstring jsonString>")
@@ -49,5 +118,11 @@ class CommonSchema(enum.Enum):
     def spl_json(self):
         return self.value.spl_json()
 
+    def attributes(self):
+        return self.value.attributes()
+
+    def names(self):
+        return self.value.names()
+
     def extend(self, schema):
         return self.value.extend(schema)
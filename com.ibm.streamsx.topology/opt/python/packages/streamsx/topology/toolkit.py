@@ -0,0 +1,638 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+"""
+Creation of an SPL toolkit from a topology's graph, used by the
+TOOLKIT context, see streamsx.topology.context.submit.
+
+The SPL main composite is generated in Python, following the
+Java generator (com.ibm.streamsx.topology.generator.spl) for the
+subset of features a Python topology's graph contains: Python
+functional operators, publish and subscribe, union, isolate,
+low latency, autonomous and parallel regions, views and
+submission parameters. Thus no JVM is started to create the toolkit.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+# Deployment configuration keys, see com.ibm.streamsx.topology.context.ContextProperties
+_TOOLKIT_DIR = "topology.toolkitDir"
+_COMPILE_INSTALL_DIR = "topology.install.compile"
+
+# Parameter types, see com.ibm.streamsx.topology.builder.JParamTypes
+_SUBMISSION_PARAMETER = "submissionParameter"
+_PARAM_TYPES_TOSTRING = frozenset(["enum", "spltype", "attribute", "splexpr"])
+
+_UINT_TYPES = frozenset(["UINT8", "UINT16", "UINT32", "UINT64"])
+
+_HASH_ADDER = "com.ibm.streamsx.topology.functional.java::HashAdder"
+
+#
+# Graph utilities, see GraphUtilities.java.
+# Operators are JSON objects (dicts) so are
+# compared by identity.
+#
+
+def _kind(op):
+    return op["kind"]
+
+def _unique(ops):
+    seen = set()
+    unique = []
+    for op in ops:
+        if id(op) not in seen:
+            seen.add(id(op))
+            unique.append(op)
+    return unique
+
+def _find_starts(graph):
+    return [op for op in graph["operators"]
+        if not op.get("inputs") and not op["name"].startswith("$")]
+
+def _find_by_kind(kind, graph):
+    return [op for op in graph["operators"] if _kind(op) == kind]
+
+def _downstream(op, graph):
+    """Operators with an input port connected to an output port of op."""
+    children = []
+    for output in op.get("outputs") or []:
+        for conn in output["connections"]:
+            for other in graph["operators"]:
+                for input in other.get("inputs") or []:
+                    if input["name"] == conn:
+                        children.append(other)
+    return _unique(children)
+
+def _upstream(op, graph):
+    """Operators with an output port connected to an input port of op."""
+    parents = []
+    for input in op.get("inputs") or []:
+        for conn in input["connections"]:
+            for other in graph["operators"]:
+                for output in other.get("outputs") or []:
+                    if output["name"] == conn:
+                        parents.append(other)
+    return _unique(parents)
+
+def _remove_operators(ops, graph):
+    """
+    Removes each operator from the graph, connecting
+    its upstream operators to its downstream operators.
+    """
+    for rop in ops:
+        parents = _upstream(rop, graph)
+        children = _downstream(rop, graph)
+
+        out_name = rop["outputs"][0]["name"] if rop.get("outputs") else ""
+        in_names = [input["name"] for input in rop.get("inputs") or []]
+
+        child_input_names = []
+        child_conns = []
+        for child in children:
+            for input in child["inputs"]:
+                conns = input["connections"]
+                if out_name in conns:
+                    child_input_names.append(input["name"])
+                    child_conns.append(conns)
+                    conns.remove(out_name)
+
+        parent_output_names = []
+        parent_conns = []
+        for parent in parents:
+            for output in parent["outputs"]:
+                conns = output["connections"]
+                for conn in conns:
+                    if conn in in_names:
+                        parent_output_names.append(output["name"])
+                        parent_conns.append(conns)
+                        conns.remove(conn)
+                        break
+
+        for conns in child_conns:
+            conns.extend(parent_output_names)
+        for conns in parent_conns:
+            conns.extend(child_input_names)
+        graph["operators"] = [op for op in graph["operators"] if op is not rop]
+
+def _visit_once(starts, boundaries, graph, visitor):
+    """
+    Visits every operator in the region containing starts, in both
+    directions, calling visitor with each. Operators whose kind is
+    in boundaries are not visited and end the region.
+    """
+    visited = {}
+    unvisited = list(starts)
+    while unvisited:
+        op = unvisited.pop(0)
+        if id(op) in visited:
+            continue
+        visitor(op)
+        visited[id(op)] = op
+
+        parents = [p for p in _upstream(op, graph) if id(p) not in visited]
+        for parent in parents:
+            if _kind(parent) in boundaries:
+                visited[id(parent)] = parent
+                unvisited.extend(_downstream(parent, graph))
+            else:
+                unvisited.append(parent)
+
+        children = [c for c in _downstream(op, graph) if id(c) not in visited]
+        for child in children:
+            if _kind(child) in boundaries:
+                visited[id(child)] = child
+                unvisited.extend(_upstream(child, graph))
+            else:
+                unvisited.append(child)
+
+def _placement(op):
+    return op.setdefault("config", {}).setdefault("placement", {})
+
+#
+# SPL names and literals
+#
+
+def _spl_compatible_name(name):
+    """
+    Returns a valid SPL identifier that is a unique mapping of name.
+    """
+    if re.match(r"^[a-zA-Z0-9_]+$", name):
+        return name
+    spl = []
+    for c in name:
+        if ord(c) < 128 and c.isalnum():
+            spl.append(c)
+        elif c == "_":
+            spl.append("__")
+        else:
+            spl.append("_u{0:04x}".format(ord(c)))
+    return "".join(spl)
+
+def _spl_basename(name):
+    return _spl_compatible_name(name.rsplit(".", 1)[-1])
+
+def _string_literal(value):
+    value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return '"' + value + '"'
+
+def _number_literal(value, type):
+    if isinstance(value, float):
+        return repr(value)
+    if type in _UINT_TYPES:
+        return str(value & 0xffffffffffffffff) + "ul"
+    return str(value) + "l"
+
+def _op_param_name(sp_name):
+    """
+    Returns the operator parameter name for a submission parameter,
+    see SubmissionTimeValue.mkOpParamName.
+    """
+    return "__jaa_stv_" + _spl_compatible_name(sp_name.replace(".", "_"))
+
+def _comp_param_name(spval):
+    return "$" + _op_param_name(spval["name"])
+
+class _SPLGenerator(object):
+    """
+    Generates the SPL for a graph, see SPLGenerator.java.
+    The graph is modified by the generation.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.composites = []
+        self.parallel_composites = 0
+        self.isolate_regions = 0
+        self.low_latency_regions = 0
+        self.submission_params = {}
+        for param in (graph.get("parameters") or {}).values():
+            if param.get("type") == _SUBMISSION_PARAMETER:
+                self.submission_params[_op_param_name(param["value"]["name"])] = param
+
+    def generate(self):
+        graph = self.graph
+        self._preprocess()
+        main = {"name": graph["name"], "public": True,
+            "parameters": graph.get("parameters"), "__spl_mainComposite": True}
+        self._separate_into_composites(_find_starts(graph), main)
+
+        spl = []
+        namespace = graph.get("namespace")
+        if namespace:
+            spl.append("namespace " + namespace + ";\n")
+        for comp in self.composites:
+            self._composite(comp, spl)
+        return "".join(spl)
+
+    #
+    # Logical graph transformations, see Preprocessor.java
+    #
+    def _preprocess(self):
+        self._validate_end_parallel()
+        self._tag_isolation_regions()
+        self._tag_low_latency_regions()
+        graph = self.graph
+        _remove_operators(_find_by_kind("$Union$", graph), graph)
+        autonomous = _find_by_kind("$Autonomous$", graph)
+        for marker in autonomous:
+            for op in _downstream(marker, graph):
+                op.setdefault("autonomous", True)
+        _remove_operators(autonomous, graph)
+
+    def _validate_end_parallel(self):
+        graph = self.graph
+        for end in _find_by_kind("$EndParallel$", graph):
+            parent = end
+            while True:
+                parents = _upstream(parent, graph)
+                if len(parents) != 1:
+                    raise ValueError("Cannot union multiple streams before invoking end_parallel()")
+                parent = parents[0]
+                if not _kind(parent).startswith("$"):
+                    break
+            if len(_downstream(parent, graph)) != 1:
+                raise ValueError("Cannot fanout a stream before invoking end_parallel()")
+
+    def _new_isolate_region_id(self):
+        region = "__jaa_isolateId" + str(self.isolate_regions)
+        self.isolate_regions += 1
+        return region
+
+    def _assign_isolate_region(self, starts):
+        region = self._new_isolate_region_id()
+        def set_region(op):
+            _placement(op).setdefault("isolateRegion", region)
+        _visit_once(starts, ("$Isolate$",), self.graph, set_region)
+
+    def _tag_isolation_regions(self):
+        graph = self.graph
+        isolates = _find_by_kind("$Isolate$", graph)
+        for isolate in isolates:
+            children = _downstream(isolate, graph)
+            parents = _upstream(isolate, graph)
+            for parent in parents:
+                if _kind(parent) == "$Isolate$":
+                    raise ValueError("Cannot put isolate regions immediately adjacent to each other.")
+            def check(op):
+                if any(op is child for child in children):
+                    raise ValueError("Invalid isolation configuration. "
+                        "An isolated region is joined with a non-isolated region.")
+            _visit_once(parents, ("$Isolate$",), graph, check)
+
+        for isolate in isolates:
+            self._assign_isolate_region(_upstream(isolate, graph))
+            self._assign_isolate_region(_downstream(isolate, graph))
+
+        # Regions not adjacent to any isolate
+        for start in _find_starts(graph):
+            region = self._new_isolate_region_id()
+            if _placement(start).get("isolateRegion"):
+                continue
+            def set_region(op):
+                _placement(op).setdefault("isolateRegion", region)
+            _visit_once([start], ("$Isolate$",), graph, set_region)
+
+        _remove_operators(isolates, graph)
+
+    def _tag_low_latency_regions(self):
+        graph = self.graph
+        starts = _find_by_kind("$LowLatency$", graph)
+        ends = _find_by_kind("$EndLowLatency$", graph)
+        for start in starts:
+            region = "LowLatencyRegion" + str(self.low_latency_regions)
+            self.low_latency_regions += 1
+            def set_region(op):
+                _placement(op).setdefault("lowLatencyRegion", region)
+            _visit_once(_downstream(start, graph),
+                ("$LowLatency$", "$EndLowLatency$"), graph, set_region)
+        _remove_operators(ends + starts, graph)
+
+    #
+    # Composites for the main composite and each parallel region.
+    #
+    def _separate_into_composites(self, starts, comp):
+        """
+        Separates the operators reachable from starts into comp,
+        replacing each parallel region with an invocation of a
+        new composite. Returns the end parallel marker of the
+        region if comp is a parallel region, otherwise None.
+        """
+        graph = self.graph
+        traversed = set()
+        visited = []
+        unvisited = list(starts)
+        end_parallel = None
+
+        while unvisited:
+            op = unvisited.pop(0)
+            if id(op) in traversed:
+                continue
+            traversed.add(id(op))
+
+            if _kind(op) == "$Parallel$":
+                visited.append(self._parallel_composite(op, unvisited))
+            elif _kind(op) == "$EndParallel$":
+                end_parallel = op
+            else:
+                unvisited.extend(_downstream(op, graph))
+                visited.append(op)
+
+        comp["operators"] = visited
+        self._add_param_defs(comp)
+        self.composites.append(comp)
+        return end_parallel
+
+    def _parallel_composite(self, parallel, unvisited):
+        """
+        Creates the composite for the parallel region started by parallel,
+        returning the operator invoking it.
+        """
+        graph = self.graph
+        name = "__parallel_Composite_" + str(self.parallel_composites)
+        sub = {"name": name, "public": False}
+        invoke = {"kind": name, "name": "paraComp_" + str(self.parallel_composites),
+            "inputs": parallel["inputs"]}
+        output = parallel["outputs"][0]
+
+        if output.get("partitioned"):
+            invoke["partitioned"] = True
+            invoke["parallelInputPortName"] = None
+            for input in parallel["inputs"]:
+                if "__spl_hash" in input["type"]:
+                    invoke["parallelInputPortName"] = input["name"]
+        invoke["parallelOperator"] = True
+        invoke["width"] = output.get("width")
+        self.parallel_composites += 1
+
+        starts = _downstream(parallel, graph)
+        end = self._separate_into_composites(starts, sub)
+        self._add_instance_params(invoke, sub)
+
+        sub["inputName"] = "parallelInput"
+        for start in starts:
+            for input in start["inputs"]:
+                conns = input["connections"]
+                for i, conn in enumerate(conns):
+                    if conn == output["name"]:
+                        conns[i] = "parallelInput"
+
+        if end is not None:
+            unvisited.extend(_downstream(end, graph))
+            invoke["outputs"] = end["outputs"]
+            sub["outputName"] = "parallelOutput"
+            end_input = end["inputs"][0]["name"]
+            for op in _upstream(end, graph):
+                if _kind(op) == _HASH_ADDER:
+                    invoke["outputs"][0]["type"] = op["outputs"][0]["type"]
+                for poutput in op["outputs"]:
+                    if end_input in poutput["connections"]:
+                        poutput["name"] = "parallelOutput"
+        return invoke
+
+    #
+    # Submission parameters, see SubmissionTimeValue.java
+    #
+    def _add_param_defs(self, comp):
+        """
+        Adds a parameter to the composite for each
+        submission parameter used by its operators.
+        """
+        if not self.submission_params:
+            return
+        sp_params = {}
+        for op in comp["operators"]:
+            for param in (op.get("parameters") or {}).values():
+                if param.get("type") == _SUBMISSION_PARAMETER:
+                    sp_params[_op_param_name(param["value"]["name"])] = param
+            width = op.get("width") if op.get("parallelOperator") else None
+            if isinstance(width, dict) and width.get("type") == _SUBMISSION_PARAMETER:
+                sp_params[_op_param_name(width["value"]["name"])] = width
+
+        params = comp.get("parameters")
+        if params is None and sp_params:
+            params = comp["parameters"] = {}
+        for name, param in sp_params.items():
+            params.setdefault(name, param)
+        comp["__spl_submissionParams"] = sp_params
+
+    def _add_instance_params(self, invoke, comp):
+        """
+        Passes the submission parameters used by a
+        composite to its invocation.
+        """
+        sp_params = comp.get("__spl_submissionParams")
+        if sp_params:
+            params = invoke.setdefault("parameters", {})
+            for param in sp_params.values():
+                params[_op_param_name(param["value"]["name"])] = param
+
+    #
+    # SPL generation
+    #
+    def _composite(self, comp, spl):
+        name = _spl_compatible_name(comp["name"])
+        if comp.get("public"):
+            spl.append("public ")
+        spl.append("composite " + name)
+        if name.startswith("__parallel_"):
+            spl.append("(input " + _spl_basename(comp["inputName"]))
+            if comp.get("outputName"):
+                spl.append("; output " + _spl_basename(comp["outputName"]))
+            spl.append(")")
+        spl.append("\n{\n")
+
+        params = comp.get("parameters")
+        if params:
+            spl.append("param\n")
+            for pname, param in params.items():
+                if param.get("type") != _SUBMISSION_PARAMETER:
+                    raise ValueError("Unhandled composite parameter: " + pname)
+                spl.append("  " + self._param_def(param["value"], comp.get("__spl_mainComposite")) + ";\n")
+
+        spl.append("graph\n")
+        for op in comp["operators"]:
+            self._operator(op, spl)
+            spl.append("\n")
+        spl.append("}\n")
+
+    def _param_def(self, spval, main):
+        spl_type = spval["metaType"].lower()
+        definition = "expression<{0}> {1}".format(spl_type, _comp_param_name(spval))
+        if not main:
+            return definition
+        sp_name = _string_literal(spval["name"])
+        default = spval.get("defaultValue")
+        if default is None:
+            return definition + " : ({0}) getSubmissionTimeValue({1})".format(spl_type, sp_name)
+        if spval["metaType"] in _UINT_TYPES:
+            default = default & 0xffffffffffffffff
+        return definition + " : ({0}) getSubmissionTimeValue({1}, {2})".format(
+            spl_type, sp_name, _string_literal(str(default)))
+
+    def _operator(self, op, spl):
+        self._annotations(op, spl)
+
+        outputs = op.get("outputs")
+        if outputs:
+            spl.append("  ( ")
+            spl.append("; ".join("stream" + output["type"][5:] + " " + _spl_basename(output["name"])
+                for output in outputs))
+            spl.append(") ")
+        else:
+            spl.append("() ")
+
+        spl.append("as " + _spl_basename(op["name"]) + " = " + op["kind"])
+
+        inputs = op.get("inputs")
+        if inputs:
+            spl.append("  ( ")
+            spl.append("; ".join(", ".join(_spl_basename(conn) for conn in input["connections"])
+                + " as " + _spl_basename(input["name"]) for input in inputs))
+            spl.append(")\n")
+        else:
+            spl.append("()\n")
+
+        spl.append("  {\n")
+        self._params(op, spl)
+        self._config(op, spl)
+        spl.append("  }\n")
+
+    def _annotations(self, op, spl):
+        if op.get("parallelOperator"):
+            width = op["width"]
+            if isinstance(width, dict):
+                if width.get("type") != _SUBMISSION_PARAMETER:
+                    raise ValueError("Unsupported parallel width specification: " + str(width))
+                width = _comp_param_name(width["value"])
+            spl.append("@parallel(width=" + str(width))
+            if op.get("partitioned"):
+                spl.append(", partitionBy=[{port=" + _spl_basename(op["parallelInputPortName"])
+                    + ", attributes=[__spl_hash]}]")
+            spl.append(")\n")
+
+        for view in (op.get("config") or {}).get("viewConfigs") or []:
+            spl.append('@view(name = "' + _spl_basename(view["name"]) + '", port = ' + view["port"])
+            spl.append(", bufferTime = " + repr(float(view["bufferTime"])) + ", ")
+            spl.append("sampleSize = " + str(int(view["sampleSize"])) + ", ")
+            spl.append("activateOption = firstAccess)\n")
+
+        if op.get("autonomous"):
+            spl.append("@autonomous\n")
+
+    def _params(self, op, spl):
+        params = op.get("parameters")
+        if not params:
+            return
+        spl.append("    param\n")
+        for name, param in params.items():
+            spl.append("      " + name + ": " + self._param_value(param) + ";\n")
+
+    def _param_value(self, param):
+        value = param["value"]
+        type = param.get("type")
+        if type == _SUBMISSION_PARAMETER:
+            return _comp_param_name(value)
+        if isinstance(value, str) and type not in _PARAM_TYPES_TOSTRING:
+            return _string_literal(value) + ("u" if type == "USTRING" else "")
+        if isinstance(value, list):
+            return ", ".join(_string_literal(v) for v in value)
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (int, float)):
+            return _number_literal(value, type)
+        return str(value)
+
+    def _config(self, op, spl):
+        placement = (op.get("config") or {}).get("placement") or {}
+        colocation = placement.get("explicitColocate") or placement.get("isolateRegion")
+        if colocation:
+            spl.append("  config\n")
+            spl.append("    placement: \n")
+            spl.append("      partitionColocation(" + _string_literal(colocation) + ")\n")
+            spl.append("    ;\n")
+
+def generate_spl(graph):
+    """
+    Generates the SPL main composite for a graph.
+
+    Args:
+        graph(dict): JSON representation of a graph, from SPLGraph.generateSPLGraph().
+            The graph is modified by the generation.
+    Returns:
+        str: SPL source for the graph's main composite and its parallel regions.
+    Raises:
+        ValueError: if the graph's isolate or parallel regions are invalid.
+    """
+    return _SPLGenerator(graph).generate()
+
+def _copy_includes(toolkit_dir, graph):
+    for include in graph.get("config", {}).get("includes", []):
+        source = include["source"]
+        target = os.path.join(toolkit_dir, include["target"])
+        os.makedirs(target, exist_ok=True)
+        if os.path.isfile(source):
+            shutil.copy(source, target)
+        elif os.path.isdir(source):
+            dst = os.path.join(target, os.path.basename(source))
+            if os.path.isdir(dst):
+                shutil.rmtree(dst)
+            shutil.copytree(source, dst)
+
+def _make_toolkit(toolkit_dir, config):
+    install = config.get(_COMPILE_INSTALL_DIR, os.environ.get("STREAMS_INSTALL"))
+    if install is None:
+        return
+    env = dict(os.environ)
+    env.pop("JAVA_HOME", None)
+    env["STREAMS_INSTALL"] = install
+    mtk = os.path.join(install, "bin", "spl-make-toolkit")
+    subprocess.check_call([mtk, "--make-operator", "-i", toolkit_dir], env=env)
+
+def submit(graph, config=None):
+    """
+    Creates an SPL toolkit containing the SPL application for a topology's graph.
+
+    The toolkit is indexed using spl-make-toolkit when a Streams
+    install is available, otherwise it is indexed when compiled.
+
+    Args:
+        graph: Topology.graph object.
+        config: Optional dict of settings:
+            * topology.toolkitDir - directory to create the toolkit in,
+              defaults to a new temporary directory in the current directory.
+            * topology.install.compile - Streams install used to index the toolkit,
+              defaults to $STREAMS_INSTALL.
+    Returns:
+        str: The toolkit's directory.
+    Raises:
+        ValueError: if the graph's isolate or parallel regions are invalid.
+        subprocess.CalledProcessError: if spl-make-toolkit fails.
+    """
+    if config is None:
+        config = {}
+    jgraph = graph.generateSPLGraph()
+    toolkit_dir = config.get(_TOOLKIT_DIR)
+    if toolkit_dir is None:
+        toolkit_dir = tempfile.mkdtemp(prefix="tk", dir=os.getcwd())
+    toolkit_dir = os.path.abspath(toolkit_dir)
+
+    namespace = jgraph["namespace"]
+    ns_dir = os.path.join(toolkit_dir, namespace)
+    os.makedirs(ns_dir, exist_ok=True)
+    os.makedirs(os.path.join(toolkit_dir, "impl", "lib"), exist_ok=True)
+    os.makedirs(os.path.join(toolkit_dir, "etc"), exist_ok=True)
+    os.makedirs(os.path.join(toolkit_dir, "opt"), exist_ok=True)
+
+    _copy_includes(toolkit_dir, jgraph)
+    spl = generate_spl(jgraph)
+    base = os.path.join(ns_dir, jgraph["name"])
+    with open(base + ".spl", "w", encoding="utf-8") as f:
+        f.write(spl)
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(jgraph, f)
+
+    _make_toolkit(toolkit_dir, config)
+    return toolkit_dir
@@ -4,25 +4,100 @@
 import random
 from streamsx.topology import graph
 from streamsx.topology import schema
+from streamsx.topology.schema import CommonSchema
+from streamsx.topology.codec import _codec_param, _compressed_param, _is_columnar_param, _is_pickle_param, CompressedCodec
 import streamsx.topology.functions
+import streamsx.topology.param
+import streamsx.topology.runtime
 import json
 import threading
 import queue
 import time
 from enum import Enum
 
+# Names of the optional metric sets, see Topology(metrics=)
+_METRICS = frozenset(['gil', 'python'])
+
 
 class Topology(object):
-    """Topology that contains graph + operators"""
-    def __init__(self, name, files=None):
+    """Topology that contains graph + operators
+
+    Args:
+        name: Name of the topology.
+        files: Files to include in the application bundle.
+        codec: Default codec used to serialize Python objects on
+            streams created by this topology. Either the name of a
+            built-in codec ('pickle', 'pickle_highest', 'marshal', 'msgpack', 'pickle5')
+            or an instance of a codec class, see streamsx.topology.codec.
+            Defaults to None, meaning pickle.
+        metrics: Names of optional metric sets recorded by the Python operators
+            of this topology as custom metrics. Defaults to None, meaning none.
+            * 'gil' - Time each operator waits for and holds the Python global
+              interpreter lock (GIL), as totals and histograms. The values are also
+              available within the processing element from
+              streamsx.topology.runtime.gil_metrics().
+            * 'python' - For operators calling a Python callable for each tuple, the number
+              of calls, time in the callable, time (de)serializing Python objects with the stream's
+              codec, serialized input and output sizes, number of tuples dropped by a map or filter
+              and the thread CPU time of the calls. Operators not in the set call the callable
+              without any instrumentation.
+        profiling: True to support on-demand profiling of the Python callables of operators
+            that call them for each tuple. Defaults to False.
+            Profiling of an operator is requested either when the job is submitted, by setting
+            the submission parameter `streamsx.topology.profile` to a comma separated list of
+            operator names (or `*` for all operators), or while it is running, by creating a file
+            named after the operator in the `profile` directory of the data directory.
+            A name in the submission parameter may be followed by `:tuples=N` or `:seconds=N`
+            and the file may contain `tuples=N` or `seconds=N` to set how many tuples or seconds
+            are profiled, the default is 60 seconds. The file is removed when profiling starts
+            and is checked for at most every five seconds. The collected statistics are written
+            to a `.pstats` file in the `profile` directory, see the Python `pstats` module.
+    Raises:
+        ValueError: if `codec` is not a valid codec or `metrics` contains an unknown name.
+    """
+    def __init__(self, name, files=None, codec=None, metrics=None, profiling=False):
         self.name = name
         self.graph = graph.SPLGraph(name)
         if files is not None:
             self.files = files
         else:
             self.files = []
-
-    def source(self, func):
+        self.codec = _codec_param(codec)
+        self._add_codec_dependencies(codec)
+        if metrics is not None:
+            if isinstance(metrics, str):
+                metrics = [metrics]
+            unknown = set(metrics) - _METRICS
+            if unknown:
+                raise ValueError("Unknown metrics: " + ", ".join(sorted(unknown)))
+            self.graph.metrics = frozenset(metrics)
+        self.graph.profiling = bool(profiling)
+
+    def _codec(self, codec):
+        """
+        Returns the codec parameter for a stream created with `codec`,
+        defaulting to the topology's codec.
+        """
+        if codec is None:
+            return self.codec
+        param = _codec_param(codec)
+        self._add_codec_dependencies(codec)
+        return param
+
+    def _add_codec_dependencies(self, codec):
+        """
+        Adds the module defining the class of a codec instance,
+        including one wrapped by a CompressedCodec, to the modules
+        included in the application bundle, so that the codec
+        can be unpickled by the operators.
+        """
+        if codec is None or isinstance(codec, str):
+            return
+        if isinstance(codec, CompressedCodec):
+            codec = codec._codec
+        self.graph.addDependencies(type(codec))
+
+    def source(self, func, codec=None, batch=None):
         """
         Fetches information from an external system and presents that information as a stream.
         Takes a zero-argument callable that returns an iterable of tuples.
@@ -38,11 +113,59 @@ class Topology(object):
             Using a callable class allows state information such as user-defined parameters to be stored during class 
             initialization and utilized when the instance is called.
             A tuple is represented as a Python object that must be picklable.
+            The callable may instead return an asynchronous iterable, for example when
+            `func` is an async generator function, or an awaitable whose result is an
+            iterable or asynchronous iterable, such as a coroutine.
+            These are run on an asyncio event loop shared by all Python operators in the
+            processing element, so many sources waiting on I/O do not each require a thread.
+            The event loop produces at most 1024 tuples ahead of those submitted.
+            codec: Codec used to serialize tuples on the returned stream, defaults to the topology's codec.
+            batch (int): maximum number of tuples fetched from the iterator each time the
+                source acquires the Python global interpreter lock (GIL). The tuples are submitted
+                together once it is released, which reduces the GIL overhead for sources producing
+                small tuples. Defaults to None, meaning one tuple at a time.
         Returns:
             A Stream whose tuples are the result of the output obtained by invoking the provided callable.
+        Raises:
+            ValueError: if `batch` is less than one.
+        """
+        params = None
+        if batch is not None:
+            if batch < 1:
+                raise ValueError("source batch must be at least one: " + str(batch))
+            params = {'batch': int(batch)}
+        op = self.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionSource", func, params=params)
+        oport = op.addOutputPort(codec=self._codec(codec))
+        return Stream(self, oport)
+
+    def columnar_source(self, func, size=None):
         """
-        op = self.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionSource", func)
-        oport = op.addOutputPort()
+        Creates a columnar stream from tables of data.
+
+        Each tuple on a columnar stream is a batch of rows, represented
+        as a dict of equal length NumPy arrays keyed by column name.
+        Functions applied to a columnar stream are called once per batch
+        and process the arrays with vectorized operations rather than
+        being called once per row. A filter on a columnar stream returns
+        a boolean array selecting the rows of the batch to keep.
+
+        Args:
+            func: A zero-argument callable that returns a table or an iterable of tables,
+                where a table is a pandas DataFrame, a NumPy record array or a dict of
+                equal length arrays keyed by column name.
+            size (int): maximum number of rows in a batch, defaults to None meaning
+                each table is a single batch.
+        Returns:
+            A columnar Stream of batches of rows from the tables.
+        Raises:
+            ValueError: if `size` is less than one.
+        """
+        if size is not None and size < 1:
+            raise ValueError("columnar batch size must be at least one: " + str(size))
+        op = self.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionSource",
+            streamsx.topology.runtime._ColumnarSource(func, size))
+        self.graph.addDependencies(func)
+        oport = op.addOutputPort(codec=_codec_param('columnar'))
         return Stream(self, oport)
 
     def subscribe(self, topic, schema=schema.CommonSchema.Python):
@@ -64,6 +187,15 @@ class Topology(object):
         Each tuple on the returned stream will be a Python string object.
         Any publishing Streams application may have been implemented in any language.
 
+        Binary streams are subscribed to using schema.CommonSchema.Binary.
+        Each tuple on the returned stream will be a read-only memoryview
+        over the binary data, only valid during the call to a callable.
+        Any publishing Streams application may have been implemented in any language.
+
+        Streams with any other SPL tuple type are subscribed to using a
+        schema.StreamSchema for the type. Each tuple on the returned stream
+        will be a Python named tuple whose fields are the SPL attributes.
+
         Args:
             topic: Topic to subscribe to.
             schema: schema.StreamSchema to subscribe to. Defaults to schema.CommonSchema.Python representing Python
@@ -124,18 +256,32 @@ class Stream(object):
             Using a callable class allows state information such as user-defined parameters to be stored during class 
             initialization and utilized when the instance is called.
             The callable is invoked for each incoming tuple.
+            For a columnar stream the callable is invoked for each batch and returns a boolean
+            array selecting the rows of the batch that are kept, batches without any selected
+            rows are filtered out.
         Returns:
             A Stream containing tuples that have not been filtered out.
         """
+        if self._columnar():
+            self.topology.graph.addDependencies(func)
+            return self._map(streamsx.topology.runtime._ColumnarFilter(func), schema=CommonSchema.Python,
+                codec=graph._streamCodec(self.oport))
         op = self.topology.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionFilter", func)
         op.addInputPort(outputPort=self.oport)
         oport = op.addOutputPort(schema=self.oport.schema)
         return Stream(self.topology, oport)
 
-    def _map(self, func, schema):
+    def _columnar(self):
+        """
+        Returns True if this is a columnar stream.
+        """
+        return (self.oport.schema.schema() == CommonSchema.Python.schema() and
+            _is_columnar_param(graph._streamCodec(self.oport)))
+
+    def _map(self, func, schema, codec=None):
         op = self.topology.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionTransform", func)
         op.addInputPort(outputPort=self.oport)
-        oport = op.addOutputPort(schema=schema)
+        oport = op.addOutputPort(schema=schema, codec=self._codec(schema, codec))
         return Stream(self.topology, oport)
 
     def view(self, buffer_time = 10.0, sample_size = 10000):
@@ -157,7 +303,17 @@ class Stream(object):
         return _view
         
 
-    def transform(self, func):
+    def _codec(self, schema, codec):
+        """
+        Returns the codec parameter for a stream derived from
+        this stream with `schema`, only streams of Python
+        objects have a codec.
+        """
+        if schema.schema() != CommonSchema.Python.schema():
+            return None
+        return self.topology._codec(codec)
+
+    def transform(self, func, schema=None, codec=None, threads=None, ordered=True, processes=None):
         """
         Transforms each tuple from this stream into 0 or 1 tuples using the supplied callable `func`.
         For each tuple on this stream, the returned stream will contain a tuple
@@ -174,18 +330,67 @@ class Stream(object):
             Using a callable class allows state information such as user-defined parameters to be stored during class 
             initialization and utilized when the instance is called.
             The callable is invoked for each incoming tuple.
+            schema: Schema of the returned stream, defaults to CommonSchema.Python.
+                With a structured schema such as StreamSchema('tuple<int64 id, float64 value>')
+                the callable returns a tuple, whose values are the attributes by position, or
+                a dict, whose values are the attributes by name. The values are converted to SPL
+                attributes without serialization, so that SPL operators may consume the stream.
+            codec: Codec used to serialize tuples on the returned stream, defaults to the topology's codec,
+                or for a columnar stream the columnar codec, so the callable returns a columnar batch.
+            threads (int): number of threads that call `func` concurrently, defaults to None
+                meaning the callable is called by the thread processing the tuple.
+                Only callables that release the Python global interpreter lock (GIL) benefit, such as
+                those spending their time in zlib, hashlib, NumPy or regular expressions on large inputs.
+                At most twice `threads` tuples are held while their calls are pending.
+                Unlike parallel(), no additional processing elements or channels are created.
+                Only supported when the returned stream's schema is CommonSchema.Python.
+            processes (int): number of worker processes that call `func`, defaults to None.
+                The workers are forked from the processing element, so CPU bound Python callables
+                scale across cores without the overhead of parallel(). Each serialized tuple is sent to
+                a worker unchanged and deserialized there, and the worker returns the serialized result.
+                The callable must not rely on threads or state of the processing element other than
+                that inherited when the workers are forked.
+                At most twice `processes` tuples are held while their calls are pending.
+                Only supported when the returned stream's schema is CommonSchema.Python,
+                and cannot be combined with `threads`.
+            ordered (bool): when `threads` or `processes` is set, if True, the default, tuples are submitted in
+                the order of this stream, otherwise they are submitted as the calls complete.
         Returns:
             A Stream containing transformed tuples.
-        """
-        return self._map(func, schema=schema.CommonSchema.Python)
+        Raises:
+            ValueError: if `schema` is not a SPL tuple type, or `threads` or `processes` is set with a schema
+                other than CommonSchema.Python or is less than one, or both are set.
+        """
+        if schema is None:
+            schema = CommonSchema.Python
+        schema.attributes()
+        if codec is None and schema.schema() == CommonSchema.Python.schema() and self._columnar():
+            codec = 'columnar'
+
+        if threads is not None or processes is not None:
+            if threads is not None and processes is not None:
+                raise ValueError("map threads and processes cannot be combined")
+            workers = threads if processes is None else processes
+            if workers < 1:
+                raise ValueError("map threads or processes must be at least one: " + str(workers))
+            if schema.schema() != CommonSchema.Python.schema():
+                raise ValueError("map threads or processes requires CommonSchema.Python: " + schema.schema())
+            op = self._async(func, 2 * int(workers), ordered,
+                threads=None if threads is None else int(threads),
+                processes=None if processes is None else int(processes))
+            oport = op.addOutputPort(codec=self.topology._codec(codec))
+            return Stream(self.topology, oport)
+
+        return self._map(func, schema=schema, codec=codec)
 
-    def map(self, func):
+    def map(self, func, schema=None, codec=None, threads=None, ordered=True, processes=None):
         """
         Equivalent to calling the transform() function
         """
-        return self.transform(func)
+        return self.transform(func, schema=schema, codec=codec, threads=threads, ordered=ordered,
+            processes=processes)
              
-    def multi_transform(self, func):
+    def multi_transform(self, func, codec=None, chunk_size=None):
         """
         Transforms each tuple from this stream into 0 or more tuples using the supplied callable `func`. 
         For each tuple on this stream, the returned stream will contain all non-None tuples from
@@ -205,49 +410,213 @@ class Stream(object):
             Using a callable class allows state information such as user-defined parameters to be stored during class 
             initialization and utilized when the instance is called.
             The callable is invoked for each incoming tuple.
+            codec: Codec used to serialize tuples on the returned stream, defaults to the topology's codec.
+            chunk_size (int): maximum number of tuples taken from the iterable
+                before they are submitted, defaults to 1024.
+                The iterable is consumed incrementally, so a callable that
+                returns a generator over a large input does not hold all its
+                tuples in memory. The Python GIL is released while each chunk
+                is submitted, allowing other Python operators to run.
         Returns:
             A Stream containing transformed tuples.
         Raises:
             TypeError: if `func` does not return an iterator nor None
+            ValueError: if `chunk_size` is less than one.
         """     
-        op = self.topology.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform", func)
+        params = None
+        if chunk_size is not None:
+            if chunk_size < 1:
+                raise ValueError("chunk_size must be at least one: " + str(chunk_size))
+            params = {'chunkSize': int(chunk_size)}
+        op = self.topology.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform", func, params=params)
         op.addInputPort(outputPort=self.oport)
-        oport = op.addOutputPort()
+        oport = op.addOutputPort(codec=self.topology._codec(codec))
         return Stream(self.topology, oport)
     
-    def flat_map(self, func):
+    def flat_map(self, func, codec=None, chunk_size=None):
         """
         Equivalent to calling the multi_transform() function
         """
-        return self.multi_transform(func)
+        return self.multi_transform(func, codec=codec, chunk_size=chunk_size)
+
+    def map_async(self, func, max_in_flight=16, ordered=True, codec=None):
+        """
+        Transforms each tuple from this stream into 0 or 1 tuples using the supplied
+        coroutine function `func`, with up to `max_in_flight` calls running concurrently.
+
+        The calls run on an asyncio event loop shared by all Python operators in the
+        processing element, so a callable that waits on I/O, such as a request to a
+        REST service, overlaps its calls rather than processing one tuple at a time.
+        Once `max_in_flight` calls are outstanding the next tuple is held until a call completes.
+        If a call returns None then no tuple is submitted to the returned stream.
+        All results are submitted before the final punctuation.
+
+        Args:
+            func: A callable that takes a single parameter for the tuple and returns an awaitable,
+                typically a function defined with `async def`, whose result is a tuple or None.
+                A callable that returns a value that is not awaitable is also accepted, it is called
+                on the event loop thread.
+                The callable must be either
+                * the name of a function defined at the top level of a module that takes a single parameter for the tuple, or
+                * an instance of a callable class defined at the top level of a module that implements
+                  the method `__call__(self, tuple)` and be picklable.
+            max_in_flight (int): maximum number of outstanding calls, defaults to 16.
+            ordered (bool): if True, the default, tuples are submitted in the order of this stream,
+                results that complete early are held until the preceding results are submitted.
+                If False, tuples are submitted as the calls complete.
+            codec: Codec used to serialize tuples on the returned stream, defaults to the topology's codec.
+        Returns:
+            A Stream containing transformed tuples.
+        Raises:
+            ValueError: if `max_in_flight` is less than one.
+        """
+        op = self._async(func, max_in_flight, ordered)
+        oport = op.addOutputPort(codec=self.topology._codec(codec))
+        return Stream(self.topology, oport)
 
-    def isolate(self):
+    def sink_async(self, func, max_in_flight=16):
+        """
+        Sends each tuple to an external system using the supplied coroutine
+        function `func`, with up to `max_in_flight` calls running concurrently.
+
+        The calls run on an asyncio event loop shared by all Python operators in the
+        processing element. Once `max_in_flight` calls are outstanding the next tuple
+        is held until a call completes.
+
+        Args:
+            func: A callable that takes a single parameter for the tuple and returns an awaitable,
+                typically a function defined with `async def`.
+                The callable must be either
+                * the name of a function defined at the top level of a module that takes a single parameter for the tuple, or
+                * an instance of a callable class defined at the top level of a module that implements
+                  the method `__call__(self, tuple)` and be picklable.
+            max_in_flight (int): maximum number of outstanding calls, defaults to 16.
+        Returns:
+            None
+        Raises:
+            ValueError: if `max_in_flight` is less than one.
+        """
+        self._async(func, max_in_flight, False)
+
+    def for_each_async(self, func, max_in_flight=16):
+        """
+        Equivalent to calling the sink_async() function
+        """
+        self.sink_async(func, max_in_flight=max_in_flight)
+
+    def _async(self, func, max_in_flight, ordered, threads=None, processes=None):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least one: " + str(max_in_flight))
+        op = self.topology.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionAsync",
+            streamsx.topology.runtime._AsyncFunction(func, int(max_in_flight), bool(ordered),
+                threads=threads, processes=processes))
+        self.topology.graph.addDependencies(func)
+        op.addInputPort(outputPort=self.oport)
+        return op
+
+    def batch(self, size, max_delay=None, codec=None):
+        """
+        Batches tuples from this stream into lists.
+        Each tuple on the returned stream is a list containing up to
+        `size` consecutive tuples from this stream, in order.
+        A list is submitted as soon as it contains `size` tuples,
+        or when `max_delay` seconds have passed without a list being
+        submitted, so that a slow stream does not hold tuples indefinitely.
+        Any partial batch is submitted when this stream is finalized.
+
+        Functions applied to the returned stream are called once per batch
+        rather than once per tuple, which amortizes the per-call cost for
+        callables such as database sinks or model scoring maps.
+        
+        Args:
+            size (int): maximum number of tuples in a batch.
+            max_delay (float): maximum time in seconds a partial batch is held,
+                defaults to None meaning partial batches are only submitted
+                when this stream is finalized.
+            codec: Codec used to serialize batches on the returned stream, defaults to the topology's codec.
+        Returns:
+            A Stream whose tuples are lists of tuples from this stream.
+        Raises:
+            ValueError: if `size` is less than one or `max_delay` is not positive.
+        """
+        if size < 1:
+            raise ValueError("batch size must be at least one: " + str(size))
+        params = {'toolkitDir': streamsx.topology.param.toolkit_dir(), 'size': int(size)}
+        if max_delay is not None:
+            if max_delay <= 0:
+                raise ValueError("batch max_delay must be positive: " + str(max_delay))
+            params['maxDelay'] = float(max_delay)
+        op = self.topology.graph.addOperator("com.ibm.streamsx.topology.functional.python::PyFunctionBatch", params=params)
+        op.addInputPort(outputPort=self.oport)
+        oport = op.addOutputPort(codec=self.topology._codec(codec))
+        return Stream(self.topology, oport)
+
+    def unbatch(self, codec=None):
+        """
+        Reverses batch(), each tuple on this stream must be an iterable
+        (typically a list produced by batch()) and each non-None element
+        of it is a tuple on the returned stream.
+
+        Args:
+            codec: Codec used to serialize tuples on the returned stream, defaults to the topology's codec.
+        Returns:
+            A Stream containing the elements of each batch.
+        """
+        return self.flat_map(streamsx.topology.functions.identity, codec=codec)
+
+    def isolate(self, compression=None, threshold=1024):
         """
         Guarantees that the upstream operation will run in a separate process from the downstream operation
+
+        Python objects crossing the process boundary may be compressed,
+        reducing the network bandwidth used when the processes are on
+        different hosts at the cost of processing time. Only the stream
+        crossing the boundary is compressed, other streams consuming this
+        stream within the upstream process are not.
         
         Args:
-            None
+            compression: 'zlib' or 'lz4' to compress Python objects crossing the
+                process boundary, defaults to None meaning no compression.
+            threshold: minimum size in bytes of a serialized Python object that
+                is compressed, defaults to 1024.
         Returns:
             Stream
+        Raises:
+            ValueError: if `compression` is not supported or `threshold` is negative.
         """
+        stream = self
+        if compression is not None and self.oport.schema.schema() == CommonSchema.Python.schema():
+            codec = _compressed_param(compression, threshold, graph._streamCodec(self.oport))
+            stream = self._map(streamsx.topology.functions.identity, schema=CommonSchema.Python, codec=codec)
         op = self.topology.graph.addOperator("$Isolate$")
-        op.addInputPort(outputPort=self.oport)
+        op.addInputPort(outputPort=stream.oport)
         oport = op.addOutputPort()
         return Stream(self.topology, oport)
 
-    def low_latency(self):
+    def low_latency(self, by_reference=False):
         """
         The function is guaranteed to run in the same process as the
         upstream Stream function. All streams that are created from the returned stream 
         are also guaranteed to run in the same process until end_low_latency() 
         is called.
+
+        With `by_reference` set to True, Python objects are passed by
+        reference between Python functions within the low latency region,
+        including the upstream Stream function, avoiding the pickling and
+        depickling of each tuple. A stream is still pickled when any
+        consumer of it is not a Python map, flat_map or sink function
+        in the region, or processes tuples using a threaded port. As
+        objects are not copied, functions consuming the same stream see
+        the same object and must not modify it.
         
         Args:
-            None
+            by_reference (bool): pass Python objects by reference within the region.
         Returns:
             Stream
         """
         op = self.topology.graph.addOperator("$LowLatency$")
+        if by_reference:
+            op.setParameters({'byReference': True})
         op.addInputPort(outputPort=self.oport)
         oport = op.addOutputPort()
         return Stream(self.topology, oport)
@@ -377,7 +746,7 @@ class Stream(object):
         """
         self.sink(streamsx.topology.functions.print_flush)
 
-    def publish(self, topic, schema=schema.CommonSchema.Python):
+    def publish(self, topic, schema=schema.CommonSchema.Python, compression=None, threshold=1024):
         """
         Publish this stream on a topic for other Streams applications to subscribe to.
         A Streams application may publish a stream to allow other
@@ -398,15 +767,39 @@ class Stream(object):
         of their implementation language. A Python tuple is converted to
         a string using str(tuple).
 
+        If a stream is published with CommonSchema.Binary then it is published
+        as binary data, other Streams applications may subscribe to it regardless
+        of their implementation language. Each Python tuple must be a
+        bytes-like object, such as bytes or a memoryview.
+
+        Python objects are always published using the pickle codec so
+        that any subscriber can read them, a stream using another codec
+        is re-encoded before it is published. Published Python objects
+        may be compressed, subscribers decompress them transparently.
+
         Args:
             topic: Topic to publish this stream to.
             schema: Schema to publish. Defaults to CommonSchema.Python representing Python objects.
+            compression: 'zlib' or 'lz4' to compress published Python objects,
+                defaults to None meaning no compression.
+            threshold: minimum size in bytes of a serialized Python object that
+                is compressed, defaults to 1024.
         Returns:
             None.
         """
         if self.oport.schema.schema() != schema.schema():
             self._map(streamsx.topology.functions.identity,schema=schema).publish(topic, schema=schema);
             return None
+        if schema.schema() == CommonSchema.Python.schema():
+            codec = graph._streamCodec(self.oport)
+            if compression is not None:
+                publish_codec = CompressedCodec(compression, threshold)
+                if codec != _codec_param(publish_codec):
+                    self._map(streamsx.topology.functions.identity,schema=schema,codec=publish_codec).publish(topic, schema=schema);
+                    return None
+            elif not _is_pickle_param(codec):
+                self._map(streamsx.topology.functions.identity,schema=schema,codec='pickle').publish(topic, schema=schema);
+                return None
 
         publishParams = {'topic': [topic]}
         op = self.topology.graph.addOperator("com.ibm.streamsx.topology.topic::Publish", params=publishParams)
@@ -0,0 +1,170 @@
+/*
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+ */
+package com.ibm.streamsx.topology.context;
+
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.math.BigInteger;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.nio.charset.StandardCharsets;
+import java.security.SecureRandom;
+
+import com.ibm.json.java.JSONObject;
+
+/**
+ * Long-lived server submitting the JSON representation of graphs,
+ * used by Python to submit multiple topologies without starting
+ * a JVM for each submission, see {@link StreamsContextSubmit}.
+ * <p>
+ * On startup the server writes a line containing its port on the
+ * loopback interface and a random token to standard output. Each
+ * connection submits a single graph and sends these lines:
+ * <pre>
+ * token
+ * context type
+ * length of the JSON in bytes
+ * </pre>
+ * followed by the UTF-8 JSON. While the graph is submitted the
+ * server returns the lines written to standard output and error
+ * prefixed by {@code out } and {@code err }, and finally
+ * {@code rc } followed by the submission's return code.
+ * <p>
+ * Submissions are processed one at a time. The server exits
+ * when its standard input is closed.
+ */
+public class StreamsContextServer {
+
+    public static void main(String[] args) throws Exception {
+        final String token = new BigInteger(130, new SecureRandom()).toString(32);
+        final PrintStream out = System.out;
+        final PrintStream err = System.err;
+
+        try (ServerSocket server = new ServerSocket(0, 50, InetAddress.getLoopbackAddress())) {
+            exitOnEndOfInput();
+            out.println(server.getLocalPort() + " " + token);
+            out.flush();
+
+            while (true) {
+                try (Socket socket = server.accept()) {
+                    submit(socket, token);
+                } catch (IOException e) {
+                    e.printStackTrace(err);
+                } finally {
+                    System.setOut(out);
+                    System.setErr(err);
+                }
+            }
+        }
+    }
+
+    /**
+     * Exit once the process that started the server closes its standard input.
+     */
+    private static void exitOnEndOfInput() {
+        Thread t = new Thread(new Runnable() {
+            @Override
+            public void run() {
+                try {
+                    while (System.in.read() != -1)
+                        ;
+                } catch (IOException e) {
+                }
+                System.exit(0);
+            }
+        });
+        t.setDaemon(true);
+        t.start();
+    }
+
+    private static void submit(Socket socket, String token) throws IOException {
+        DataInputStream in = new DataInputStream(socket.getInputStream());
+        if (!token.equals(readLine(in)))
+            return;
+        String context = readLine(in);
+        int length = Integer.parseInt(readLine(in));
+        byte[] graph = new byte[length];
+        in.readFully(graph);
+
+        OutputStream sout = socket.getOutputStream();
+        PrintStream out = new PrintStream(new PrefixedLines(sout, "out "), true, "UTF-8");
+        PrintStream err = new PrintStream(new PrefixedLines(sout, "err "), true, "UTF-8");
+        System.setOut(out);
+        System.setErr(err);
+
+        int rc = 0;
+        try {
+            JSONObject json = JSONObject.parse(new ByteArrayInputStream(graph));
+            StreamsContext<?> sc = StreamsContextFactory.getStreamsContext(context);
+            Object result = sc.submit(json).get();
+            if (result instanceof Integer)
+                rc = (Integer) result;
+        } catch (Throwable t) {
+            t.printStackTrace(err);
+            rc = 1;
+        }
+        out.flush();
+        err.flush();
+        synchronized (sout) {
+            sout.write(("rc " + rc + "\n").getBytes(StandardCharsets.UTF_8));
+            sout.flush();
+        }
+    }
+
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != '\n') {
+            if (b == -1)
+                throw new IOException("Unexpected end of submission request");
+            line.write(b);
+        }
+        return new String(line.toByteArray(), StandardCharsets.UTF_8);
+    }
+
+    /**
+     * Writes each complete line to the connection with a prefix.
+     */
+    private static class PrefixedLines extends OutputStream {
+        private final OutputStream out;
+        private final byte[] prefix;
+        private final ByteArrayOutputStream line = new ByteArrayOutputStream();
+
+        PrefixedLines(OutputStream out, String prefix) {
+            this.out = out;
+            this.prefix = prefix.getBytes(StandardCharsets.UTF_8);
+        }
+
+        @Override
+        public synchronized void write(int b) throws IOException {
+            line.write(b);
+            if (b == '\n')
+                flushLine();
+        }
+
+        @Override
+        public synchronized void flush() throws IOException {
+            if (line.size() != 0) {
+                line.write('\n');
+                flushLine();
+            }
+        }
+
+        private void flushLine() throws IOException {
+            synchronized (out) {
+                out.write(prefix);
+                line.writeTo(out);
+                out.flush();
+            }
+            line.reset();
+        }
+    }
+}
@@ -0,0 +1,42 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+"""
+Measures the time taken to build a topology and generate its
+graph against the number of operators.
+
+Usage: python benchmark_build.py [operator counts...]
+"""
+import sys
+import time
+
+import test_functions
+
+from streamsx.topology.topology import Topology
+
+def build(count):
+    """
+    Returns the seconds taken to declare a topology with count
+    map operators and the seconds taken to generate its graph.
+    """
+    start = time.perf_counter()
+    topo = Topology("benchmark_build_" + str(count))
+    s = topo.source(test_functions.hello_world)
+    for i in range(count):
+        # A sink per map keeps each map a separate operator
+        s = s.map(test_functions.add17)
+        s.sink(test_functions.check_hello_world)
+    built = time.perf_counter()
+    topo.graph.generateSPLGraph()
+    generated = time.perf_counter()
+    return built - start, generated - built
+
+def main(counts):
+    print("{0:>10} {1:>10} {2:>10} {3:>12}".format("operators", "build(s)", "graph(s)", "us/operator"))
+    for count in counts:
+        b, g = build(count)
+        operators = 2 * count + 1
+        print("{0:>10} {1:>10.3f} {2:>10.3f} {3:>12.1f}".format(
+            operators, b, g, 1e6 * (b + g) / operators))
+
+if __name__ == '__main__':
+    main([int(c) for c in sys.argv[1:]] or [10, 100, 500, 1000])
@@ -2,12 +2,23 @@
 # Copyright IBM Corp. 2016
 import unittest
 import sys
+import pickle
+import os
+import tempfile
+import pstats
+import time
 
 import test_functions
+# Async generators require Python 3.6
+if sys.version_info >= (3, 6):
+  import test_functions_async
+else:
+  test_functions_async = None
 
 from streamsx.topology.topology import *
 from streamsx.topology import schema
 import streamsx.topology.context
+import streamsx.topology.local
 
 
 class TestTopologyMethods(unittest.TestCase):
@@ -223,6 +234,1179 @@ class TestTopologyMethods(unittest.TestCase):
       finally:
           del test_functions2
 
+class TestPipelineFusion(unittest.TestCase):
+
+  def _kinds(self, topo):
+      return [op["kind"].split("::")[-1] for op in topo.graph.generateSPLGraph()["operators"]]
+
+  def test_FusedChain(self):
+      topo = Topology("test_FusedChain")
+      source = topo.source(test_functions.int_strings_transform_with_drop)
+      i1 = source.map(test_functions.string_to_int_except68)
+      i2 = i1.filter(test_functions.AddNum(0))
+      i3 = i2.map(test_functions.add17)
+      i3.sink(test_functions.check_int_strings_transform_with_drop)
+      self.assertEqual(["PyFunctionSource", "PyFunctionPipeline", "PyFunctionSink"], self._kinds(topo))
+
+  def test_NotFusedAcrossIsolate(self):
+      topo = Topology("test_NotFusedAcrossIsolate")
+      source = topo.source(test_functions.int_strings_transform)
+      i1 = source.map(int).isolate()
+      i2 = i1.map(test_functions.add17)
+      i2.sink(test_functions.check_int_strings_transform)
+      self.assertEqual(["PyFunctionSource", "PyFunctionTransform", "$Isolate$",
+          "PyFunctionTransform", "PyFunctionSink"], self._kinds(topo))
+
+  def test_NotFusedFanOut(self):
+      topo = Topology("test_NotFusedFanOut")
+      source = topo.source(test_functions.int_strings_transform)
+      i1 = source.map(int)
+      i1.map(test_functions.add17).print()
+      i1.map(test_functions.add17).print()
+      self.assertNotIn("PyFunctionPipeline", self._kinds(topo))
+
+  def test_PipelineStages(self):
+      from streamsx.topology.runtime import _Pipeline
+      pipeline = _Pipeline([('flat_map', test_functions.split_words),
+          ('filter', test_functions.LengthFilter(3)),
+          ('map', str.upper)])
+      self.assertEqual(["MARY", "LITTLE", "LAMB"], list(pipeline("mary had a little lamb")))
+      self.assertEqual([], list(pipeline("a b")))
+
+class TestBatch(unittest.TestCase):
+
+  def test_BatchOperator(self):
+      topo = Topology("test_BatchOperator")
+      source = topo.source(test_functions.seedSource)
+      b = source.batch(3, max_delay=0.5)
+      b.unbatch().print()
+      ops = topo.graph.generateSPLGraph()["operators"]
+      self.assertEqual("com.ibm.streamsx.topology.functional.python::PyFunctionBatch", ops[1]["kind"])
+      self.assertEqual(3, ops[1]["parameters"]["size"]["value"])
+      self.assertEqual(0.5, ops[1]["parameters"]["maxDelay"]["value"])
+      self.assertRaises(ValueError, source.batch, 0)
+
+  def test_BatchRuntime(self):
+      import pickle
+      from streamsx.topology import runtime
+      batch = runtime.pickle_in__pickle_batch(2)
+      self.assertIsNone(batch.add(pickle.dumps(1)))
+      self.assertEqual([1, 2], pickle.loads(batch.add(pickle.dumps(2))))
+      self.assertIsNone(batch.flush())
+      self.assertIsNone(batch.add(pickle.dumps(3)))
+      self.assertEqual([3], pickle.loads(batch.flush()))
+
+class TestPassByReference(unittest.TestCase):
+
+  def _types(self, topo):
+      return {op["kind"].split("::")[-1] : ([p["type"] for p in op["inputs"]], [p["type"] for p in op["outputs"]])
+             for op in topo.graph.generateSPLGraph()["operators"]}
+
+  def test_LowLatencyByReference(self):
+      topo = Topology("test_LowLatencyByReference")
+      hw = topo.source(test_functions.hello_world)
+      low = hw.low_latency(by_reference=True)
+      low.sink(test_functions.check_hello_world)
+      low.print()
+      types = self._types(topo)
+      self.assertEqual((['tuple<uint64 __spl_pr>'], ['tuple<uint64 __spl_pr>']), types["$LowLatency$"])
+      self.assertEqual([], types["PyFunctionSource"][0])
+      self.assertEqual(['tuple<uint64 __spl_pr>'], types["PyFunctionSource"][1])
+      self.assertEqual(['tuple<uint64 __spl_pr>'], types["PyFunctionSink"][0])
+
+  def test_LowLatencyPickled(self):
+      topo = Topology("test_LowLatencyPickled")
+      hw = topo.source(test_functions.hello_world)
+      low = hw.low_latency()
+      low.sink(test_functions.check_hello_world)
+      self.assertEqual(['tuple<blob __spl_po>'], self._types(topo)["PyFunctionSink"][0])
+
+      topo = Topology("test_LowLatencyMixedConsumers")
+      hw = topo.source(test_functions.hello_world)
+      low = hw.low_latency(by_reference=True)
+      low.filter(test_functions.filter).print()
+      low.print()
+      self.assertEqual(['tuple<blob __spl_po>'], self._types(topo)["PyFunctionSource"][1])
+
+  def test_ReferenceRuntime(self):
+      from streamsx.topology import runtime
+      source = runtime.iterableSource__pyref_out(test_functions.strings_multi_transform)
+      split = runtime.pyref_in__pyref_iter(test_functions.split_words)
+      upper = runtime.pyref_in__pickle_out(str.upper)
+      keys = list(split(source()))
+      self.assertEqual(5, len(keys))
+      self.assertEqual(pickle.dumps("LAMB"), upper(keys[4]))
+      self.assertRaises(RuntimeError, upper, keys[3])
+
+  def test_ReferenceRelease(self):
+      from streamsx.topology import runtime
+      dumps = runtime._RefDumps().generation()
+      keys = [dumps(s) for s in ["a", "b", "c"]]
+      # Consumers fanning out from a stream all read each object
+      self.assertEqual("a", runtime._pyref_loads(keys[0]))
+      self.assertEqual("a", runtime._pyref_loads(keys[0]))
+      self.assertEqual("b", runtime._pyref_loads(keys[1]))
+      self.assertRaises(RuntimeError, runtime._pyref_loads, keys[0])
+      self.assertEqual("c", runtime._pyref_loads(keys[2]))
+
+  def test_ThreadedPortPickled(self):
+      from streamsx.topology.graph import _setReferenceTypes
+      topo = Topology("test_ThreadedPortPickled")
+      hw = topo.source(test_functions.hello_world)
+      low = hw.low_latency(by_reference=True)
+      low.sink(test_functions.check_hello_world)
+      graph = topo.graph
+      ops = [op.generateSPLOperator() for op in graph._fusePipelines()]
+      names = graph._referencePorts(graph._fusePipelines())
+      self.assertEqual(2, len(names))
+      sink = [op for op in ops if op["kind"].endswith("PyFunctionSink")][0]
+      sink["inputs"][0]["queue"] = {"functional": True}
+      _setReferenceTypes(ops, names)
+      for op in ops:
+          for port in op["inputs"] + op["outputs"]:
+              self.assertEqual('tuple<blob __spl_po>', port["type"])
+
+class TestCodec(unittest.TestCase):
+
+  def _params(self, topo):
+      return {op["kind"].split("::")[-1] : op.get("parameters", {})
+             for op in topo.graph.generateSPLGraph()["operators"]}
+
+  def test_CodecDependencies(self):
+      import test_functions3
+      from streamsx.topology.codec import CompressedCodec
+      module = os.path.abspath(test_functions3.__file__)
+      topo = Topology("test_CodecDependencies")
+      topo.source(test_functions.hello_world, codec=test_functions3.JsonCodec()).print()
+      includes = [i["source"] for i in topo.graph.generateSPLGraph()["config"]["includes"]]
+      self.assertIn(module, includes)
+
+      topo = Topology("test_CompressedCodecDependencies")
+      codec = CompressedCodec('zlib', codec=test_functions3.JsonCodec())
+      topo.source(test_functions.hello_world).map(test_functions.add17, codec=codec).print()
+      self.assertIn(module, topo.graph.resolver.modules)
+
+  def test_CodecParameters(self):
+      topo = Topology("test_CodecParameters")
+      hw = topo.source(test_functions.hello_world, codec='marshal')
+      hw = hw.isolate()
+      hw.filter(test_functions.filter).isolate().print()
+      params = self._params(topo)
+      self.assertEqual('marshal', params["PyFunctionSource"]["pyOutCodec"]["value"])
+      self.assertNotIn("pyInCodec", params["PyFunctionSource"])
+      self.assertEqual('marshal', params["PyFunctionFilter"]["pyInCodec"]["value"])
+      self.assertEqual('marshal', params["PyFunctionSink"]["pyInCodec"]["value"])
+
+  def test_TopologyDefaultCodec(self):
+      topo = Topology("test_TopologyDefaultCodec", codec='pickle_highest')
+      hw = topo.source(test_functions.hello_world).isolate()
+      hw.map(test_functions.add17, codec='pickle').isolate().print()
+      params = self._params(topo)
+      self.assertEqual('pickle_highest', params["PyFunctionSource"]["pyOutCodec"]["value"])
+      self.assertEqual('pickle_highest', params["PyFunctionTransform"]["pyInCodec"]["value"])
+      self.assertNotIn("pyOutCodec", params["PyFunctionTransform"])
+      self.assertNotIn("pyInCodec", params["PyFunctionSink"])
+      self.assertRaises(ValueError, Topology, "test_BadCodec", codec='nosuchcodec')
+
+  def test_UnionCodecMismatch(self):
+      topo = Topology("test_UnionCodecMismatch")
+      s1 = topo.source(test_functions.hello_world)
+      s2 = topo.source(test_functions.hello_world, codec='marshal')
+      s1.union({s2}).print()
+      self.assertRaises(ValueError, topo.graph.generateSPLGraph)
+
+  def test_PublishReencodes(self):
+      topo = Topology("test_PublishReencodes")
+      hw = topo.source(test_functions.hello_world, codec='marshal')
+      hw.publish("codec/test")
+      params = self._params(topo)
+      self.assertEqual('marshal', params["PyFunctionTransform"]["pyInCodec"]["value"])
+      self.assertNotIn("pyOutCodec", params["PyFunctionTransform"])
+
+  def test_CodecRuntime(self):
+      import marshal
+      from streamsx.topology import runtime
+      f = runtime.pickle_in__pickle_out(test_functions.add17, in_codec='marshal')
+      self.assertEqual(pickle.dumps(20), f(memoryview(marshal.dumps(3))))
+      f = runtime.pickle_in__pickle_out(test_functions.add17, out_codec='marshal')
+      self.assertEqual(marshal.dumps(20), f(memoryview(pickle.dumps(3))))
+      f = runtime.pickle_in__pickle_out(test_functions.add17, in_codec='pickle_highest', out_codec='pickle_highest')
+      self.assertEqual(20, pickle.loads(f(pickle.dumps(3, pickle.HIGHEST_PROTOCOL))))
+
+  @unittest.skipIf(pickle.HIGHEST_PROTOCOL < 5, "pickle protocol 5 requires Python 3.8")
+  def test_PickleOutOfBandCodec(self):
+      from streamsx.topology.codec import _get_codec, _join_frames, _retained_loads
+      codec = _get_codec('pickle5')
+      self.assertEqual(pickle.dumps(12, 5), codec.dumps(12))
+      self.assertEqual(12, codec.loads(memoryview(codec.dumps(12))))
+
+      payload = bytes(range(256)) * 64
+      frames = codec.dumps({'n': 3, 'frame': pickle.PickleBuffer(payload)})
+      self.assertIsInstance(frames, list)
+      self.assertIs(payload, frames[-1].obj)
+      blob = _join_frames(frames)
+      self.assertEqual(0, blob.index(payload) % 8)
+
+      v = codec.loads(memoryview(blob))
+      self.assertEqual(3, v['n'])
+      self.assertIsInstance(v['frame'], memoryview)
+      self.assertIs(blob, v['frame'].obj)
+      self.assertEqual(payload, v['frame'].tobytes())
+      self.assertIsNot(blob, _retained_loads(codec)(memoryview(blob))['frame'].obj)
+
+  def test_IsolateCompression(self):
+      topo = Topology("test_IsolateCompression")
+      hw = topo.source(test_functions.hello_world)
+      hw.print()
+      hw.isolate(compression='zlib', threshold=64).print()
+      params = [op.get("parameters", {}) for op in topo.graph.generateSPLGraph()["operators"]
+                if op["kind"].endswith("::PyFunctionSink")]
+      # Only the stream crossing the boundary is compressed
+      self.assertEqual([None, 'zlib:64:'], sorted([p.get("pyInCodec", {}).get("value") for p in params], key=str))
+      params = self._params(topo)
+      self.assertEqual('zlib:64:', params["PyFunctionTransform"]["pyOutCodec"]["value"])
+      self.assertNotIn("pyOutCodec", params["PyFunctionSource"])
+      self.assertRaises(ValueError, hw.isolate, compression='bzip2')
+
+      # Each isolated stream keeps its own compression
+      topo = Topology("test_IsolateCompressionTwice")
+      hw = topo.source(test_functions.hello_world)
+      hw.isolate(compression='zlib').print()
+      hw.isolate(compression='zlib', threshold=64).print()
+      params = [op.get("parameters", {}) for op in topo.graph.generateSPLGraph()["operators"]
+                if op["kind"].endswith("::PyFunctionSink")]
+      self.assertEqual(['zlib:1024:', 'zlib:64:'], sorted(p["pyInCodec"]["value"] for p in params))
+
+  def test_PublishCompression(self):
+      topo = Topology("test_PublishCompression")
+      hw = topo.source(test_functions.hello_world)
+      hw.publish("codec/test", compression='zlib')
+      params = self._params(topo)
+      self.assertEqual('zlib:1024:', params["PyFunctionTransform"]["pyOutCodec"]["value"])
+      self.assertNotIn("pyOutCodec", params["PyFunctionSource"])
+
+  def test_CompressedCodec(self):
+      from streamsx.topology.codec import CompressedCodec, _get_codec, _codec_param, _join_frames
+      codec = _get_codec(_codec_param(CompressedCodec('zlib', threshold=100)))
+      small = ['a', 'b']
+      large = ['hello world'] * 100
+      self.assertEqual(pickle.dumps(small), codec.dumps(small))
+      compressed = _join_frames(codec.dumps(large))
+      self.assertLess(len(compressed), len(pickle.dumps(large)))
+      self.assertEqual(large, codec.loads(memoryview(compressed)))
+      # default pickle codec decompresses transparently
+      self.assertEqual(large, _get_codec(None).loads(memoryview(compressed)))
+
+      codec = _get_codec(_codec_param(CompressedCodec('zlib', threshold=100, codec='marshal')))
+      self.assertEqual(0, _join_frames(codec.dumps(small))[0])
+      self.assertEqual(1, _join_frames(codec.dumps(large))[0])
+      self.assertEqual(small, codec.loads(_join_frames(codec.dumps(small))))
+      self.assertEqual(large, codec.loads(_join_frames(codec.dumps(large))))
+
+class TestStructuredSchema(unittest.TestCase):
+
+  def test_SchemaAttributes(self):
+      s = schema.StreamSchema('tuple<int64 id, float64 v, map<rstring, int32> m, list<rstring> l>')
+      self.assertEqual([('id', 'int64'), ('v', 'float64'), ('m', 'map<rstring, int32>'), ('l', 'list<rstring>')],
+          s.attributes())
+      self.assertEqual(['__spl_po'], schema.CommonSchema.Python.names())
+      self.assertRaises(ValueError, schema.StreamSchema('com.example::Type').attributes)
+
+  def test_MapToSchema(self):
+      topo = Topology("test_MapToSchema")
+      hw = topo.source(test_functions.hello_world)
+      s = hw.map(test_functions.add17, schema=schema.StreamSchema('tuple<int64 id, float64 v>'))
+      self.assertEqual('tuple<int64 id, float64 v>', s.oport.schema.schema())
+      s.print()
+      ops = {op["kind"].split("::")[-1]: op for op in topo.graph.generateSPLGraph()["operators"]}
+      self.assertEqual('tuple<int64 id, float64 v>', ops["PyFunctionTransform"]["outputs"][0]["type"])
+      self.assertNotIn("pyOutCodec", ops["PyFunctionTransform"].get("parameters"))
+
+  def test_NamedTupleRuntime(self):
+      from streamsx.topology import runtime
+      cls = runtime._spl_tuple_class(['id', 'v'])
+      self.assertIs(cls, runtime._spl_tuple_class(('id', 'v')))
+      t = tuple.__new__(cls, (3, 2.5))
+      self.assertEqual((3, 2.5), t)
+      self.assertEqual(3, t.id)
+      self.assertEqual(2.5, t['v'])
+      self.assertEqual(2.5, t[1])
+      self.assertEqual(['id', 'v'], t.keys())
+      f = runtime.dict_in__pickle_out(test_functions.add17)
+      self.assertEqual(pickle.dumps(20), f(3))
+
+  def test_NamedTuplePickle(self):
+      from streamsx.topology import runtime
+      from streamsx.topology.functions import identity
+      cls = runtime._spl_tuple_class(['id', 'v'])
+      t = tuple.__new__(cls, (3, 2.5))
+      f = runtime.dict_in__pickle_out(identity)
+      v = pickle.loads(f(t))
+      self.assertIs(cls, type(v))
+      self.assertEqual(t, v)
+      self.assertEqual(2.5, v['v'])
+      self.assertEqual(3, v.id)
+
+class TestSourceBatch(unittest.TestCase):
+
+  def test_SourceBatchParameter(self):
+      topo = Topology("test_SourceBatchParameter")
+      topo.source(test_functions.hello_world, batch=64).print()
+      ops = {op["kind"].split("::")[-1]: op for op in topo.graph.generateSPLGraph()["operators"]}
+      self.assertEqual(64, ops["PyFunctionSource"]["parameters"]["batch"]["value"])
+      self.assertRaises(ValueError, topo.source, test_functions.hello_world, batch=0)
+
+  def test_SourceBatchRuntime(self):
+      from streamsx.topology import runtime
+      source = runtime._batchSource(runtime.iterableSource(test_functions.strings_multi_transform), 3)
+      values = []
+      while True:
+          items = source()
+          if items is None:
+              break
+          self.assertIsInstance(items, tuple)
+          self.assertLessEqual(len(items), 3)
+          values.extend(pickle.loads(v) for v in items)
+      self.assertEqual(test_functions.strings_multi_transform(), values)
+
+class TestFlatMapChunks(unittest.TestCase):
+
+  def test_FlatMapChunkSize(self):
+      topo = Topology("test_FlatMapChunkSize")
+      hw = topo.source(test_functions.hello_world)
+      hw.flat_map(test_functions.strings_multi_transform, chunk_size=16).print()
+      ops = {op["kind"].split("::")[-1]: op for op in topo.graph.generateSPLGraph()["operators"]}
+      self.assertEqual(16, ops["PyFunctionMultiTransform"]["parameters"]["chunkSize"]["value"])
+      self.assertRaises(ValueError, hw.flat_map, test_functions.strings_multi_transform, chunk_size=0)
+
+  def test_FusedChunkSize(self):
+      topo = Topology("test_FusedChunkSize")
+      hw = topo.source(test_functions.hello_world)
+      s = hw.flat_map(test_functions.strings_multi_transform, chunk_size=64)
+      s = s.flat_map(test_functions.strings_multi_transform, chunk_size=8)
+      s.map(test_functions.add17).print()
+      ops = {op["kind"].split("::")[-1]: op for op in topo.graph.generateSPLGraph()["operators"]}
+      self.assertEqual(8, ops["PyFunctionPipeline"]["parameters"]["chunkSize"]["value"])
+
+@unittest.skipIf(test_functions_async is None, "async test functions require Python 3.6")
+class TestAsyncSource(unittest.TestCase):
+
+  def _values(self, func):
+      from streamsx.topology import runtime
+      source = runtime.iterableSource(func)
+      values = []
+      while True:
+          v = source()
+          if v is None:
+              return values
+          values.append(pickle.loads(v))
+
+  def test_AsyncGenerator(self):
+      self.assertEqual(test_functions.hello_world(), self._values(test_functions_async.async_hello_world))
+
+  def test_Coroutine(self):
+      self.assertEqual(test_functions.hello_world(), self._values(test_functions_async.coroutine_hello_world))
+
+  def test_SourceException(self):
+      self.assertRaises(ValueError, self._values, test_functions_async.async_failing_source)
+
+  def test_SourceCancelled(self):
+      import asyncio
+      self.assertRaises(asyncio.CancelledError, self._values, test_functions_async.async_cancelled_source)
+
+  def test_AsyncSourceGraph(self):
+      topo = Topology("test_AsyncSourceGraph")
+      topo.source(test_functions_async.async_hello_world).print()
+      kinds = [op["kind"].split("::")[-1] for op in topo.graph.generateSPLGraph()["operators"]]
+      self.assertIn("PyFunctionSource", kinds)
+
+class TestAsyncMap(unittest.TestCase):
+
+  def _run(self, func, max_in_flight, ordered, dumps=pickle.dumps):
+      from streamsx.topology import runtime
+      am = runtime._AsyncMap(runtime._AsyncFunction(func, max_in_flight, ordered), runtime._identity, dumps)
+      values = []
+      for v in range(20):
+          while am.pending >= max_in_flight:
+              values.extend(pickle.loads(v) for v in am.take(1.0))
+          am.add(v)
+      while am.pending:
+          values.extend(pickle.loads(v) for v in am.take(1.0))
+      am.join()
+      return am, values
+
+  @unittest.skipIf(test_functions_async is None, "async test functions require Python 3.6")
+  def test_Ordered(self):
+      expected = [v * v for v in range(20) if v % 3]
+      _, values = self._run(test_functions_async.async_delayed_square, 8, True)
+      self.assertEqual(expected, values)
+
+  @unittest.skipIf(test_functions_async is None, "async test functions require Python 3.6")
+  def test_Unordered(self):
+      expected = [v * v for v in range(20) if v % 3]
+      _, values = self._run(test_functions_async.async_delayed_square, 8, False)
+      self.assertEqual(sorted(expected), sorted(values))
+
+  @unittest.skipIf(test_functions_async is None, "async test functions require Python 3.6")
+  def test_MaxInFlight(self):
+      counter = test_functions_async.AsyncCounter()
+      am, _ = self._run(counter, 4, False, dumps=None)
+      self.assertEqual(list(range(20)), sorted(counter.values))
+      self.assertLessEqual(counter.max_active, 4)
+      self.assertEqual((), am.take(0))
+
+  def test_SlotHeldUntilTaken(self):
+      from streamsx.topology import runtime
+      blocker = test_functions.BlockFirst()
+      am = runtime._AsyncMap(runtime._AsyncFunction(blocker, 2, True, threads=2), runtime._identity, pickle.dumps)
+      am.add(0)
+      am.add(1)
+      timeout = time.time() + 5
+      while 1 not in am.reorder and time.time() < timeout:
+          time.sleep(0.01)
+      # The result of 1 waits for 0 and still holds its slot
+      self.assertEqual((), am.take(0))
+      self.assertFalse(am.slots.acquire(False))
+      blocker.release.set()
+      values = []
+      while len(values) < 2:
+          values.extend(pickle.loads(v) for v in am.take(1.0))
+      self.assertEqual([0, 1], values)
+      am.add(2)
+      self.assertEqual([2], [pickle.loads(v) for v in am.take(5.0)])
+      am.join()
+
+  @unittest.skipIf(test_functions_async is None, "async test functions require Python 3.6")
+  def test_AsyncGraph(self):
+      topo = Topology("test_AsyncGraph")
+      hw = topo.source(test_functions.hello_world)
+      hw.map_async(test_functions_async.async_delayed_square, max_in_flight=4).print()
+      hw.for_each_async(test_functions_async.AsyncCounter())
+      ops = [op for op in topo.graph.generateSPLGraph()["operators"] if op["kind"].endswith("PyFunctionAsync")]
+      self.assertEqual(2, len(ops))
+      self.assertEqual([1, 0], [len(op["outputs"]) for op in ops])
+      self.assertRaises(ValueError, hw.map_async, test_functions_async.async_delayed_square, max_in_flight=0)
+
+class TestThreadedMap(unittest.TestCase):
+
+  def test_ThreadedMapRuntime(self):
+      from streamsx.topology import runtime
+      am = runtime._AsyncMap(runtime._AsyncFunction(test_functions.compress_level9, 4, True, threads=2),
+          runtime._identity, pickle.dumps)
+      inputs = [str(v) for v in range(10)]
+      values = []
+      for v in inputs:
+          while am.pending >= am.max_in_flight:
+              values.extend(pickle.loads(v) for v in am.take(1.0))
+          am.add(v)
+      while am.pending:
+          values.extend(pickle.loads(v) for v in am.take(1.0))
+      am.join()
+      self.assertEqual([test_functions.compress_level9(v) for v in inputs], values)
+
+  def test_ThreadedMapGraph(self):
+      topo = Topology("test_ThreadedMapGraph")
+      hw = topo.source(test_functions.hello_world)
+      hw.map(test_functions.compress_level9, threads=4).print()
+      kinds = [op["kind"].split("::")[-1] for op in topo.graph.generateSPLGraph()["operators"]]
+      self.assertIn("PyFunctionAsync", kinds)
+      self.assertNotIn("PyFunctionTransform", kinds)
+      self.assertRaises(ValueError, hw.map, test_functions.compress_level9, threads=0)
+      self.assertRaises(ValueError, hw.map, test_functions.compress_level9, threads=2,
+          schema=schema.CommonSchema.String)
+
+class TestProcessMap(unittest.TestCase):
+
+  def test_ProcessMapRuntime(self):
+      from streamsx.topology import runtime
+      from streamsx.topology.codec import _get_codec
+      codec = _get_codec(None)
+      am = runtime.pickle_in__pickle_async(
+          runtime._AsyncFunction(test_functions.sum_squares, 4, True, processes=2))
+      inputs = list(range(1000, 1020))
+      values = []
+      for v in inputs:
+          while am.pending >= am.max_in_flight:
+              values.extend(codec.loads(v) for v in am.take(1.0))
+          am.add(memoryview(codec.dumps(v)))
+      while am.pending:
+          values.extend(codec.loads(v) for v in am.take(1.0))
+      am.join()
+      am.executor.shutdown()
+      self.assertEqual([test_functions.sum_squares(v) for v in inputs], values)
+
+  def test_ProcessMapGraph(self):
+      topo = Topology("test_ProcessMapGraph")
+      hw = topo.source(test_functions.hello_world)
+      hw.map(test_functions.sum_squares, processes=4).print()
+      kinds = [op["kind"].split("::")[-1] for op in topo.graph.generateSPLGraph()["operators"]]
+      self.assertIn("PyFunctionAsync", kinds)
+      self.assertRaises(ValueError, hw.map, test_functions.sum_squares, processes=0)
+      self.assertRaises(ValueError, hw.map, test_functions.sum_squares, processes=2, threads=2)
+
+class TestGILMetrics(unittest.TestCase):
+
+  def test_GILMetricsParameter(self):
+      topo = Topology("test_GILMetricsParameter", metrics=['gil'])
+      hw = topo.source(test_functions.hello_world)
+      hw.map(test_functions.add17).isolate().filter(test_functions.filter).print()
+      for op in topo.graph.generateSPLGraph()["operators"]:
+          params = op.get("parameters", {})
+          if op["kind"].startswith("com.ibm.streamsx.topology.functional.python::"):
+              self.assertEqual(True, params["gilMetrics"]["value"])
+          else:
+              self.assertNotIn("gilMetrics", params)
+
+  def test_GILMetricsDisabled(self):
+      topo = Topology("test_GILMetricsDisabled")
+      topo.source(test_functions.hello_world).print()
+      for op in topo.graph.generateSPLGraph()["operators"]:
+          self.assertNotIn("gilMetrics", op.get("parameters", {}))
+      self.assertRaises(ValueError, Topology, "test_GILMetricsUnknown", metrics=['nosuch'])
+
+  def test_GILMetricsRuntime(self):
+      from streamsx.topology import runtime
+      runtime._gil_metrics['op1'] = lambda: {'acquisitions': 2}
+      try:
+          self.assertEqual({'acquisitions': 2}, runtime.gil_metrics()['op1'])
+      finally:
+          del runtime._gil_metrics['op1']
+
+class TestPythonMetrics(unittest.TestCase):
+
+  def test_PythonMetricsParameter(self):
+      topo = Topology("test_PythonMetricsParameter", metrics='python')
+      hw = topo.source(test_functions.hello_world)
+      hw.batch(2).print()
+      ops = {op["kind"].split("::")[-1]: op for op in topo.graph.generateSPLGraph()["operators"]}
+      self.assertEqual(True, ops["PyFunctionSource"]["parameters"]["pythonMetrics"]["value"])
+      self.assertNotIn("pythonMetrics", ops["PyFunctionBatch"]["parameters"])
+      self.assertNotIn("gilMetrics", ops["PyFunctionSource"]["parameters"])
+
+  def test_MeteredMap(self):
+      from streamsx.topology import runtime
+      wf = runtime._metered_wrapper('pickle_in__pickle_out',
+          'com.ibm.streamsx.topology.functional.python::PyFunctionTransform', test_functions.string_to_int_except68)
+      self.assertEqual(93, pickle.loads(wf(pickle.dumps("93"))))
+      self.assertIsNone(wf(pickle.dumps("68")))
+      values = wf._metrics
+      self.assertEqual(2, values[runtime._M_CALLS])
+      self.assertEqual(1, values[runtime._M_DROPPED])
+      self.assertEqual(len(pickle.dumps("93")) + len(pickle.dumps("68")), values[runtime._M_IN_BYTES])
+      self.assertEqual(len(pickle.dumps(93)), values[runtime._M_OUT_BYTES])
+      for m in (runtime._M_CALL_NANOS, runtime._M_LOADS_NANOS, runtime._M_DUMPS_NANOS):
+          self.assertGreater(values[m], 0)
+
+  def test_MeteredFlatMap(self):
+      from streamsx.topology import runtime
+      wf = runtime._metered_wrapper('pickle_in__pickle_iter',
+          'com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform', test_functions.split_words)
+      items = [pickle.loads(v) for v in wf(pickle.dumps("a b c"))]
+      self.assertEqual(["a", "b", "c"], items)
+      self.assertEqual(1, wf._metrics[runtime._M_CALLS])
+      self.assertEqual(sum(len(pickle.dumps(i)) for i in items), wf._metrics[runtime._M_OUT_BYTES])
+
+class TestProfiling(unittest.TestCase):
+
+  def test_ProfileParameters(self):
+      topo = Topology("test_ProfileParameters", profiling=True)
+      hw = topo.source(test_functions.hello_world)
+      hw.batch(2).print()
+      g = topo.graph.generateSPLGraph()
+      self.assertEqual("streamsx.topology.profile",
+          g["parameters"]["__jaa_stv_streamsx_topology_profile"]["value"]["name"])
+      ops = {op["kind"].split("::")[-1]: op for op in g["operators"]}
+      self.assertEqual("submissionParameter", ops["PyFunctionSource"]["parameters"]["pyProfile"]["type"])
+      self.assertNotIn("pyProfile", ops["PyFunctionBatch"]["parameters"])
+
+      g = Topology("test_NoProfile").graph.generateSPLGraph()
+      self.assertNotIn("parameters", g)
+
+  def test_SubmissionRequest(self):
+      from streamsx.topology import runtime
+      with tempfile.TemporaryDirectory() as data_dir:
+          wf = runtime._Profiler(runtime.pickle_in__pickle_out(test_functions.add17),
+              'com.ibm.streamsx.topology.functional.python::PyFunctionTransform',
+              'add17_1', data_dir, 'other, add17_1:tuples=3')
+          for i in range(5):
+              self.assertEqual(i + 17, pickle.loads(wf(pickle.dumps(i))))
+          files = os.listdir(os.path.join(data_dir, 'profile'))
+          self.assertEqual(1, len(files))
+          self.assertTrue(files[0].startswith('add17_1.'))
+          stats = pstats.Stats(os.path.join(data_dir, 'profile', files[0]))
+          self.assertIn('add17', [f[2] for f in stats.stats])
+
+  def test_ControlFile(self):
+      from streamsx.topology import runtime
+      with tempfile.TemporaryDirectory() as data_dir:
+          wf = runtime._Profiler(runtime.pickle_in__pickle_iter(test_functions.split_words),
+              'com.ibm.streamsx.topology.functional.python::PyFunctionMultiTransform',
+              'split_words_2', data_dir, '')
+          self.assertEqual(['a', 'b'], [pickle.loads(v) for v in wf(pickle.dumps('a b'))])
+          self.assertFalse(os.path.exists(wf.dir))
+          os.makedirs(wf.dir)
+          with open(wf.control, 'w') as f:
+              f.write('tuples=2')
+          wf._next_check = 0.0
+          for i in range(2):
+              self.assertEqual(['c', 'd'], [pickle.loads(v) for v in wf(pickle.dumps('c d'))])
+          files = os.listdir(wf.dir)
+          self.assertEqual(1, len(files))
+          self.assertTrue(files[0].endswith('.pstats'))
+          stats = pstats.Stats(os.path.join(wf.dir, files[0]))
+          self.assertIn('split_words', [f[2] for f in stats.stats])
+
+  def test_InvalidRequest(self):
+      from streamsx.topology import runtime
+      self.assertRaises(ValueError, runtime._profile_limit, 'lines=3')
+      self.assertEqual((None, 60.0), runtime._profile_request('*', 'any'))
+      self.assertIsNone(runtime._profile_request('a,b:seconds=5', 'c'))
+      self.assertEqual((None, 5.0), runtime._profile_request('a,b:seconds=5', 'b'))
+
+class TestLocalContext(unittest.TestCase):
+
+  def test_MapFilterSink(self):
+      topo = Topology("test_LocalMapFilterSink")
+      s = topo.source(test_functions.range_source)
+      s = s.map(test_functions.add17).filter(test_functions.is_even)
+      s.sink(test_functions.LocalCollector("mfs"))
+      job = streamsx.topology.context.submit("LOCAL", topo.graph)
+      expected = [t + 17 for t in range(1000) if (t + 17) % 2 == 0]
+      self.assertEqual(expected, test_functions.local_collected("mfs"))
+      metrics = job.metrics()
+      ops = topo.graph.operators
+      self.assertEqual(1000, metrics[ops[0].name]["nTuplesSubmitted"])
+      self.assertEqual(1000, metrics[ops[1].name]["nTuplesProcessed"])
+      self.assertEqual(len(expected), metrics[ops[-1].name]["nTuplesProcessed"])
+      for m in metrics.values():
+          self.assertGreaterEqual(m["tuplesPerSecond"], 0.0)
+
+  @unittest.skipIf(test_functions_async is None, "async test functions require Python 3.6")
+  def test_FlatMapUnionBatchAsync(self):
+      topo = Topology("test_LocalFlatMapUnionBatchAsync", codec='marshal')
+      words = topo.source(test_functions.strings_multi_transform).flat_map(test_functions.split_words)
+      hw = topo.source(test_functions.hello_world)
+      s = words.union({hw}).batch(3).unbatch()
+      s = s.map_async(test_functions_async.async_upper, max_in_flight=4)
+      s.sink(test_functions.LocalCollector("fuba"))
+      streamsx.topology.context.submit("LOCAL", topo.graph)
+      expected = [w.upper() for l in test_functions.strings_multi_transform() for w in l.split()]
+      expected += [w.upper() for w in test_functions.hello_world()]
+      self.assertEqual(sorted(expected), sorted(test_functions.local_collected("fuba")))
+
+  def test_ParallelRoundRobin(self):
+      topo = Topology("test_LocalParallelRoundRobin")
+      s = topo.source(test_functions.range_source).parallel(3)
+      s.sink(test_functions.LocalCollector("prr"))
+      s.map(test_functions.add17).end_parallel().sink(test_functions.LocalCollector("prr_end"))
+      job = streamsx.topology.context.submit("LOCAL", topo.graph)
+      channels = test_functions.local_collected_by_channel("prr")
+      self.assertEqual(3, len(channels))
+      self.assertEqual(set(range(1000)), set.union(*channels.values()))
+      self.assertEqual(set(t + 17 for t in range(1000)), set(test_functions.local_collected("prr_end")))
+      self.assertEqual(3, len([n for n in job.metrics() if n.endswith(']')]) // 2)
+
+  def test_ParallelHash(self):
+      topo = Topology("test_LocalParallelHash")
+      s = topo.source(test_functions.range_source).map(test_functions.mod10)
+      s = s.parallel(4, routing=Routing.HASH_PARTITIONED)
+      s.sink(test_functions.LocalCollector("ph"))
+      streamsx.topology.context.submit("LOCAL", topo.graph)
+      channels = test_functions.local_collected_by_channel("ph")
+      self.assertEqual(1000, len(test_functions.local_collected("ph")))
+      seen = set()
+      for keys in channels.values():
+          self.assertFalse(seen & keys)
+          seen |= keys
+      self.assertEqual(set(range(10)), seen)
+
+  def test_PublishSubscribe(self):
+      sub = Topology("test_LocalSubscribe")
+      sub.subscribe("local/test").sink(test_functions.LocalCollector("sub"))
+      job = streamsx.topology.local.LocalJob(sub.graph).start()
+      try:
+          pub = Topology("test_LocalPublish")
+          s = pub.source(test_functions.hello_world)
+          s.publish("local/test")
+          pub.subscribe("local/test").sink(test_functions.LocalCollector("pub_sub"))
+          streamsx.topology.context.submit("LOCAL", pub.graph)
+          self.assertEqual(test_functions.hello_world(), test_functions.local_collected("pub_sub"))
+          for _ in range(100):
+              if len(test_functions.local_collected("sub")) == len(test_functions.hello_world()):
+                  break
+              time.sleep(0.05)
+          self.assertEqual(test_functions.hello_world(), test_functions.local_collected("sub"))
+          self.assertFalse(job.wait(0))
+      finally:
+          job.cancel()
+      self.assertTrue(job.wait(10))
+
+  def test_StructuredSchema(self):
+      from streamsx.topology import runtime
+      from streamsx.topology.functions import identity
+      topo = Topology("test_LocalStructuredSchema")
+      s = topo.source(test_functions.range_source)
+      s = s.map(test_functions.id_square, schema=schema.StreamSchema('tuple<int64 id, int64 square>'))
+      s.map(test_functions.attr_square).sink(test_functions.LocalCollector("ss"))
+      s.map(identity).sink(test_functions.LocalCollector("ss_identity"))
+      streamsx.topology.context.submit("LOCAL", topo.graph)
+      self.assertEqual([t * t for t in range(1000)], test_functions.local_collected("ss"))
+      values = test_functions.local_collected("ss_identity")
+      self.assertEqual([(t, t * t) for t in range(1000)], values)
+      self.assertIs(runtime._spl_tuple_class(['id', 'square']), type(values[0]))
+
+  def test_Exception(self):
+      topo = Topology("test_LocalException")
+      topo.source(test_functions.range_source).map(test_functions.fail_on_5).print()
+      self.assertRaises(ValueError, streamsx.topology.context.submit, "LOCAL", topo.graph)
+
+class TestLocalProcesses(unittest.TestCase):
+
+  def setUp(self):
+      self.dir = tempfile.TemporaryDirectory()
+      self.addCleanup(self.dir.cleanup)
+      self.config = {'local.processes': True, 'local.timeout': 60}
+
+  def test_ParallelRoundRobin(self):
+      path = os.path.join(self.dir.name, 'prr')
+      topo = Topology("test_ProcessesParallelRoundRobin")
+      s = topo.source(test_functions.range_source).parallel(3)
+      s = s.map(test_functions.add17).end_parallel()
+      s.sink(test_functions.FileCollector(path))
+      job = streamsx.topology.context.submit("LOCAL", topo.graph, self.config)
+      collected = test_functions.file_collected(path)
+      self.assertEqual(1, len(collected))
+      self.assertEqual(sorted(t + 17 for t in range(1000)), sorted(list(collected.values())[0]))
+      metrics = job.metrics()
+      channels = [m for n, m in metrics.items() if n.endswith(']')]
+      self.assertEqual(3, len(channels))
+      self.assertEqual(1000, sum(m['nTuplesProcessed'] for m in channels))
+      pids = set(m['pid'] for m in channels)
+      self.assertEqual(3, len(pids))
+      self.assertNotIn(os.getpid(), pids)
+      self.assertEqual(5, len(set(m['pid'] for m in metrics.values())))
+
+  def test_ParallelHash(self):
+      path = os.path.join(self.dir.name, 'ph')
+      topo = Topology("test_ProcessesParallelHash")
+      s = topo.source(test_functions.range_source).map(test_functions.mod10)
+      s = s.parallel(4, routing=Routing.HASH_PARTITIONED)
+      s.sink(test_functions.FileCollector(path))
+      streamsx.topology.context.submit("LOCAL", topo.graph, self.config)
+      collected = test_functions.file_collected(path)
+      self.assertEqual(1000, sum(len(v) for v in collected.values()))
+      seen = set()
+      for values in collected.values():
+          keys = set(values)
+          self.assertFalse(seen & keys)
+          seen |= keys
+      self.assertEqual(set(range(10)), seen)
+
+  def test_StructuredSchema(self):
+      from streamsx.topology.functions import identity
+      path = os.path.join(self.dir.name, 'ss')
+      topo = Topology("test_ProcessesStructuredSchema")
+      s = topo.source(test_functions.range_source)
+      s = s.map(test_functions.id_square, schema=schema.StreamSchema('tuple<int64 id, int64 square>'))
+      # Tuples are pickled by an identity map to cross the isolate boundary
+      s = s.map(identity).isolate()
+      s.map(test_functions.attr_square).sink(test_functions.FileCollector(path))
+      streamsx.topology.context.submit("LOCAL", topo.graph, self.config)
+      collected = test_functions.file_collected(path)
+      self.assertEqual([[t * t for t in range(1000)]], list(collected.values()))
+
+  def test_Exception(self):
+      topo = Topology("test_ProcessesException")
+      s = topo.source(test_functions.range_source).isolate()
+      s.map(test_functions.fail_on_5).print()
+      self.assertRaises(ValueError, streamsx.topology.context.submit, "LOCAL", topo.graph, self.config)
+
+  def test_Ring(self):
+      import multiprocessing, threading
+      from streamsx.topology import local
+      ring = local._Ring(multiprocessing.get_context('fork'), 64)
+      cancelled = threading.Event()
+      values = []
+      for i in range(20):
+          ring.write(b'abcdefghij' * (i % 3), cancelled)
+          ring.write({'i': i}, cancelled)
+          values.extend(ring.read(cancelled))
+      ring.write(local._FINAL, cancelled)
+      self.assertEqual([local._FINAL], ring.read(cancelled))
+      expected = []
+      for i in range(20):
+          expected.extend([b'abcdefghij' * (i % 3), {'i': i}])
+      self.assertEqual(expected, values)
+      self.assertRaises(ValueError, ring.write, b'x' * 64, cancelled)
+
+class TestSubmitServer(unittest.TestCase):
+
+  def setUp(self):
+      import socket
+      self.server = socket.socket()
+      self.server.bind(('127.0.0.1', 0))
+      self.server.listen(1)
+      self.addCleanup(self.server.close)
+      self.requests = []
+
+  def _serve(self, response):
+      conn, _ = self.server.accept()
+      with conn, conn.makefile('rb') as f:
+          header = [f.readline().decode('utf-8').rstrip('\n') for i in range(3)]
+          graph = f.read(int(header[2]))
+          self.requests.append((header, graph))
+          conn.sendall(response)
+
+  def _submit(self, topo, port, serve=True, response=b'out building\nerr warning\nrc 0\n'):
+      import io, threading
+      from unittest import mock
+      from streamsx.topology import context
+      calls = []
+      server = context._SubmitServer(port, 'tok')
+      out = io.StringIO()
+      with mock.patch.object(context, '_submit_server', server), \
+           mock.patch.object(context, '_submitUsingJava', lambda ctxtype, fn: calls.append(ctxtype)), \
+           mock.patch('sys.stdout', out):
+          if serve:
+              t = threading.Thread(target=self._serve, args=(response,))
+              t.daemon = True
+              t.start()
+          self.assertIsNone(context.submit("STANDALONE", topo.graph))
+          self.remaining = context._submit_server
+      return calls, out.getvalue()
+
+  def test_SubmitUsingServer(self):
+      import json
+      topo = Topology("test_SubmitServer")
+      topo.source(test_functions.hello_world).print()
+      calls, out = self._submit(topo, self.server.getsockname()[1])
+      self.assertEqual([], calls)
+      self.assertEqual('building\n', out)
+      self.assertIsNotNone(self.remaining)
+      self.assertEqual(1, len(self.requests))
+      header, graph = self.requests[0]
+      self.assertEqual(['tok', 'STANDALONE'], header[:2])
+      self.assertEqual('test_SubmitServer', json.loads(graph.decode('utf-8'))['graph']['name'])
+
+  def test_SubmitFailed(self):
+      topo = Topology("test_SubmitServerFailed")
+      topo.source(test_functions.hello_world).print()
+      self.assertRaises(RuntimeError, self._submit, topo, self.server.getsockname()[1],
+          response=b'err failed\nrc 1\n')
+
+  def test_FallbackToJava(self):
+      import socket
+      from streamsx.topology import context
+      s = socket.socket()
+      s.bind(('127.0.0.1', 0))
+      port = s.getsockname()[1]
+      s.close()
+      topo = Topology("test_SubmitServerFallback")
+      topo.source(test_functions.hello_world).print()
+      calls, out = self._submit(topo, port, serve=False)
+      self.assertEqual(['STANDALONE'], calls)
+      self.assertIsNone(self.remaining)
+
+class TestToolkitContext(unittest.TestCase):
+
+  def setUp(self):
+      self.dir = tempfile.TemporaryDirectory()
+      self.addCleanup(self.dir.cleanup)
+
+  def _spl(self, topo):
+      tk = streamsx.topology.context.submit("TOOLKIT", topo.graph, {'topology.toolkitDir': self.dir.name})
+      self.assertEqual(os.path.abspath(self.dir.name), tk)
+      self.assertTrue(os.path.isfile(os.path.join(tk, topo.name, topo.name + '.json')))
+      self.assertTrue(os.path.isfile(os.path.join(tk, 'opt', 'python', 'modules', 'test_functions.py')))
+      with open(os.path.join(tk, topo.name, topo.name + '.spl')) as f:
+          return f.read()
+
+  def test_Toolkit(self):
+      topo = Topology("test_Toolkit")
+      s = topo.source(test_functions.hello_world).map(test_functions.add17)
+      s.isolate().publish('toolkit_topic')
+      spl = self._spl(topo)
+      self.assertTrue(spl.startswith('namespace test_Toolkit;\npublic composite test_Toolkit\n{\ngraph\n'))
+      self.assertIn('= com.ibm.streamsx.topology.functional.python::PyFunctionSource()', spl)
+      self.assertIn('pyName: "hello_world";', spl)
+      self.assertIn('toolkitDir: getThisToolkitDir();', spl)
+      self.assertIn('topic: "toolkit_topic";', spl)
+      self.assertIn('partitionColocation("__jaa_isolateId0")', spl)
+      self.assertIn('partitionColocation("__jaa_isolateId1")', spl)
+      self.assertNotIn('$Isolate$', spl)
+
+  def test_Parallel(self):
+      topo = Topology("test_ToolkitParallel", profiling=True)
+      s = topo.source(test_functions.hello_world).parallel(3).map(test_functions.add17).end_parallel()
+      s = s.parallel(2, routing=Routing.HASH_PARTITIONED).map(test_functions.add17).end_parallel()
+      s.print()
+      spl = self._spl(topo)
+      self.assertIn('composite __parallel_Composite_0(input parallelInput; output parallelOutput)', spl)
+      self.assertIn('composite __parallel_Composite_1(input parallelInput; output parallelOutput)', spl)
+      self.assertIn('@parallel(width=3)\n', spl)
+      self.assertIn(', attributes=[__spl_hash]}])\n', spl)
+      self.assertIn('expression<rstring> $__jaa_stv_streamsx_topology_profile;', spl)
+      self.assertIn('getSubmissionTimeValue("streamsx.topology.profile", "")', spl)
+      self.assertIn('__jaa_stv_streamsx_topology_profile: $__jaa_stv_streamsx_topology_profile;', spl)
+
+  def test_InvalidIsolate(self):
+      topo = Topology("test_ToolkitInvalidIsolate")
+      topo.source(test_functions.hello_world).isolate().isolate().print()
+      self.assertRaises(ValueError, streamsx.topology.context.submit, "TOOLKIT", topo.graph,
+          {'topology.toolkitDir': self.dir.name})
+
+  def test_SPLNames(self):
+      from streamsx.topology import toolkit
+      self.assertEqual('abc_1', toolkit._spl_compatible_name('abc_1'))
+      self.assertEqual('a__b_u002e_u00e9', toolkit._spl_compatible_name('a_b.\u00e9'))
+      self.assertEqual('"a\\\\b\\n\\""', toolkit._string_literal('a\\b\n"'))
+
+class TestBundleCache(unittest.TestCase):
+
+  def setUp(self):
+      self.dir = tempfile.TemporaryDirectory()
+      self.addCleanup(self.dir.cleanup)
+      self.cache_dir = os.path.join(self.dir.name, 'cache')
+      cwd = os.getcwd()
+      os.chdir(self.dir.name)
+      self.addCleanup(os.chdir, cwd)
+
+  def _topology(self):
+      topo = Topology("test_BundleCache")
+      topo.source(test_functions.hello_world).map(test_functions.add17).print()
+      return topo
+
+  def _submit(self, topo):
+      from unittest import mock
+      from streamsx.topology import context
+      calls = []
+      def compile(ctxtype, fj):
+          calls.append(ctxtype)
+          with open(context._localBundle(fj), 'wb') as f:
+              f.write(b'bundle' * 10)
+      config = {'topology.bundleCache': self.cache_dir}
+      with mock.patch.object(context, '_submitJSON', compile):
+          context.submit("BUNDLE", topo.graph, config)
+      return calls
+
+  def test_Hit(self):
+      self.assertEqual(['BUNDLE'], self._submit(self._topology()))
+      self.assertEqual(1, len(os.listdir(self.cache_dir)))
+      bundle = os.path.join(self.dir.name, 'test_BundleCache.test_BundleCache.sab')
+      os.remove(bundle)
+      self.assertEqual([], self._submit(self._topology()))
+      with open(bundle, 'rb') as f:
+          self.assertEqual(b'bundle' * 10, f.read())
+
+  def test_Fingerprint(self):
+      from streamsx.topology import cache
+      module = os.path.join(self.dir.name, 'module.py')
+      with open(module, 'w') as f:
+          f.write('x = 1\n')
+      fj = {'deploy': {'topology.bundleCache': 'a'},
+          'graph': {'name': 'g', 'config': {'includes': [{'source': module, 'target': 'opt/python/modules'}]}}}
+      key = cache.fingerprint('BUNDLE', fj)
+      fj['deploy']['topology.bundleCache'] = 'b'
+      self.assertEqual(key, cache.fingerprint('BUNDLE', fj))
+      self.assertNotEqual(key, cache.fingerprint('STANDALONE', fj))
+      with open(module, 'w') as f:
+          f.write('x = 2\n')
+      self.assertNotEqual(key, cache.fingerprint('BUNDLE', fj))
+
+  def test_Eviction(self):
+      from streamsx.topology import cache
+      bc = cache.BundleCache(self.cache_dir, max_size=250)
+      src = os.path.join(self.dir.name, 'b.sab')
+      with open(src, 'wb') as f:
+          f.write(b'x' * 100)
+      now = time.time()
+      for i, key in enumerate(['a', 'b']):
+          os.utime(bc.put(key, src), (now - 100 + i, now - 100 + i))
+      self.assertIsNotNone(bc.get('a'))
+      bc.put('c', src)
+      self.assertIsNone(bc.get('b'))
+      self.assertIsNotNone(bc.get('a'))
+      self.assertIsNotNone(bc.get('c'))
+
+class TestSubmitAsync(unittest.TestCase):
+
+  def test_Lines(self):
+      from streamsx.topology import context
+      codes = []
+      s = context.Submission([sys.executable, '-c', 'import sys; print("a"); print("b", file=sys.stderr); sys.exit(3)'],
+          codes.append)
+      self.assertEqual(['a', 'b'], list(s))
+      self.assertEqual(3, s.result(30))
+      self.assertTrue(s.done())
+      self.assertEqual([3], codes)
+      self.assertFalse(s.cancel())
+
+  def test_Cancel(self):
+      import concurrent.futures
+      from streamsx.topology import context
+      codes = []
+      s = context.Submission([sys.executable, '-c', 'import time; print("started", flush=True); time.sleep(60)'],
+          codes.append)
+      lines = iter(s)
+      self.assertEqual('started', next(lines))
+      self.assertFalse(s.done())
+      self.assertRaises(concurrent.futures.TimeoutError, s.result, 0.1)
+      self.assertTrue(s.cancel())
+      self.assertRaises(concurrent.futures.CancelledError, s.result, 30)
+      self.assertEqual([], list(lines))
+      for i in range(100):
+          if codes:
+              break
+          time.sleep(0.1)
+      self.assertEqual([None], codes)
+
+  def test_Concurrent(self):
+      from streamsx.topology import context
+      subs = [context.Submission([sys.executable, '-c', 'print(%d)' % i]) for i in range(10)]
+      self.assertEqual([[str(i)] for i in range(10)], [list(s) for s in subs])
+      self.assertEqual([0] * 10, [s.result(30) for s in subs])
+
+  def test_CachedBundle(self):
+      from streamsx.topology import context, cache
+      topo = Topology("test_SubmitAsyncCached")
+      topo.source(test_functions.hello_world).print()
+      with tempfile.TemporaryDirectory() as d:
+          cwd = os.getcwd()
+          os.chdir(d)
+          try:
+              config = {'topology.bundleCache': os.path.join(d, 'cache')}
+              src = os.path.join(d, 'src.sab')
+              with open(src, 'wb') as f:
+                  f.write(b'sab')
+              fj = context._createFullJSON(topo.graph, config)
+              cache.from_config(config).put(cache.fingerprint('BUNDLE', fj), src)
+              s = context.submit_async("BUNDLE", topo.graph, config)
+              self.assertEqual(0, s.result(30))
+              self.assertEqual([], list(s))
+              self.assertTrue(os.path.isfile('test_SubmitAsyncCached.test_SubmitAsyncCached.sab'))
+          finally:
+              os.chdir(cwd)
+
+  def test_Unsupported(self):
+      topo = Topology("test_SubmitAsyncUnsupported")
+      topo.source(test_functions.hello_world).print()
+      self.assertRaises(ValueError, streamsx.topology.context.submit_async, "LOCAL", topo.graph)
+
+class TestDependencyResolution(unittest.TestCase):
+
+  def test_Lazy(self):
+      from unittest import mock
+      from streamsx.topology import dependency
+      with mock.patch.object(dependency, '_get_imported_modules', wraps=dependency._get_imported_modules) as gim:
+          topo = Topology("test_DependencyLazy")
+          s = topo.source(test_functions.hello_world)
+          for i in range(20):
+              s = s.map(test_functions.add17)
+          self.assertEqual(0, gim.call_count)
+          self.assertIn(os.path.abspath(test_functions.__file__), topo.graph.resolver.modules)
+
+  def test_Memo(self):
+      from unittest import mock
+      from streamsx.topology import dependency
+      dependency._dependency_closure(test_functions)
+      with mock.patch.object(dependency, '_get_imported_modules', wraps=dependency._get_imported_modules) as gim:
+          topo = Topology("test_DependencyMemo")
+          topo.source(test_functions.hello_world).print()
+          self.assertIn(os.path.abspath(test_functions.__file__), topo.graph.resolver.modules)
+          self.assertEqual(0, gim.call_count)
+
+  def test_Invalidation(self):
+      import importlib.util
+      from streamsx.topology import dependency
+      with tempfile.TemporaryDirectory() as d:
+          path = os.path.join(d, 'dep_invalidation.py')
+          with open(path, 'w') as f:
+              f.write('x = 1\n')
+          spec = importlib.util.spec_from_file_location('dep_invalidation', path)
+          module = importlib.util.module_from_spec(spec)
+          spec.loader.exec_module(module)
+          self.assertEqual([module], dependency._dependency_closure(module))
+
+          module.test_functions = test_functions
+          self.assertEqual([module], dependency._dependency_closure(module))
+          st = os.stat(path)
+          os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+          self.assertEqual([module, test_functions], dependency._dependency_closure(module)[:2])
+
+class TestBinarySchema(unittest.TestCase):
+
+  def test_BinaryStreams(self):
+      topo = Topology("test_BinaryStreams")
+      hw = topo.source(test_functions.hello_world)
+      b = hw.map(test_functions.add17, schema=schema.CommonSchema.Binary)
+      b.publish("binary/test", schema=schema.CommonSchema.Binary)
+      sb = topo.subscribe("binary/test", schema=schema.CommonSchema.Binary)
+      sb.map(test_functions.add17).print()
+      hw.publish("binary/test2", schema=schema.CommonSchema.Binary)
+      kinds = [op["kind"].split("::")[-1] for op in topo.graph.generateSPLGraph()["operators"]]
+      self.assertEqual(3, kinds.count("PyFunctionTransform"))
+      self.assertEqual(2, kinds.count("Publish"))
+
+  def test_BinaryRuntime(self):
+      from streamsx.topology import runtime
+      from streamsx.topology.codec import _join_frames
+      data = b'\x00\x01binary'
+      seen = []
+      f = runtime.binary_in__pickle_out(seen.append)
+      self.assertIsNone(f(memoryview(data)))
+      self.assertIsInstance(seen[0], memoryview)
+      self.assertIs(data, seen[0].obj)
+
+      f = runtime.binary_in__binary_out(bytearray)
+      self.assertEqual(data, _join_frames(f(memoryview(data))))
+      f = runtime.pickle_in__binary_out(bytes)
+      self.assertEqual(data, f(pickle.dumps(data)))
+      batch = runtime.binary_in__pickle_batch(1)
+      self.assertEqual([data], pickle.loads(batch.add(memoryview(data))))
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestColumnar(unittest.TestCase):
+
+  def test_ColumnarStream(self):
+      topo = Topology("test_ColumnarStream")
+      cs = topo.columnar_source(test_functions.columnar_table, size=4)
+      self.assertTrue(cs._columnar())
+      fs = cs.filter(test_functions.columnar_positive)
+      self.assertTrue(fs._columnar())
+      self.assertTrue(fs.map(test_functions.add17)._columnar())
+      self.assertFalse(fs.map(test_functions.add17, codec='pickle')._columnar())
+      self.assertEqual("com.ibm.streamsx.topology.functional.python::PyFunctionTransform", fs.oport.operator.kind)
+
+  def test_ColumnarRuntime(self):
+      from streamsx.topology import runtime
+      from streamsx.topology.codec import _join_frames
+      source = runtime.iterableSource(runtime._ColumnarSource(test_functions.columnar_table, 4), out_codec='columnar')
+      batches = list(filter(None, iter(source, None)))
+      self.assertEqual(3, len(batches))
+
+      f = runtime.pickle_in__pickle_out(runtime._ColumnarFilter(test_functions.columnar_positive),
+          in_codec='columnar', out_codec='columnar')
+      self.assertIsNone(f(memoryview(_join_frames(batches[0]))))
+      out = f(memoryview(_join_frames(batches[1])))
+      from streamsx.topology.codec import ColumnarCodec
+      batch = ColumnarCodec().loads(_join_frames(out))
+      self.assertEqual([1, 2], list(batch['x']))
+      self.assertEqual(2, len(batch['y']))
+
+  def test_ColumnarCodecRecordArray(self):
+      from streamsx.topology.codec import ColumnarCodec, _join_frames
+      codec = ColumnarCodec()
+      r = numpy.rec.fromarrays([numpy.arange(3), numpy.array([1.5, 2.0, 3.0])], names='a,b')
+      batch = codec.loads(memoryview(_join_frames(codec.dumps(r))))
+      self.assertEqual(['a', 'b'], list(batch))
+      self.assertEqual(r['b'].tolist(), batch['b'].tolist())
+      self.assertRaises(ValueError, codec.dumps, {'a': numpy.arange(2), 'b': numpy.arange(3)})
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,6 +1,7 @@
 # Licensed Materials - Property of IBM
 # Copyright IBM Corp. 2016
 import sys
+import threading
 
 
 def hello() :
@@ -304,3 +305,89 @@ class TestPublish:
         return '%s(**%r)' % (self.__class__.__name__, self.__dict__)          
     def print_message(self):
         print(self.idMsg)
+
+def columnar_table():
+    import numpy
+    return {'x': numpy.arange(-5, 5), 'y': numpy.linspace(0.0, 1.0, 10)}
+
+def columnar_positive(batch):
+    return batch['x'] > 0
+
+class BlockFirst:
+    """
+    Map whose call for 0 blocks until released.
+    """
+    def __init__(self):
+        self.release = threading.Event()
+    def __call__(self, v):
+        if v == 0:
+            self.release.wait(5)
+        return v
+
+def compress_level9(v):
+    import zlib
+    return zlib.compress(v.encode('utf-8') * 1000, 9)
+
+def sum_squares(n):
+    return sum(i * i for i in range(n))
+
+# Tuples received by LocalCollector sinks keyed by name, each
+# channel of a parallel region has its own instance so the
+# instance's id is recorded with the tuple.
+_local_collected = {}
+_local_lock = threading.Lock()
+
+class LocalCollector:
+    def __init__(self, name):
+        self.name = name
+        _local_collected[name] = []
+    def __call__(self, t):
+        with _local_lock:
+            _local_collected[self.name].append((id(self), t))
+
+def local_collected(name):
+    return [t for _, t in _local_collected[name]]
+
+def local_collected_by_channel(name):
+    channels = {}
+    for c, t in _local_collected[name]:
+        channels.setdefault(c, set()).add(t)
+    return channels
+
+def range_source():
+    return range(1000)
+
+def fail_on_5(t):
+    if t == 5:
+        raise ValueError("failed on 5")
+    return t
+
+def is_even(t):
+    return t % 2 == 0
+
+def mod10(t):
+    return t % 10
+
+def id_square(t):
+    return (t, t * t)
+
+def attr_square(t):
+    return t['square']
+
+# Sink writing each tuple as a line to a file per process,
+# for sinks run in PE processes by the LOCAL context.
+class FileCollector:
+    def __init__(self, path):
+        self.path = path
+    def __call__(self, t):
+        import os
+        with open(self.path + '.' + str(os.getpid()), 'a') as f:
+            f.write(repr(t) + '\n')
+
+def file_collected(path):
+    import ast, glob
+    collected = {}
+    for fn in glob.glob(path + '.*'):
+        with open(fn) as f:
+            collected[fn] = [ast.literal_eval(l) for l in f]
+    return collected
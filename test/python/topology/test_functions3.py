@@ -0,0 +1,14 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+import json
+
+class JsonCodec(object):
+    """
+    Codec defined in an application module,
+    serializing values as JSON.
+    """
+    def dumps(self, obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, buffer):
+        return json.loads(bytes(buffer).decode('utf-8'))
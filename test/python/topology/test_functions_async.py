@@ -0,0 +1,47 @@
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2016
+#
+# Asynchronous functions used by the tests, async generators
+# require Python 3.6 so this module is only imported from 3.6.
+from test_functions import hello_world
+
+async def async_hello_world():
+    import asyncio
+    for s in hello_world():
+        await asyncio.sleep(0)
+        yield s
+
+async def coroutine_hello_world():
+    import asyncio
+    await asyncio.sleep(0)
+    return hello_world()
+
+async def async_failing_source():
+    yield "Hello"
+    raise ValueError("source failed")
+
+async def async_cancelled_source():
+    import asyncio
+    yield "Hello"
+    raise asyncio.CancelledError()
+
+async def async_delayed_square(v):
+    import asyncio
+    await asyncio.sleep(0.001 * (5 - v % 5))
+    return v * v if v % 3 else None
+
+class AsyncCounter:
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.values = []
+    async def __call__(self, v):
+        import asyncio
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.001)
+        self.active -= 1
+        self.values.append(v)
+
+async def async_upper(t):
+    return t.upper()